@@ -0,0 +1,336 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+import cache
+import metrics
+from db_executor import db_executor
+
+# Скорость пополнения (токенов в секунду) и ёмкость корзины одного клиента; 0 — без ограничения
+RATE_LIMIT = float(os.environ.get("MUSIC_CATALOG_RATE_LIMIT", "50"))
+RATE_BURST = float(os.environ.get("MUSIC_CATALOG_RATE_BURST", "200"))
+# Общая корзина на все запросы всех клиентов; по умолчанию выключена — предел зависит от железа
+GLOBAL_RATE_LIMIT = float(os.environ.get("MUSIC_CATALOG_GLOBAL_RATE_LIMIT", "0"))
+GLOBAL_RATE_BURST = float(os.environ.get("MUSIC_CATALOG_GLOBAL_RATE_BURST", str(GLOBAL_RATE_LIMIT * 2)))
+# Хранить корзины в Redis (MUSIC_CATALOG_REDIS_URL), чтобы лимит был общим для всех воркеров.
+# По умолчанию выключено: каждый воркер считает лимиты сам
+RATE_LIMIT_REDIS = os.environ.get("MUSIC_CATALOG_RATE_LIMIT_REDIS", "0") == "1"
+# Брать адрес клиента из X-Forwarded-For (только за доверенным обратным прокси)
+TRUST_FORWARDED = os.environ.get("MUSIC_CATALOG_TRUST_FORWARDED", "0") == "1"
+# Сколько корзин клиентов держать в памяти процесса
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get("MUSIC_CATALOG_RATE_LIMIT_MAX_CLIENTS", "100000"))
+# Если задача ждёт в очереди пула БД дольше этого (мс), дорогие запросы отклоняются; 0 — не отклонять
+SHED_QUEUE_WAIT_MS = float(os.environ.get("MUSIC_CATALOG_SHED_QUEUE_WAIT_MS", "500"))
+
+RATE_LIMIT_KEY = cache.CACHE_PREFIX + "ratelimit:"
+
+
+class EndpointClass:
+    """
+    Класс эндпоинтов: cost — сколько токенов корзины стоит запрос (стоимости
+    подобраны так, чтобы обычная работа одного пользователя не упиралась в лимит:
+    дорогие запросы сдерживает прежде всего предел одновременных запросов),
+    concurrency — сколько таких запросов процесс выполняет одновременно (0 — без ограничения),
+    shed — отклонять ли их, когда очередь пула БД перегружена.
+    """
+
+    def __init__(self, cost, concurrency, shed):
+        self.cost = cost
+        self.concurrency = concurrency
+        self.shed = shed
+
+
+ENDPOINT_CLASSES = {
+    "read": EndpointClass(1, 0, False),
+    "write": EndpointClass(1, 0, False),
+    "search": EndpointClass(1, 32, True),
+    # Поиск с пустым запросом перебирает весь каталог
+    "browse": EndpointClass(2, 4, True),
+    "bulk": EndpointClass(3, 2, True),
+    "export": EndpointClass(3, 2, True),
+    "admin": EndpointClass(3, 1, True),
+    # Потоки изменений живут долго: ограничиваем число, но не стоимость
+    "stream": EndpointClass(1, 200, False),
+}
+
+# (метод или None — любой, начало пути, класс или None — без ограничений); выигрывает первое совпадение
+ENDPOINT_RULES = (
+    (None, "/metrics", None),
+    (None, "/internal/", None),
+    ("GET", "/changes/stream", "stream"),
+    ("DELETE", "/clear", "admin"),
+    ("POST", "/backups", "admin"),
+    ("POST", "/songs/bulk", "bulk"),
+    ("GET", "/export/jobs/", "read"),
+    (None, "/export/", "export"),
+    ("GET", "/search", "search"),
+    ("GET", "", "read"),
+    (None, "", "write"),
+)
+
+
+def _apply_overrides():
+    """
+    Переопределение пределов одновременных запросов:
+    MUSIC_CATALOG_CONCURRENCY_LIMITS="export=4,search=64".
+    """
+    value = os.environ.get("MUSIC_CATALOG_CONCURRENCY_LIMITS", "")
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, limit = item.partition("=")
+        endpoint_class = ENDPOINT_CLASSES.get(name.strip())
+        try:
+            endpoint_class.concurrency = int(limit)
+        except (AttributeError, ValueError):
+            print(f"Некорректный предел одновременных запросов '{item}', пропущен")
+
+
+_apply_overrides()
+
+rejected_requests = metrics.register(metrics.Counter(
+    "admission_rejected_total", "Запросов, отклонённых контролем допуска", ("endpoint_class", "reason")
+))
+
+
+def classify(method, path, query_string=b""):
+    """Класс эндпоинта для запроса или None, если запрос не ограничивается."""
+    for rule_method, prefix, name in ENDPOINT_RULES:
+        if (rule_method is None or rule_method == method) and path.startswith(prefix):
+            if name == "search" and path == "/search":
+                query = parse_qs(query_string.decode("latin-1")).get("query", [""])[0]
+                if not query.strip():
+                    return "browse"
+            return name
+    return None
+
+
+def client_key(scope):
+    """Адрес клиента: из X-Forwarded-For за доверенным прокси, иначе адрес соединения."""
+    if TRUST_FORWARDED:
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class LocalBuckets:
+    """Корзины токенов в памяти процесса; давно не использованные вытесняются (LRU)."""
+
+    def __init__(self, max_entries=RATE_LIMIT_MAX_CLIENTS):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost):
+        """Списывает cost токенов; возвращает 0 или через сколько секунд их хватит."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0.0
+            else:
+                retry_after = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+# Корзина в хэше Redis: пополнение по времени сервера Redis, списание атомарно
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов корзинами токенов: своя корзина у каждого клиента
+    и (если задана) общая. С Redis корзины общие для всех воркеров; при
+    недоступности Redis лимиты временно считаются в памяти каждого процесса.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, global_rate=GLOBAL_RATE_LIMIT,
+                 global_burst=GLOBAL_RATE_BURST, use_redis=RATE_LIMIT_REDIS):
+        self.rate = rate
+        self.burst = burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.local = LocalBuckets()
+        self._use_redis = use_redis
+        self._script = None
+        self._redis_failed_at = None
+
+    def _redis_script(self):
+        if not self._use_redis or not cache.REDIS_URL:
+            return None
+        if self._redis_failed_at is not None:
+            if time.monotonic() - self._redis_failed_at < cache.REDIS_RETRY_INTERVAL:
+                return None
+            self._redis_failed_at = None
+        if self._script is None:
+            try:
+                import redis.asyncio
+            except ImportError:  # redis необязателен: без него лимиты считаются в процессе
+                self._use_redis = False
+                return None
+            client = redis.asyncio.Redis.from_url(
+                cache.REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.2
+            )
+            self._script = client.register_script(_TAKE_SCRIPT)
+        return self._script
+
+    async def _take(self, key, rate, burst, cost):
+        # Запрос дороже ёмкости корзины всё равно должен когда-нибудь пройти
+        cost = min(cost, burst)
+        script = self._redis_script()
+        if script is not None:
+            try:
+                return float(await script(keys=[RATE_LIMIT_KEY + key], args=[rate, burst, cost]))
+            except Exception as e:
+                if self._redis_failed_at is None:
+                    print(f"Redis недоступен, лимиты запросов считаются в процессе: {e}")
+                self._redis_failed_at = time.monotonic()
+        return self.local.take(key, rate, burst, cost)
+
+    def backend(self):
+        """Где сейчас считаются лимиты: redis или local."""
+        return "redis" if self._script is not None and self._redis_failed_at is None else "local"
+
+    async def check(self, client, cost):
+        """0, если запрос укладывается в лимиты, иначе через сколько секунд повторить."""
+        if self.rate > 0:
+            retry_after = await self._take("client:" + client, self.rate, self.burst, cost)
+            if retry_after:
+                return retry_after
+        if self.global_rate > 0:
+            return await self._take("global", self.global_rate, self.global_burst, cost)
+        return 0.0
+
+
+class ConcurrencyLimits:
+    """
+    Счётчики одновременно выполняемых запросов по классам эндпоинтов.
+    Запрос сверх предела не ждёт, а сразу отклоняется.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {name: 0 for name in ENDPOINT_CLASSES}
+
+    def acquire(self, name):
+        limit = ENDPOINT_CLASSES[name].concurrency
+        with self._lock:
+            if limit and self._active[name] >= limit:
+                return False
+            self._active[name] += 1
+            return True
+
+    def release(self, name):
+        with self._lock:
+            self._active[name] -= 1
+
+    def active(self):
+        with self._lock:
+            return dict(self._active)
+
+
+def overloaded():
+    """Перегружена ли очередь пула БД настолько, что дорогие запросы нужно отклонять."""
+    return SHED_QUEUE_WAIT_MS > 0 and db_executor.queue_wait() * 1000 > SHED_QUEUE_WAIT_MS
+
+
+def _reject(status_code, detail, retry_after):
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class AdmissionMiddleware:
+    """
+    Контроль допуска перед маршрутами: лимит частоты по клиенту и общий (429),
+    предел одновременных запросов класса и сброс дорогих запросов, пока очередь
+    пула БД ждёт дольше MUSIC_CATALOG_SHED_QUEUE_WAIT_MS (503). Оба ответа
+    содержат Retry-After.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        name = classify(scope["method"], scope["path"], scope.get("query_string", b""))
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        endpoint_class = ENDPOINT_CLASSES[name]
+
+        if endpoint_class.shed and overloaded():
+            rejected_requests.inc(1, name, "overloaded")
+            response = _reject(503, "Сервер перегружен, повторите запрос позже", 1)
+            await response(scope, receive, send)
+            return
+        retry_after = await rate_limiter.check(client_key(scope), endpoint_class.cost)
+        if retry_after:
+            rejected_requests.inc(1, name, "rate_limit")
+            response = _reject(429, "Слишком много запросов, повторите позже", retry_after)
+            await response(scope, receive, send)
+            return
+        if not concurrency_limits.acquire(name):
+            rejected_requests.inc(1, name, "concurrency")
+            response = _reject(503, "Слишком много одновременных запросов, повторите позже", 1)
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency_limits.release(name)
+
+
+rate_limiter = RateLimiter()
+concurrency_limits = ConcurrencyLimits()
+
+
+def status():
+    """Настройки и текущее состояние контроля допуска для /internal/admission."""
+    return {
+        "rate_limit": {"rate": rate_limiter.rate, "burst": rate_limiter.burst},
+        "global_rate_limit": {"rate": rate_limiter.global_rate, "burst": rate_limiter.global_burst},
+        "backend": rate_limiter.backend(),
+        "shed_queue_wait_ms": SHED_QUEUE_WAIT_MS,
+        "queue_wait_ms": db_executor.queue_wait() * 1000,
+        "classes": {
+            name: {"cost": endpoint_class.cost, "concurrency": endpoint_class.concurrency,
+                   "shed": endpoint_class.shed}
+            for name, endpoint_class in ENDPOINT_CLASSES.items()
+        },
+        "active": concurrency_limits.active(),
+    }
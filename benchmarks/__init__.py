@@ -0,0 +1,9 @@
+"""
+Бенчмарки каталога.
+
+    python -m benchmarks.bench_catalog --songs 100000
+    python -m benchmarks.bench_api --songs 100000 --concurrency 32
+    python -m benchmarks.bench_api --songs 100000 --uvicorn --workers 4
+
+Результаты сохраняются в benchmarks/results/ и сравниваются с предыдущим запуском.
+"""
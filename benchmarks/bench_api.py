@@ -0,0 +1,176 @@
+"""
+Нагрузочный тест HTTP API из main.py.
+
+По умолчанию приложение вызывается в том же процессе через ASGI-транспорт httpx;
+с --uvicorn запускается настоящий сервер uvicorn в отдельном процессе.
+
+    python -m benchmarks.bench_api --songs 100000 --requests 2000 --concurrency 32
+    python -m benchmarks.bench_api --songs 100000 --uvicorn --workers 4
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import use_database, summarize, print_table, save_results
+from benchmarks.synthetic import build_catalog, default_path, CYRILLIC_WORDS, LATIN_WORDS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def run_load(client, make_request, requests, concurrency):
+    """Выполняет requests запросов в concurrency параллельных потоках нагрузки."""
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, params = make_request()
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, params=params)
+                if response.status_code >= 500 or response.status_code == 429:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def _scenarios(albums, artists):
+    rng = random.Random(7)
+    words = CYRILLIC_WORDS + LATIN_WORDS
+    counter = iter(range(10 ** 9))
+    scenarios = {
+        "GET /search word": lambda: ("GET", "/search", {"query": rng.choice(words)}),
+        "GET /search prefix": lambda: ("GET", "/search", {"query": rng.choice(words)[:3]}),
+        "GET /search empty page": lambda: ("GET", "/search", {"query": "", "limit": 50}),
+        "GET /albums/{name}": lambda: ("GET", f"/albums/{rng.choice(albums)}", None),
+        "GET /artists/{name}/albums": lambda: ("GET", f"/artists/{rng.choice(artists)}/albums", None),
+        "POST /songs": lambda: ("POST", "/songs", {
+            "artist": rng.choice(artists), "title": f"load {next(counter)}",
+            "genre": "Рок", "album": rng.choice(albums), "year": 2000,
+        }),
+    }
+    mixed = list(scenarios.values())
+    weights = [30, 20, 5, 20, 20, 5]
+    scenarios["mixed"] = lambda: rng.choices(mixed, weights)[0]()
+    return scenarios
+
+
+def _sample_names(path):
+    import sqlite3
+    conn = sqlite3.connect(path)
+    try:
+        albums = [row[0] for row in conn.execute("SELECT name FROM albums ORDER BY random() LIMIT 200")]
+        artists = [row[0] for row in conn.execute("SELECT name FROM artists ORDER BY random() LIMIT 200")]
+    finally:
+        conn.close()
+    return albums, artists
+
+
+def _peak_rss_kb(pid):
+    """Пиковый RSS процесса и его дочерних процессов (Linux, /proc)."""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    for process in pids:
+        try:
+            with open(f"/proc/{process}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+async def bench_in_process(scenarios, args):
+    import main
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, make_request in scenarios.items():
+            latencies, errors, elapsed = await run_load(client, make_request, args.requests, args.concurrency)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            results[name] = summarize(latencies, elapsed, peak, errors)
+    return results
+
+
+async def bench_uvicorn(scenarios, args, path):
+    env = dict(os.environ, MUSIC_CATALOG_DB=os.path.abspath(path))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.HTTPError:
+                    await asyncio.sleep(0.1)
+            for name, make_request in scenarios.items():
+                latencies, errors, elapsed = await run_load(client, make_request, args.requests, args.concurrency)
+                results[name] = summarize(latencies, elapsed, _peak_rss_kb(server.pid) * 1024, errors)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--songs", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=1000, help="запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--db", help="файл БД (по умолчанию — синтетический каталог в benchmarks/results)")
+    parser.add_argument("--uvicorn", action="store_true", help="нагружать настоящий сервер uvicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    path = args.db or default_path(args.songs)
+    use_database(path)
+    build_catalog(path, args.songs)
+    scenarios = _scenarios(*_sample_names(path))
+
+    if args.uvicorn:
+        results = asyncio.run(bench_uvicorn(scenarios, args, path))
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(bench_in_process(scenarios, args))
+
+    print_table(results)
+    params = {
+        "songs": args.songs, "requests": args.requests, "concurrency": args.concurrency,
+        "mode": "uvicorn" if args.uvicorn else "asgi", "workers": args.workers,
+    }
+    save_results("api-uvicorn" if args.uvicorn else "api-asgi", params, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Микробенчмарки функций music_catalog на синтетическом каталоге.
+
+    python -m benchmarks.bench_catalog --songs 100000 --repeat 200
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import use_database, summarize, print_table, save_results
+from benchmarks.synthetic import build_catalog, default_path, CYRILLIC_WORDS, LATIN_WORDS
+
+
+def measure(func, repeat, warmup=3):
+    """Время каждого вызова и пиковая память (отдельным проходом под tracemalloc)."""
+    for _ in range(warmup):
+        func()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for _ in range(min(repeat, 5)):
+        func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(latencies, elapsed, peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--songs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--db", help="файл БД (по умолчанию — синтетический каталог в benchmarks/results)")
+    parser.add_argument("--cache", action="store_true", help="не отключать кэш ответов")
+    args = parser.parse_args()
+
+    path = args.db or default_path(args.songs)
+    use_database(path)
+    build_catalog(path, args.songs)
+
+    import cache
+    import database
+    import music_catalog
+
+    if not args.cache:
+        cache.configure_cache(max_entries=0)
+
+    conn = database.get_db_connection()
+    albums = [row[0] for row in conn.execute("SELECT name FROM albums ORDER BY random() LIMIT 100")]
+    artists = [row[0] for row in conn.execute("SELECT name FROM artists ORDER BY random() LIMIT 100")]
+    titles = [row[0] for row in conn.execute("SELECT title FROM songs ORDER BY random() LIMIT 100")]
+    conn.close()
+
+    rng = random.Random(1)
+    words = CYRILLIC_WORDS + LATIN_WORDS
+    added = []
+
+    def add_song():
+        title = f"bench {len(added)} {rng.choice(words)}"
+        music_catalog.add_song(rng.choice(artists), title, "Рок", rng.choice(albums), 2000)
+        added.append(title)
+
+    def delete_song():
+        if added:
+            music_catalog.delete_song(added.pop())
+
+    export_path = os.path.join(tempfile.gettempdir(), "bench_export.docx")
+    scenarios = {
+        "search_tracks_page word": lambda: music_catalog.search_tracks_page(rng.choice(words)),
+        "search_tracks_page prefix": lambda: music_catalog.search_tracks_page(rng.choice(words)[:3]),
+        "search_tracks_page 2 words": lambda: music_catalog.search_tracks_page(
+            f"{rng.choice(words)} {rng.choice(words)}"),
+        "search_tracks_page empty": lambda: music_catalog.search_tracks_page("", limit=50),
+        "get_album_details": lambda: music_catalog.get_album_details(rng.choice(albums)),
+        "get_artist_albums": lambda: music_catalog.get_artist_albums(rng.choice(artists)),
+        "add_song": add_song,
+        "update_song": lambda: music_catalog.update_song(rng.choice(titles), new_year=rng.randint(1960, 2025)),
+        "delete_song": delete_song,
+    }
+
+    # print() внутри music_catalog не должен влиять на замеры
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, func in scenarios.items():
+            results[name] = measure(func, args.repeat)
+        results["export_songs_to_docx"] = measure(
+            lambda: music_catalog.export_songs_to_docx(export_path), repeat=3, warmup=1)
+    if os.path.exists(export_path):
+        os.remove(export_path)
+
+    print_table(results)
+    save_results("catalog", {"songs": args.songs, "repeat": args.repeat, "cache": args.cache}, results)
+
+
+if __name__ == "__main__":
+    main()
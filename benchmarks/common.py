@@ -0,0 +1,103 @@
+import json
+import os
+import platform
+import statistics
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def use_database(path):
+    """
+    Направляет приложение на отдельный файл БД.
+    Нужно вызвать до импорта database/music_catalog/main.
+    """
+    os.environ["MUSIC_CATALOG_DB"] = path
+    # Бенчмарки измеряют работу с SQLite, а не доступность Redis
+    os.environ.setdefault("MUSIC_CATALOG_REDIS_URL", "")
+    # Вся нагрузка идёт от одного клиента: лимит частоты на клиента мерил бы сам себя
+    os.environ.setdefault("MUSIC_CATALOG_RATE_LIMIT", "0")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed=None, peak_memory=None, errors=0):
+    """Сводка по списку задержек в секундах: p50/p95/p99 в мс и пропускная способность."""
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "mean_ms": statistics.fmean(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0,
+    }
+    if elapsed:
+        summary["throughput_rps"] = len(values) / elapsed
+    if peak_memory is not None:
+        summary["peak_memory_kb"] = peak_memory / 1024
+    return summary
+
+
+def print_table(results):
+    print(f"{'сценарий':<32}{'n':>7}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'rps':>10}{'пик КБ':>10}")
+    for name, summary in results.items():
+        print(
+            f"{name:<32}{summary['count']:>7}"
+            f"{summary['p50_ms']:>10.3f}{summary['p95_ms']:>10.3f}{summary['p99_ms']:>10.3f}"
+            f"{summary.get('throughput_rps', 0):>10.1f}{summary.get('peak_memory_kb', 0):>10.0f}"
+        )
+
+
+def save_results(suite, params, results):
+    """Сохраняет результаты в JSON и печатает сравнение с предыдущим запуском того же набора."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    previous = _latest_results(suite)
+    record = {
+        "suite": suite,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    path = os.path.join(RESULTS_DIR, f"{suite}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {path}")
+    if previous:
+        compare(previous, record)
+    return path
+
+
+def _latest_results(suite):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(
+        name for name in os.listdir(RESULTS_DIR)
+        if name.startswith(suite + "-") and name.endswith(".json")
+    )
+    if not files:
+        return None
+    with open(os.path.join(RESULTS_DIR, files[-1]), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(old, new):
+    """Печатает изменение p50/p95 по сценариям относительно прошлого запуска."""
+    print(f"Сравнение с запуском {old['timestamp']} (параметры: {old['params']}):")
+    for name, summary in new["results"].items():
+        before = old["results"].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms"):
+            if before[key]:
+                changes.append(f"{key} {(summary[key] - before[key]) / before[key] * 100:+.1f}%")
+        print(f"  {name:<32}{', '.join(changes)}")
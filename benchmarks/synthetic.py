@@ -0,0 +1,59 @@
+import os
+import random
+
+LATIN_WORDS = (
+    "love", "night", "city", "dream", "fire", "river", "summer", "light", "heart", "road",
+    "rain", "star", "shadow", "gold", "wild", "blue", "silent", "electric", "ocean", "wind",
+)
+CYRILLIC_WORDS = (
+    "любовь", "ночь", "город", "мечта", "огонь", "река", "лето", "свет", "сердце", "дорога",
+    "дождь", "звезда", "тень", "золото", "ветер", "небо", "ёлка", "весна", "песня", "берег",
+)
+GENRES = (
+    "Поп-музыка", "Рок", "Русская эстрада", "Джаз", "Хип-хоп", "Электроника",
+    "Pop", "Rock", "Jazz", "Classical", "Metal", "Folk",
+)
+
+
+def _name(rng, words_count):
+    words = CYRILLIC_WORDS if rng.random() < 0.5 else LATIN_WORDS
+    return " ".join(rng.choice(words) for _ in range(words_count)).capitalize()
+
+
+def iter_songs(songs, seed=42):
+    """
+    Синтетический каталог: примерно по 20 песен на исполнителя и по 10 на альбом,
+    названия на кириллице и латинице. Выдаёт строки в формате importer.import_songs.
+    """
+    rng = random.Random(seed)
+    artists = max(1, songs // 20)
+    for number in range(songs):
+        artist_number = rng.randrange(artists)
+        yield number + 1, {
+            "artist": f"{_name(rng, 2)} {artist_number}",
+            "title": f"{_name(rng, rng.randint(1, 4))} {number}",
+            "genre": rng.choice(GENRES),
+            "album": f"{_name(rng, 2)} {artist_number}-{rng.randrange(2)}",
+            "year": rng.randint(1960, 2025),
+        }, None
+
+
+def build_catalog(path, songs, seed=42):
+    """
+    Создаёт файл БД с синтетическим каталогом (если его ещё нет).
+    Модули приложения должны быть настроены на path через common.use_database().
+    """
+    import database
+    import importer
+
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    database.create_database(path)
+    report = importer.import_songs(iter_songs(songs, seed))
+    print(f"Синтетический каталог {path}: {report['imported']} песен")
+    return path
+
+
+def default_path(songs):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"catalog-{songs}.db")
@@ -0,0 +1,386 @@
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import serialization
+
+# Redis включается явно, например redis://localhost:6379/0; без него (по умолчанию)
+# используется только локальный LRU-кэш, а пакет redis даже не импортируется
+REDIS_URL = os.environ.get("MUSIC_CATALOG_REDIS_URL", "")
+CACHE_TTL = int(os.environ.get("MUSIC_CATALOG_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.environ.get("MUSIC_CATALOG_CACHE_MAX_ENTRIES", "10000"))
+# Слишком большие ответы (например, весь каталог) не кэшируются
+CACHE_MAX_VALUE_BYTES = int(os.environ.get("MUSIC_CATALOG_CACHE_MAX_VALUE_BYTES", str(1024 * 1024)))
+CACHE_PREFIX = "music_catalog:"
+# Через сколько секунд снова пробовать Redis после ошибки
+REDIS_RETRY_INTERVAL = 30.0
+# Канал Redis pub/sub, через который воркеры сообщают друг другу об изменениях каталога
+INVALIDATION_CHANNEL = CACHE_PREFIX + "invalidations"
+# Без Redis воркеры узнают о чужих изменениях, опрашивая версию каталога раз в столько секунд; 0 — не опрашивать.
+# Опрос включён по умолчанию: при запуске `uvicorn main:app --workers N` без serve.py
+# воркеры иначе отдавали бы из локального кэша устаревшие ответы до истечения TTL
+INVALIDATION_POLL_INTERVAL = float(os.environ.get("MUSIC_CATALOG_INVALIDATION_POLL", "1"))
+
+
+class LocalCache:
+    """Потокобезопасный LRU-кэш в памяти процесса с TTL для каждой записи."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._entries.get(key, (0, None))[0]) + 1
+            self._entries[key] = (str(value), None)
+            self._entries.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    """Кэш в Redis. Принимает готовый клиент (например, fakeredis в тестах)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=ttl or None)
+
+    def get_many(self, keys):
+        return [
+            value.decode("utf-8") if isinstance(value, bytes) else value
+            for value in self.client.mget(keys)
+        ]
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+class CatalogCache:
+    """
+    Кэш ответов каталога.
+    Ключи содержат номер поколения пространства имён (поиск, альбом, исполнитель),
+    поэтому инвалидация — это увеличение счётчика поколения, а старые записи
+    просто перестают читаться и вытесняются по TTL/LRU.
+    При недоступности Redis используется локальный LRU-кэш.
+    """
+
+    def __init__(self, client=None, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.local = LocalCache(max_entries)
+        self.remote = RedisCache(client) if client is not None else None
+        self._remote_failed_at = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _backend(self):
+        if self.remote is None:
+            return self.local
+        if self._remote_failed_at is not None:
+            if time.monotonic() - self._remote_failed_at < REDIS_RETRY_INTERVAL:
+                return self.local
+            # Пока Redis был недоступен, инвалидации шли мимо него — сбрасываем всё
+            self._remote_failed_at = None
+            try:
+                self.remote.incr(CACHE_PREFIX + "epoch")
+            except Exception as e:
+                self._remote_unavailable(e)
+                return self.local
+        return self.remote
+
+    def _remote_unavailable(self, error):
+        if self._remote_failed_at is None:
+            print(f"Redis недоступен, используется локальный кэш: {error}")
+        self._remote_failed_at = time.monotonic()
+        # Локальный кэш мог устареть, пока работал Redis
+        self.local.clear()
+
+    def _call(self, method, *args):
+        backend = self._backend()
+        try:
+            return getattr(backend, method)(*args)
+        except Exception as e:
+            if backend is self.local:
+                raise
+            self._remote_unavailable(e)
+            return getattr(self.local, method)(*args)
+
+    def make_key(self, namespace, scope, args, kwargs):
+        epoch, generation = self._call(
+            "get_many", [CACHE_PREFIX + "epoch", CACHE_PREFIX + "gen:" + scope]
+        )
+        arguments = json.dumps([args, kwargs], ensure_ascii=False, sort_keys=True, default=str)
+        return f"{CACHE_PREFIX}{epoch or 0}:{namespace}:{generation or 0}:{arguments}"
+
+    def get(self, key):
+        raw = self._call("get", key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if raw is None else serialization.loads(raw)
+
+    def set(self, key, value):
+        raw = serialization.dumps(value)
+        if len(raw) > CACHE_MAX_VALUE_BYTES:
+            return
+        self._call("set", key, raw, self.ttl)
+
+    def invalidate(self, search=True, albums=(), artists=()):
+        """Делает недействительными результаты поиска и записи указанных альбомов/исполнителей."""
+        scopes = (["search"] if search else [])
+        scopes += ["album:" + name for name in albums if name]
+        scopes += ["artist:" + name for name in artists if name]
+        for scope in scopes:
+            self._call("incr", CACHE_PREFIX + "gen:" + scope)
+
+    def invalidate_all(self):
+        """Делает недействительным весь кэш каталога."""
+        self._call("incr", CACHE_PREFIX + "epoch")
+        self.local.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def create_redis_client(socket_timeout=0.2):
+    """Клиент Redis по MUSIC_CATALOG_REDIS_URL или None, если Redis не настроен."""
+    if not REDIS_URL:
+        return None
+    # Клиент импортируется только при настроенном Redis: импорт пакета заметно удлиняет старт
+    try:
+        import redis
+    except ImportError:  # redis необязателен: без него работает только локальный кэш
+        return None
+    return redis.Redis.from_url(REDIS_URL, socket_timeout=socket_timeout, socket_connect_timeout=0.2)
+
+
+catalog_cache = CatalogCache(create_redis_client())
+
+
+def configure_cache(client=None, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+    """
+    Пересоздаёт общий кэш, например с fakeredis.FakeRedis() в тестах
+    или без клиента — только локальный LRU.
+    """
+    global catalog_cache
+    catalog_cache = CatalogCache(client, ttl, max_entries)
+    return catalog_cache
+
+
+def cached(namespace, scoped=False):
+    """
+    Декоратор read-through кэша для функций чтения каталога.
+    scoped=True — первый аргумент функции (имя альбома или исполнителя)
+    определяет область инвалидации "<namespace>:<имя>", иначе — весь namespace.
+    Результат None не кэшируется.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = catalog_cache
+            scope = f"{namespace}:{args[0]}" if scoped else namespace
+            key = cache.make_key(f"{namespace}.{func.__name__}", scope, args, kwargs)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            value = func(*args, **kwargs)
+            if value is not None:
+                cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
+
+
+_invalidation_listeners = []
+_invalidate_all_listeners = []
+_remote_change_listeners = []
+
+
+def on_invalidate(callback):
+    """
+    Регистрирует функцию без аргументов, вызываемую после каждой инвалидации
+    (то есть после каждой зафиксированной записи в каталог).
+    """
+    _invalidation_listeners.append(callback)
+    return callback
+
+
+def on_invalidate_all(callback):
+    """
+    Регистрирует функцию без аргументов, вызываемую, когда в этом процессе мог
+    измениться весь каталог: очистка, импорт, восстановление из снимка.
+    """
+    _invalidate_all_listeners.append(callback)
+    return callback
+
+
+def on_remote_change(callback):
+    """
+    Регистрирует функцию без аргументов, вызываемую, когда каталог изменил другой
+    воркер (сообщение Redis pub/sub или новая версия при опросе). Что именно
+    изменилось, слушатель узнаёт сам, например из журнала изменений.
+    """
+    _remote_change_listeners.append(callback)
+    return callback
+
+
+def _notify_invalidated(everything=False):
+    for callback in _invalidation_listeners:
+        callback()
+    if everything:
+        for callback in _invalidate_all_listeners:
+            callback()
+
+
+class InvalidationBus:
+    """
+    Сообщает другим воркерам (процессам) об изменениях каталога.
+    С Redis — через pub/sub: каждая запись публикует сообщение, остальные процессы
+    его получают. Без Redis — опросом version_loader() (счётчик изменений каталога
+    в SQLite) каждые poll_interval секунд; при этом и собственные записи процесса
+    сбрасывают его локальный кэш целиком.
+    Получатель очищает локальный LRU-кэш и вызывает слушателей on_invalidate
+    (кэш версии для ETag и т. п.) и on_remote_change. Поколения в Redis общие и в рассылке не нуждаются.
+    """
+
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self._client = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._version_loader = None
+        self._poll_interval = INVALIDATION_POLL_INTERVAL
+
+    def start(self, version_loader=None, poll_interval=INVALIDATION_POLL_INTERVAL):
+        if self._thread is not None:
+            return
+        self._version_loader = version_loader if poll_interval > 0 else None
+        self._poll_interval = poll_interval
+        self._client = create_redis_client(socket_timeout=None)
+        if self._client is not None:
+            target = self._listen
+        elif self._version_loader is not None:
+            target = self._poll
+        else:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=target, name="cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def publish(self):
+        if self._client is None or self._thread is None:
+            return
+        try:
+            self._client.publish(INVALIDATION_CHANNEL, self.origin)
+        except Exception:
+            pass  # подписчики без связи с Redis сами сбросят кэш или перейдут на опрос
+
+    def _received(self):
+        catalog_cache.local.clear()
+        _notify_invalidated()
+        for callback in _remote_change_listeners:
+            callback()
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                try:
+                    while not self._stopped.is_set():
+                        message = pubsub.get_message(timeout=1.0)
+                        if message is None:
+                            continue
+                        data = message["data"]
+                        if (data.decode("utf-8") if isinstance(data, bytes) else data) != self.origin:
+                            self._received()
+                finally:
+                    pubsub.close()
+            except Exception as e:
+                print(f"Подписка на инвалидации в Redis прервана: {e}")
+                # Пока подписки не было, сообщения могли потеряться
+                self._received()
+                # До следующей попытки подписаться изменения отслеживаются опросом
+                if self._version_loader is not None:
+                    self._poll(time.monotonic() + REDIS_RETRY_INTERVAL)
+                else:
+                    self._stopped.wait(REDIS_RETRY_INTERVAL)
+
+    def _poll(self, until=None):
+        last = None
+        while not self._stopped.wait(self._poll_interval):
+            try:
+                version = self._version_loader()
+            except Exception as e:
+                print(f"Не удалось проверить версию каталога: {e}")
+                version = None
+            if version is not None:
+                if last is not None and version != last:
+                    self._received()
+                last = version
+            if until is not None and time.monotonic() >= until:
+                return
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopped.set()
+            thread.join()
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+invalidation_bus = InvalidationBus()
+
+
+def invalidate(search=True, albums=(), artists=()):
+    catalog_cache.invalidate(search=search, albums=albums, artists=artists)
+    _notify_invalidated()
+    invalidation_bus.publish()
+
+
+def invalidate_all():
+    catalog_cache.invalidate_all()
+    _notify_invalidated(everything=True)
+    invalidation_bus.publish()
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import threading
+
+import cache
+import serialization
+
+# Как часто поток событий шлёт комментарий-пинг, если изменений нет (секунды);
+# заодно поток перечитывает журнал — на случай пропущенного уведомления
+STREAM_HEARTBEAT = float(os.environ.get("MUSIC_CATALOG_CHANGES_HEARTBEAT", "15"))
+# Пауза после уведомления, чтобы серия записей ушла клиенту одним событием
+STREAM_COALESCE_DELAY = float(os.environ.get("MUSIC_CATALOG_CHANGES_COALESCE_DELAY", "0.1"))
+
+
+class ChangeNotifier:
+    """
+    Будит потоки событий /changes/stream после каждой записи в каталог.
+    notify() вызывается из любого потока (поток записи, шина инвалидации),
+    ожидание — в цикле событий. Счётчик generation не даёт потерять уведомление,
+    пришедшее между чтением журнала и началом ожидания.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._waiters = set()
+
+    @property
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def notify(self):
+        with self._lock:
+            self._generation += 1
+            waiters, self._waiters = self._waiters, set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # цикл событий уже закрыт
+
+    async def wait(self, seen_generation, timeout):
+        """Ждёт изменения после seen_generation не дольше timeout; False — по таймауту."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._lock:
+            if self._generation != seen_generation:
+                return True
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def subscribers(self):
+        with self._lock:
+            return len(self._waiters)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+change_notifier = ChangeNotifier()
+cache.on_invalidate(change_notifier.notify)
+
+
+def sse_event(delta):
+    """Событие text/event-stream с порцией изменений; id позволяет продолжить с Last-Event-ID."""
+    return b"id: %d\nevent: changes\ndata: %s\n\n" % (delta["last_seq"], serialization.dumps(delta))
+
+
+SSE_PING = b": ping\n\n"
@@ -1,70 +1,1015 @@
+import os
+import queue
+import random
 import sqlite3
+import threading
+import time
+import urllib.parse
+
+import metrics
+
+DATABASE_FILE = os.environ.get("MUSIC_CATALOG_DB", "music_catalog.db")
+
+# Настройки пула соединений (можно переопределить через переменные окружения)
+POOL_SIZE = int(os.environ.get("MUSIC_CATALOG_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("MUSIC_CATALOG_POOL_TIMEOUT", "5"))
+# Пул соединений только для чтения (поиск, альбомы, статистика, экспорт)
+READ_POOL_SIZE = int(os.environ.get("MUSIC_CATALOG_READ_POOL_SIZE", str(POOL_SIZE)))
+# Сколько соединений каждого пула открывать при старте воркера
+POOL_WARM_UP = int(os.environ.get("MUSIC_CATALOG_POOL_WARM_UP", "2"))
+# Соединение, пролежавшее в пуле дольше этого времени, проверяется перед выдачей
+POOL_HEALTH_CHECK_INTERVAL = 30.0
+
+# Сколько SQLite ждёт снятия блокировки другим процессом (busy_timeout, мс),
+# и сколько раз после этого повторять запрос с экспоненциальной задержкой
+BUSY_TIMEOUT_MS = int(os.environ.get("MUSIC_CATALOG_BUSY_TIMEOUT_MS", "5000"))
+BUSY_RETRIES = int(os.environ.get("MUSIC_CATALOG_BUSY_RETRIES", "3"))
+BUSY_RETRY_DELAY = float(os.environ.get("MUSIC_CATALOG_BUSY_RETRY_DELAY", "0.05"))
+
+# PRAGMA, которые применяются один раз при создании соединения в пуле
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+)
+
+# Каталог снимков базы (резервные копии перед очисткой и т. п.)
+BACKUP_DIR = os.environ.get("MUSIC_CATALOG_BACKUP_DIR", "backups")
+
+# Сколько последних записей журнала изменений хранить; более старые удаляются
+# (клиент, отставший сильнее, получает reset и загружает каталог заново)
+CHANGE_LOG_KEEP = int(os.environ.get("MUSIC_CATALOG_CHANGE_LOG_KEEP", "100000"))
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Все соединения пула заняты дольше допустимого времени ожидания."""
+
+
+def open_connection(database, read_only=False, **kwargs):
+    """
+    Новое соединение с SQLite с row_factory=Row и CONNECTION_PRAGMAS.
+    read_only=True открывает файл в режиме mode=ro с PRAGMA query_only:
+    такое соединение не может случайно начать запись и занять блокировку.
+    """
+    kwargs.setdefault("timeout", BUSY_TIMEOUT_MS / 1000)
+    if read_only:
+        uri = f"file:{urllib.parse.quote(os.path.abspath(database))}?mode=ro"
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False, **kwargs)
+        pragmas = [pragma for pragma in CONNECTION_PRAGMAS if "journal_mode" not in pragma]
+        pragmas.append("PRAGMA query_only = ON")
+    else:
+        connection = sqlite3.connect(database, check_same_thread=False, **kwargs)
+        pragmas = CONNECTION_PRAGMAS
+    connection.row_factory = sqlite3.Row
+    for pragma in pragmas:
+        try:
+            connection.execute(pragma)
+        except sqlite3.Error as e:
+            print(f"Не удалось применить '{pragma}': {e}")
+    return connection
+
+
+def is_busy_error(error):
+    """SQLITE_BUSY/SQLITE_LOCKED: база занята другим соединением или процессом."""
+    code = getattr(error, "sqlite_errorcode", None)
+    return code is not None and code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def _busy_delay(attempt):
+    return BUSY_RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+def retry_busy(transaction, *args, **kwargs):
+    """
+    Выполняет transaction(*args, **kwargs) — транзакцию записи целиком, которая
+    при ошибке сама откатывается, — и повторяет её до BUSY_RETRIES раз с растущей
+    задержкой, если она прервалась SQLITE_BUSY. Отдельный запрос внутри транзакции
+    TracingCursor не повторяет, а всю транзакцию заново — можно.
+    """
+    attempt = 0
+    while True:
+        try:
+            return transaction(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if attempt >= BUSY_RETRIES or not is_busy_error(e):
+                raise
+        metrics.sqlite_busy_retries.inc()
+        time.sleep(_busy_delay(attempt))
+        attempt += 1
+
+
+class TracingCursor(sqlite3.Cursor):
+    """
+    Курсор, который считает запросы, их длительность и число прочитанных строк
+    для /metrics и пишет медленные запросы в журнал.
+    Запрос, получивший SQLITE_BUSY вне транзакции (чтение или BEGIN), повторяется
+    до BUSY_RETRIES раз с растущей задержкой: так параллельные воркеры переживают
+    чужие длинные транзакции записи. Транзакции записи повторяются целиком через retry_busy().
+    """
+
+    _statement = None
+
+    def execute(self, sql, parameters=()):
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                return super().execute(sql, parameters)
+            except sqlite3.OperationalError as e:
+                # Внутри транзакции повтор одного запроса небезопасен: её откатывает вызывающий код
+                if attempt >= BUSY_RETRIES or not is_busy_error(e) or self.connection.in_transaction:
+                    raise
+            finally:
+                self._observe(sql, parameters, time.perf_counter() - started)
+            metrics.sqlite_busy_retries.inc()
+            time.sleep(_busy_delay(attempt))
+            attempt += 1
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._observe(sql, None, time.perf_counter() - started)
+
+    def _observe(self, sql, parameters, duration):
+        self._statement = metrics.statement_name(sql)
+        metrics.sqlite_query_duration.observe(duration, self._statement)
+        if metrics.SLOW_QUERY_MS and duration * 1000 >= metrics.SLOW_QUERY_MS and parameters is not None:
+            metrics.log_slow_query(self.connection, sql, parameters, duration)
+
+    def _fetched(self, rows, started):
+        if self._statement is not None:
+            metrics.sqlite_fetch_seconds.inc(time.perf_counter() - started, self._statement)
+            metrics.sqlite_rows.inc(rows, self._statement)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(row is not None, started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), started)
+        return rows
+
+
+class PooledConnection:
+    """
+    Соединение, выданное пулом.
+    Ведёт себя как sqlite3.Connection, но close() возвращает его в пул,
+    а не закрывает по-настоящему.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def close(self):
+        if self._connection is not None:
+            self._pool.release(self._connection)
+            self._connection = None
+
+    def cursor(self, factory=TracingCursor):
+        return self.__getattr__("cursor")(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise sqlite3.ProgrammingError("Соединение уже возвращено в пул")
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Ограниченный пул долгоживущих соединений с SQLite."""
+
+    def __init__(self, database, size=POOL_SIZE, timeout=POOL_TIMEOUT, read_only=False):
+        self.database = database
+        self.read_only = read_only
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _connect(self):
+        return open_connection(self.database, read_only=self.read_only)
+
+    @staticmethod
+    def _is_healthy(connection):
+        try:
+            connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, connection):
+        with self._lock:
+            self._created -= 1
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        """Выдаёт соединение из пула, при необходимости создавая новое."""
+        started = time.perf_counter()
+        try:
+            return self._acquire()
+        finally:
+            metrics.sqlite_pool_wait.observe(time.perf_counter() - started)
+
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+        try:
+            connection, released_at = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                connection, released_at = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolTimeoutError("Нет свободных соединений в пуле") from None
+
+        if time.monotonic() - released_at > POOL_HEALTH_CHECK_INTERVAL and not self._is_healthy(connection):
+            self._discard(connection)
+            with self._lock:
+                self._created += 1
+            try:
+                return self._connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return connection
+
+    def warm_up(self, count=None):
+        """
+        Заранее открывает count соединений (по умолчанию — весь пул),
+        чтобы первые запросы после старта не тратили время на подключение.
+        """
+        connections = []
+        try:
+            for _ in range(self.size if count is None else min(count, self.size)):
+                connections.append(self._acquire())
+        finally:
+            for connection in connections:
+                self.release(connection)
+        return len(connections)
+
+    def release(self, connection):
+        """Возвращает соединение в пул, откатывая незавершённую транзакцию."""
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            self._discard(connection)
+            return
+        if self._closed:
+            self._discard(connection)
+            return
+        self._idle.put_nowait((connection, time.monotonic()))
+
+    def close(self):
+        """Закрывает все простаивающие соединения пула."""
+        self._closed = True
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Возвращает общий пул соединений, создавая его при первом обращении."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE_FILE)
+    return _pool
+
+
+_read_pool = None
+# Файл, из которого читает пул только для чтения (None — основная база)
+_read_database = None
+
+
+def get_read_pool():
+    """Пул соединений только для чтения: к реплике, если она включена, иначе к основной базе."""
+    global _read_pool
+    if _read_pool is None:
+        with _pool_lock:
+            if _read_pool is None:
+                _read_pool = ConnectionPool(_read_database or DATABASE_FILE, READ_POOL_SIZE, read_only=True)
+    return _read_pool
+
+
+def switch_read_database(path):
+    """
+    Переключает чтение на другой файл (обновлённую реплику) или обратно
+    на основную базу (path=None). Выданные соединения старого пула
+    закрываются при возврате.
+    """
+    global _read_pool, _read_database
+    with _pool_lock:
+        old, _read_database = _read_pool, path
+        _read_pool = ConnectionPool(path or DATABASE_FILE, READ_POOL_SIZE, read_only=True)
+    if old is not None:
+        old.close()
+
+
+def close_pool():
+    """Закрывает общие пулы (например, при остановке приложения)."""
+    global _pool, _read_pool
+    with _pool_lock:
+        for pool in (_pool, _read_pool):
+            if pool is not None:
+                pool.close()
+        _pool = _read_pool = None
 
-DATABASE_FILE = "music_catalog.db"
 
 def get_db_connection():
-    """Устанавливает соединение с базой данных."""
-    connection = None
+    """Выдаёт соединение с базой данных из пула. close() возвращает его обратно."""
     try:
-        connection = sqlite3.connect(DATABASE_FILE)
-        connection.row_factory = sqlite3.Row
-        return connection
+        pool = get_pool()
+        return PooledConnection(pool, pool.acquire())
     except sqlite3.Error as e:
         print(f"Ошибка подключения к базе данных: {e}")
-        if connection:
-            connection.close()
         return None
 
-def create_database(db_name):
+
+def get_read_connection():
+    """
+    Соединение только для чтения (для поиска, просмотра альбомов, статистики и экспорта).
+    В режиме WAL такие чтения не мешают записи и не ждут её.
+    """
     try:
-        connection = sqlite3.connect(db_name)
-        cursor = connection.cursor()
-
-        # Таблица artists
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS artists (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                biography TEXT
-            )
+        pool = get_read_pool()
+        return PooledConnection(pool, pool.acquire())
+    except sqlite3.Error as e:
+        print(f"Ошибка подключения к базе данных: {e}")
+        return None
+
+def _create_tables(cursor):
+    """Исходная схема каталога: artists, genres, albums и songs."""
+    # Таблица artists
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artists (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            biography TEXT
+        )
+    ''')
+
+    # Таблица genres
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS genres (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT
+        )
+    ''')
+
+    # Таблица albums
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS albums (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            artist_id INTEGER NOT NULL,
+            description TEXT,
+            FOREIGN KEY (artist_id) REFERENCES artists(id)
+        )
+    ''')
+
+    # Таблица songs (с добавленным album_id)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS songs (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            artist_id INTEGER NOT NULL,
+            genre_id INTEGER,
+            album_id INTEGER,
+            year INTEGER NOT NULL,
+            FOREIGN KEY (artist_id) REFERENCES artists(id),
+            FOREIGN KEY (genre_id) REFERENCES genres(id),
+            FOREIGN KEY (album_id) REFERENCES albums(id)
+        )
+    ''')
+
+
+def _merge_duplicates(cursor, table, key_columns, references):
+    """
+    Сливает строки table с одинаковыми key_columns в строку с минимальным id,
+    перенаправляя на неё ссылки из references [(таблица, колонка), ...].
+    Нужно перед созданием уникальных индексов на уже заполненной базе.
+    """
+    keys = ", ".join(key_columns)
+    join = " AND ".join(f"t.{column} IS k.{column}" for column in key_columns)
+    cursor.execute("DROP TABLE IF EXISTS temp._id_map")
+    cursor.execute(f'''
+        CREATE TEMP TABLE _id_map AS
+        SELECT t.id AS old_id, k.keep_id AS new_id
+        FROM {table} t
+        JOIN (SELECT {keys}, min(id) AS keep_id FROM {table} GROUP BY {keys}) k ON {join}
+        WHERE t.id != k.keep_id
+    ''')
+    for ref_table, column in references:
+        cursor.execute(f'''
+            UPDATE {ref_table}
+            SET {column} = (SELECT new_id FROM _id_map WHERE old_id = {ref_table}.{column})
+            WHERE {column} IN (SELECT old_id FROM _id_map)
         ''')
+    cursor.execute(f"DELETE FROM {table} WHERE id IN (SELECT old_id FROM _id_map)")
+    cursor.execute("DROP TABLE temp._id_map")
 
-        # Таблица genres
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS genres (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT
-            )
+
+def _add_indexes(cursor):
+    """Уникальность имён и индексы для поиска по именам и внешним ключам."""
+    _merge_duplicates(cursor, "artists", ["name"], [("songs", "artist_id"), ("albums", "artist_id")])
+    _merge_duplicates(cursor, "genres", ["name"], [("songs", "genre_id")])
+    _merge_duplicates(cursor, "albums", ["name", "artist_id"], [("songs", "album_id")])
+
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS artists_name_uq ON artists (name)")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS genres_name_uq ON genres (name)")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS albums_name_artist_uq ON albums (name, artist_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS albums_artist_id_idx ON albums (artist_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS songs_title_idx ON songs (title)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS songs_artist_id_idx ON songs (artist_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS songs_album_id_idx ON songs (album_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS songs_genre_id_idx ON songs (genre_id)")
+
+
+def _fold(expression):
+    """SQL-выражение, приводящее «ё» к «е» (unicode61 не считает их одной буквой)."""
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_search_index(cursor):
+    """
+    Создаёт полнотекстовый индекс songs_fts (FTS5) по названию песни,
+    альбома, исполнителя и жанра и триггеры, поддерживающие его в актуальном виде.
+    Если индекс создаётся для уже заполненной базы, он строится заново.
+    """
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+            title, album, artist, genre,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+
+    song_row = f'''
+        SELECT
+            new.id,
+            {_fold("new.title")},
+            (SELECT {_fold("name")} FROM albums WHERE id = new.album_id),
+            (SELECT {_fold("name")} FROM artists WHERE id = new.artist_id),
+            (SELECT {_fold("name")} FROM genres WHERE id = new.genre_id)
+    '''
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN
+            INSERT INTO songs_fts (rowid, title, album, artist, genre) {song_row};
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN
+            DELETE FROM songs_fts WHERE rowid = old.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS songs_fts_update AFTER UPDATE ON songs BEGIN
+            DELETE FROM songs_fts WHERE rowid = old.id;
+            INSERT INTO songs_fts (rowid, title, album, artist, genre) {song_row};
+        END
+    ''')
+
+    # Переименование исполнителя, альбома или жанра обновляет связанные песни
+    for table, column, foreign_key in (
+        ("artists", "artist", "artist_id"),
+        ("albums", "album", "album_id"),
+        ("genres", "genre", "genre_id"),
+    ):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_rename AFTER UPDATE OF name ON {table} BEGIN
+                UPDATE songs_fts SET {column} = {_fold("new.name")}
+                WHERE rowid IN (SELECT id FROM songs WHERE {foreign_key} = new.id);
+            END
         ''')
 
-        # Таблица albums
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS albums (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                artist_id INTEGER NOT NULL,
-                description TEXT,
-                FOREIGN KEY (artist_id) REFERENCES artists(id)
+    indexed = cursor.execute("SELECT count(*) FROM songs_fts").fetchone()[0]
+    total = cursor.execute("SELECT count(*) FROM songs").fetchone()[0]
+    if indexed != total:
+        rebuild_search_index(cursor)
+
+
+def rebuild_search_index(cursor):
+    """Полностью перестраивает songs_fts по текущему содержимому таблиц."""
+    cursor.execute("DELETE FROM songs_fts")
+    cursor.execute(f'''
+        INSERT INTO songs_fts (rowid, title, album, artist, genre)
+        SELECT
+            s.id,
+            {_fold("s.title")},
+            {_fold("a.name")},
+            {_fold("ar.name")},
+            {_fold("g.name")}
+        FROM songs s
+        LEFT JOIN albums a ON s.album_id = a.id
+        LEFT JOIN artists ar ON s.artist_id = ar.id
+        LEFT JOIN genres g ON s.genre_id = g.id
+    ''')
+
+
+def _create_catalog_state(cursor):
+    """Счётчик изменений каталога: увеличивается при каждой записи."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO catalog_state (id, version) VALUES (1, 0)")
+
+
+# Текущее unix-время в SQL
+_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+def _add_names_version(cursor):
+    """
+    Отдельный счётчик удалений и переименований исполнителей, жанров и альбомов:
+    по нему кэши name→id понимают, что сохранённые id могли устареть.
+    """
+    cursor.execute("ALTER TABLE catalog_state ADD COLUMN names_version INTEGER NOT NULL DEFAULT 0")
+
+
+def bump_catalog_version(cursor, names_changed=False):
+    """
+    Увеличивает счётчик изменений каталога в текущей транзакции и запоминает время изменения.
+    names_changed=True — если удалялись или переименовывались исполнители, жанры или альбомы.
+    """
+    names = ", names_version = names_version + 1" if names_changed else ""
+    cursor.execute(
+        f"UPDATE catalog_state SET version = version + 1{names}, updated_at = {_NOW} WHERE id = 1"
+    )
+
+
+def get_names_version(cursor):
+    """Текущее значение счётчика удалений и переименований имён."""
+    return cursor.execute("SELECT names_version FROM catalog_state WHERE id = 1").fetchone()[0]
+
+
+def get_catalog_state():
+    """
+    (version, updated_at) каталога в базе, из которой идут чтения, или None,
+    если БД недоступна. updated_at — unix-время последнего изменения.
+    """
+    conn = get_read_connection()
+    if conn is None:
+        return None
+    try:
+        return tuple(conn.execute("SELECT version, updated_at FROM catalog_state WHERE id = 1").fetchone())
+    finally:
+        conn.close()
+
+
+def get_catalog_version():
+    """
+    Значение счётчика изменений каталога в той базе, из которой идут чтения
+    (при включённой реплике — в реплике), или None, если БД недоступна.
+    """
+    conn = get_read_connection()
+    if conn is None:
+        return None
+    try:
+        return conn.execute("SELECT version FROM catalog_state WHERE id = 1").fetchone()[0]
+    finally:
+        conn.close()
+
+
+# Сводные таблицы: (таблица, ключевая колонка, колонка songs).
+# Строка с нулём песен удаляется, NULL-ключи (песня без жанра/альбома) не учитываются.
+SUMMARY_TABLES = (
+    ("artist_stats", "artist_id", "artist_id"),
+    ("genre_stats", "genre_id", "genre_id"),
+    ("album_stats", "album_id", "album_id"),
+    ("year_stats", "year", "year"),
+)
+
+
+def _create_summary_tables(cursor):
+    """
+    Сводные таблицы с числом песен по исполнителям, жанрам, альбомам и годам.
+    Их ведут триггеры на songs, поэтому счётчики верны при любом способе записи
+    (add_song, импорт, удаление исполнителя и т. д.).
+    """
+    insert_body, delete_body = [], []
+    for table, key, column in SUMMARY_TABLES:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key} INTEGER PRIMARY KEY,
+                songs INTEGER NOT NULL
             )
         ''')
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_songs_idx ON {table} (songs)")
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f'''
+            INSERT INTO {table} ({key}, songs)
+            SELECT {column}, count(*) FROM songs WHERE {column} IS NOT NULL GROUP BY {column}
+        ''')
+        insert_body.append(f'''
+            INSERT INTO {table} ({key}, songs) SELECT new.{column}, 1 WHERE new.{column} IS NOT NULL
+            ON CONFLICT ({key}) DO UPDATE SET songs = songs + 1;
+        ''')
+        delete_body.append(f'''
+            UPDATE {table} SET songs = songs - 1 WHERE {key} = old.{column};
+            DELETE FROM {table} WHERE {key} = old.{column} AND songs <= 0;
+        ''')
 
-        # Таблица songs (с добавленным album_id)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS songs (
-                id INTEGER PRIMARY KEY,
-                title TEXT NOT NULL,
-                artist_id INTEGER NOT NULL,
-                genre_id INTEGER,
-                album_id INTEGER,
-                year INTEGER NOT NULL,
-                FOREIGN KEY (artist_id) REFERENCES artists(id),
-                FOREIGN KEY (genre_id) REFERENCES genres(id),
-                FOREIGN KEY (album_id) REFERENCES albums(id)
-            )
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS songs_stats_insert AFTER INSERT ON songs BEGIN {''.join(insert_body)} END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS songs_stats_delete AFTER DELETE ON songs BEGIN {''.join(delete_body)} END")
+    # При изменении колонки счётчик переносится со старого значения на новое
+    for (table, key, column), insert, delete in zip(SUMMARY_TABLES, insert_body, delete_body):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS songs_stats_update_{column} AFTER UPDATE OF {column} ON songs
+            WHEN old.{column} IS NOT new.{column} BEGIN {delete} {insert} END
         ''')
 
-        connection.commit()
+
+def _drop_triggers(cursor):
+    """Удаляет все триггеры схемы и возвращает их SQL, чтобы их можно было создать заново."""
+    triggers = cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for name, _ in triggers:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    return [sql for _, sql in triggers]
+
+
+def _recreate_triggers(cursor):
+    create_search_index(cursor)
+    _create_summary_tables(cursor)
+
+
+def _add_cascades(cursor):
+    """
+    Пересоздаёт albums и songs с ON DELETE CASCADE / SET NULL:
+    удаление исполнителя удаляет его альбомы и песни, удаление альбома — его песни,
+    удаление жанра обнуляет genre_id. Ссылки на несуществующие записи,
+    накопившиеся без проверки внешних ключей, удаляются (для жанра — обнуляются).
+    Выполняется при выключенном PRAGMA foreign_keys (см. migrate).
+    """
+    cursor.execute("DELETE FROM albums WHERE artist_id NOT IN (SELECT id FROM artists)")
+    cursor.execute('''
+        DELETE FROM songs
+        WHERE artist_id NOT IN (SELECT id FROM artists)
+           OR (album_id IS NOT NULL AND album_id NOT IN (SELECT id FROM albums))
+    ''')
+    cursor.execute(
+        "UPDATE songs SET genre_id = NULL WHERE genre_id IS NOT NULL AND genre_id NOT IN (SELECT id FROM genres)"
+    )
+
+    # Триггеры ссылаются на пересоздаваемые таблицы, и ALTER TABLE RENAME с ними не пройдёт
+    _drop_triggers(cursor)
+    cursor.execute('''
+        CREATE TABLE albums_new (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            artist_id INTEGER NOT NULL,
+            description TEXT,
+            FOREIGN KEY (artist_id) REFERENCES artists(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute("INSERT INTO albums_new (id, name, artist_id, description) SELECT id, name, artist_id, description FROM albums")
+    cursor.execute("DROP TABLE albums")
+    cursor.execute("ALTER TABLE albums_new RENAME TO albums")
+
+    cursor.execute('''
+        CREATE TABLE songs_new (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            artist_id INTEGER NOT NULL,
+            genre_id INTEGER,
+            album_id INTEGER,
+            year INTEGER NOT NULL,
+            FOREIGN KEY (artist_id) REFERENCES artists(id) ON DELETE CASCADE,
+            FOREIGN KEY (genre_id) REFERENCES genres(id) ON DELETE SET NULL,
+            FOREIGN KEY (album_id) REFERENCES albums(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO songs_new (id, title, artist_id, genre_id, album_id, year)
+        SELECT id, title, artist_id, genre_id, album_id, year FROM songs
+    ''')
+    cursor.execute("DROP TABLE songs")
+    cursor.execute("ALTER TABLE songs_new RENAME TO songs")
+
+    _add_indexes(cursor)
+    _recreate_triggers(cursor)
+    if cursor.execute("PRAGMA foreign_key_check").fetchone() is not None:
+        raise sqlite3.IntegrityError("После пересоздания таблиц остались нарушения внешних ключей")
+
+
+def truncate_catalog(cursor):
+    """
+    Быстро очищает каталог в текущей транзакции.
+    Триггеры на время очистки удаляются, чтобы DELETE без WHERE работал
+    как усечение таблицы, а не построчное удаление с обновлением индексов.
+    Соединение должно работать с выключенным PRAGMA foreign_keys.
+    """
+    triggers = _drop_triggers(cursor)
+    for table in ("songs", "albums", "artists", "genres", "songs_fts") + tuple(
+        table for table, _, _ in SUMMARY_TABLES
+    ):
+        cursor.execute(f"DELETE FROM {table}")
+    # Построчные записи журнала больше не нужны: клиентам достаточно очистить свою копию
+    reset_change_log(cursor, "clear")
+    for sql in triggers:
+        cursor.execute(sql)
+
+
+def _backup_path(name):
+    return os.path.join(BACKUP_DIR, os.path.basename(name))
+
+
+def backup_database(name=None):
+    """
+    Снимок базы через backup API SQLite (согласованная копия без остановки записи).
+    Возвращает имя файла снимка в BACKUP_DIR.
+    """
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    name = name or f"catalog-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 1000000000:09d}.db"
+    path = _backup_path(name)
+    # Копия пишется во временный файл процесса: недописанный снимок не виден
+    # в списке, а несколько воркеров не пишут в один файл одновременно.
+    # Снимок — один самодостаточный файл, без -wal/-shm рядом
+    temporary = f"{path}.{os.getpid()}.tmp"
+    copy_database(temporary, journal_mode="DELETE")
+    os.replace(temporary, path)
+    return name
+
+
+def copy_database(path, journal_mode=None):
+    """
+    Согласованная копия основной базы в path через backup API (за один шаг,
+    поэтому копирование не перезапускается из-за параллельной записи).
+    journal_mode задаёт режим журнала копии, например DELETE для реплики,
+    которую открывают только для чтения.
+    """
+    source = sqlite3.connect(DATABASE_FILE)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+        if journal_mode:
+            target.execute(f"PRAGMA journal_mode = {journal_mode}")
+    finally:
+        target.close()
+        source.close()
+
+
+def list_backups():
+    """Снимки в BACKUP_DIR (новые первыми)."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    backups = []
+    for name in sorted(os.listdir(BACKUP_DIR), reverse=True):
+        if name.endswith(".db"):
+            path = _backup_path(name)
+            backups.append({"name": name, "size": os.path.getsize(path), "created": os.path.getmtime(path)})
+    return backups
+
+
+def restore_database(name):
+    """
+    Восстанавливает каталог из снимка name поверх текущей базы.
+    Счётчики изменений продолжаются с текущих значений, чтобы кэши,
+    привязанные к версии каталога, не выдали данные из до-восстановительной базы.
+    Возвращает False, если снимка нет.
+    """
+    path = _backup_path(name)
+    if not os.path.isfile(path):
+        return False
+    target = sqlite3.connect(DATABASE_FILE)
+    source = sqlite3.connect(path)
+    try:
+        version, names_version = target.execute(
+            "SELECT version, names_version FROM catalog_state WHERE id = 1"
+        ).fetchone()
+        last_change = target.execute("SELECT coalesce(max(seq), 0) FROM changes").fetchone()[0]
+        source.backup(target)
+        migrate(target)
+        target.execute(
+            "UPDATE catalog_state SET version = max(version, ?) + 1, "
+            f"names_version = max(names_version, ?) + 1, updated_at = {_NOW}",
+            (version, names_version)
+        )
+        # Журнал снимка не описывает переход от текущего каталога: клиенты загружают его заново
+        reset_change_log(target.cursor(), "reset", last_change)
+        target.commit()
+    finally:
+        source.close()
+        target.close()
+    return True
+
+
+# Ревизии альбомов и исполнителей: (триггер, событие, тело).
+# Ревизия альбома меняется вместе с его песнями, названием, описанием и именем исполнителя,
+# ревизия исполнителя — вместе со списком его альбомов.
+REVISION_TRIGGERS = (
+    ("songs_revision_insert", "AFTER INSERT ON songs",
+     "UPDATE albums SET revision = revision + 1 WHERE id = new.album_id;"),
+    ("songs_revision_delete", "AFTER DELETE ON songs",
+     "UPDATE albums SET revision = revision + 1 WHERE id = old.album_id;"),
+    ("songs_revision_update", "AFTER UPDATE ON songs",
+     "UPDATE albums SET revision = revision + 1 WHERE id IN (old.album_id, new.album_id);"),
+    ("albums_revision_insert", "AFTER INSERT ON albums",
+     "UPDATE artists SET revision = revision + 1 WHERE id = new.artist_id;"),
+    ("albums_revision_delete", "AFTER DELETE ON albums",
+     "UPDATE artists SET revision = revision + 1 WHERE id = old.artist_id;"),
+    ("albums_revision_update", "AFTER UPDATE OF name, description, artist_id ON albums",
+     "UPDATE albums SET revision = revision + 1 WHERE id = new.id; "
+     "UPDATE artists SET revision = revision + 1 WHERE id IN (old.artist_id, new.artist_id);"),
+    ("artists_revision_update", "AFTER UPDATE OF name ON artists",
+     "UPDATE albums SET revision = revision + 1 WHERE artist_id = new.id;"),
+)
+
+
+def _add_revisions(cursor):
+    """
+    Ревизии альбомов и исполнителей и время последнего изменения каталога:
+    по ним строятся ETag и Last-Modified HTTP-ответов.
+    """
+    cursor.execute("ALTER TABLE albums ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE artists ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE catalog_state ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0")
+    cursor.execute(f"UPDATE catalog_state SET updated_at = {_NOW}")
+    for name, event, body in REVISION_TRIGGERS:
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+
+# Журнал изменений каталога: (триггер, событие, сущность, id, операция).
+# Каскадные удаления тоже попадают в журнал: действия внешних ключей вызывают триггеры.
+CHANGE_TRIGGERS = (
+    ("songs_change_insert", "AFTER INSERT ON songs", "songs", "new.id", "upsert"),
+    ("songs_change_update", "AFTER UPDATE ON songs", "songs", "new.id", "upsert"),
+    ("songs_change_delete", "AFTER DELETE ON songs", "songs", "old.id", "delete"),
+    ("albums_change_insert", "AFTER INSERT ON albums", "albums", "new.id", "upsert"),
+    ("albums_change_update", "AFTER UPDATE OF name, description, artist_id ON albums", "albums", "new.id", "upsert"),
+    ("albums_change_delete", "AFTER DELETE ON albums", "albums", "old.id", "delete"),
+    ("artists_change_insert", "AFTER INSERT ON artists", "artists", "new.id", "upsert"),
+    ("artists_change_update", "AFTER UPDATE OF name, biography ON artists", "artists", "new.id", "upsert"),
+    ("artists_change_delete", "AFTER DELETE ON artists", "artists", "old.id", "delete"),
+)
+
+
+def _create_change_log(cursor):
+    """
+    Журнал изменений для инкрементальной синхронизации клиентов (GET /changes).
+    seq растёт монотонно (AUTOINCREMENT не переиспользует номера удалённых записей).
+    Операции: upsert и delete для песен, альбомов и исполнителей, clear — каталог очищен,
+    reset — каталог заменён целиком (восстановление из снимка).
+    """
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER,
+            op TEXT NOT NULL,
+            changed_at INTEGER NOT NULL DEFAULT ({_NOW})
+        )
+    ''')
+    for name, event, entity, entity_id, op in CHANGE_TRIGGERS:
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN
+                INSERT INTO changes (entity, entity_id, op) VALUES ('{entity}', {entity_id}, '{op}');
+            END
+        ''')
+
+
+def reset_change_log(cursor, op, after=0):
+    """
+    Заменяет журнал изменений одной записью op ("clear" или "reset") для всего каталога.
+    Её номер больше всех выданных ранее и не меньше after + 1.
+    """
+    cursor.execute('''
+        INSERT INTO changes (seq, entity, op)
+        SELECT max(?, coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'changes'), 0)) + 1, 'catalog', ?
+    ''', (after, op))
+    cursor.execute("DELETE FROM changes WHERE seq < (SELECT max(seq) FROM changes)")
+
+
+def prune_change_log(cursor, keep=CHANGE_LOG_KEEP):
+    """Удаляет записи журнала изменений старше последних keep. Возвращает число удалённых."""
+    cursor.execute("DELETE FROM changes WHERE seq <= (SELECT max(seq) FROM changes) - ?", (keep,))
+    return cursor.rowcount
+
+
+# Миграции схемы: (версия, описание, функция(cursor)).
+# Новые миграции добавляются только в конец списка с очередным номером версии.
+MIGRATIONS = [
+    (1, "Таблицы artists, genres, albums и songs", _create_tables),
+    (2, "Полнотекстовый индекс songs_fts", create_search_index),
+    (3, "Уникальные имена и вторичные индексы", _add_indexes),
+    (4, "Счётчик изменений каталога", _create_catalog_state),
+    (5, "Счётчик удалений и переименований имён", _add_names_version),
+    (6, "Сводные таблицы статистики каталога", _create_summary_tables),
+    (7, "Каскадное удаление по внешним ключам", _add_cascades),
+    (8, "Ревизии альбомов и исполнителей для HTTP-кэширования", _add_revisions),
+    (9, "Журнал изменений для синхронизации клиентов", _create_change_log),
+]
+
+
+def get_schema_version(cursor):
+    """Текущая версия схемы (0 — миграции ещё не применялись)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("SELECT coalesce(max(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def migrate(connection):
+    """
+    Применяет недостающие миграции по порядку, каждую в своей транзакции.
+    Возвращает список применённых версий.
+    """
+    cursor = connection.cursor()
+    current = get_schema_version(cursor)
+    connection.commit()
+    # Пересоздание таблиц в миграциях требует выключенной проверки внешних ключей
+    foreign_keys = cursor.execute("PRAGMA foreign_keys").fetchone()[0]
+    cursor.execute("PRAGMA foreign_keys = OFF")
+    applied = []
+    try:
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            try:
+                cursor.execute("BEGIN")
+                apply(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                connection.commit()
+            except sqlite3.Error:
+                connection.rollback()
+                raise
+            print(f"Применена миграция {version}: {description}")
+            applied.append(version)
+    finally:
+        cursor.execute(f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}")
+    return applied
+
+
+def create_database(db_name):
+    """Создаёт базу данных при необходимости и приводит схему к последней версии."""
+    connection = None
+    try:
+        connection = sqlite3.connect(db_name)
+        # WAL сохраняется в файле базы: читатели не блокируют запись и наоборот
+        connection.execute("PRAGMA journal_mode = WAL")
+        migrate(connection)
         print("Таблицы artists, genres, albums и songs созданы успешно.")
     except sqlite3.Error as e:
         print(f"Ошибка при создании таблиц: {e}")
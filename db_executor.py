@@ -0,0 +1,137 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import POOL_SIZE
+
+# Количество потоков для работы с БД и длина очереди ожидающих задач
+DB_EXECUTOR_WORKERS = int(os.environ.get("MUSIC_CATALOG_DB_WORKERS", str(POOL_SIZE)))
+DB_EXECUTOR_MAX_QUEUE = int(os.environ.get("MUSIC_CATALOG_DB_MAX_QUEUE", "64"))
+
+
+class ExecutorBusyError(Exception):
+    """Очередь задач к БД переполнена, новую задачу принять нельзя."""
+
+
+class DBExecutor:
+    """
+    Выделенный пул потоков для синхронных функций music_catalog.
+    Позволяет async-маршрутам не блокировать цикл событий,
+    ограничивает очередь и собирает метрики ожидания.
+    """
+
+    def __init__(self, workers=DB_EXECUTOR_WORKERS, max_queue=DB_EXECUTOR_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._started = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+        # Ожидающие задачи (ключ — объект задачи, значение — момент постановки)
+        # в порядке очереди; отменённая задача удаляется из любого места
+        self._pending = {}
+
+    def submit(self, func, *args, **kwargs):
+        """Ставит функцию в очередь и возвращает concurrent.futures.Future."""
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorBusyError("Очередь запросов к базе данных переполнена")
+            self._queued += 1
+            submitted_at = time.perf_counter()
+            entry = object()
+            self._pending[entry] = submitted_at
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="db")
+            executor = self._executor
+
+        def task():
+            wait = time.perf_counter() - submitted_at
+            with self._lock:
+                self._dequeue(entry)
+                self._running += 1
+                self._started += 1
+                self._wait_total += wait
+                self._wait_last = wait
+                if wait > self._wait_max:
+                    self._wait_max = wait
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        def done(future):
+            # Задачу, отменённую в очереди (клиент отключился), пул не запустит
+            if future.cancelled():
+                with self._lock:
+                    self._dequeue(entry)
+
+        try:
+            future = executor.submit(task)
+        except RuntimeError:
+            with self._lock:
+                self._dequeue(entry)
+            raise
+        future.add_done_callback(done)
+        return future
+
+    def _dequeue(self, entry):
+        """Убирает задачу из очереди (под self._lock); повторный вызов ничего не делает."""
+        if self._pending.pop(entry, None) is not None:
+            self._queued -= 1
+
+    def _oldest_wait(self):
+        if not self._pending:
+            return 0.0
+        return time.perf_counter() - next(iter(self._pending.values()))
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет синхронную функцию в пуле потоков и ожидает результат."""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def queue_wait(self):
+        """Сколько секунд ждёт самая старая задача в очереди (0, если очередь пуста)."""
+        with self._lock:
+            return self._oldest_wait()
+
+    def stats(self):
+        """Текущие метрики: глубина очереди, занятые потоки, время ожидания."""
+        with self._lock:
+            started = self._started
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "wait_time_avg": self._wait_total / started if started else 0.0,
+                "wait_time_max": self._wait_max,
+                "wait_time_last": self._wait_last,
+                "wait_time_current": self._oldest_wait(),
+            }
+
+    def shutdown(self):
+        """Дожидается текущих задач; при следующем submit() пул создаётся заново."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+db_executor = DBExecutor()
+
+
+async def run_in_db(func, *args, **kwargs):
+    """Короткая форма для db_executor.run()."""
+    return await db_executor.run(func, *args, **kwargs)
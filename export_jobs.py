@@ -0,0 +1,254 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import create_redis_client
+from database import get_catalog_version
+from exporter import WRITERS, count_export_rows, export_to_file
+
+EXPORT_JOB_WORKERS = int(os.environ.get("MUSIC_CATALOG_EXPORT_WORKERS", "2"))
+# Каталог готовых файлов. С бэкендом "redis" задачу может выполнить один воркер,
+# а скачать файл — другой, поэтому каталог должен быть общим для всех воркеров
+# и задаваться явно (без него задачи хранятся в памяти процесса)
+SHARED_EXPORT_DIR = os.environ.get("MUSIC_CATALOG_EXPORT_DIR", "")
+EXPORT_DIR = SHARED_EXPORT_DIR or os.path.join(tempfile.gettempdir(), "music_catalog_exports")
+# "local" — задачи хранятся в памяти процесса, "redis" — в Redis (видны всем воркерам)
+EXPORT_JOB_BACKEND = os.environ.get("MUSIC_CATALOG_EXPORT_JOB_BACKEND", "local")
+# Сколько готовых файлов хранится для повторной выдачи
+MAX_CACHED_ARTIFACTS = 32
+# Сколько секунд хранится информация о задаче в Redis
+EXPORT_JOB_TTL = 24 * 60 * 60
+# Через сколько секунд без отметки от воркера задача в очереди или в работе считается
+# брошенной (воркер упал): её статус становится failed, а повторный запрос ставит экспорт заново
+EXPORT_JOB_LEASE = float(os.environ.get("MUSIC_CATALOG_EXPORT_JOB_LEASE", "60"))
+
+
+class LocalJobStore:
+    """Задачи экспорта и индекс готовых файлов в памяти процесса."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._artifacts = {}
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+
+    def load(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_artifact(self, cache_key):
+        with self._lock:
+            return self._artifacts.get(cache_key)
+
+    def set_artifact(self, cache_key, job_id):
+        with self._lock:
+            self._artifacts[cache_key] = job_id
+
+    def delete_artifact(self, cache_key):
+        with self._lock:
+            self._artifacts.pop(cache_key, None)
+
+
+class RedisJobStore:
+    """Задачи экспорта в Redis: статус можно запросить у любого воркера."""
+
+    prefix = "music_catalog:export:"
+
+    def __init__(self, client):
+        self.client = client
+
+    def save(self, job):
+        self.client.set(self.prefix + "job:" + job["id"], json.dumps(job), ex=EXPORT_JOB_TTL)
+
+    def load(self, job_id):
+        raw = self.client.get(self.prefix + "job:" + job_id)
+        return json.loads(raw) if raw else None
+
+    def get_artifact(self, cache_key):
+        job_id = self.client.get(self.prefix + "artifact:" + cache_key)
+        return job_id.decode("utf-8") if isinstance(job_id, bytes) else job_id
+
+    def set_artifact(self, cache_key, job_id):
+        self.client.set(self.prefix + "artifact:" + cache_key, job_id, ex=EXPORT_JOB_TTL)
+
+    def delete_artifact(self, cache_key):
+        self.client.delete(self.prefix + "artifact:" + cache_key)
+
+
+class ExportJobManager:
+    """
+    Фоновая генерация экспорта.
+    Задача создаётся submit(), выполняется в пуле потоков, а готовый файл
+    переиспользуется для одинаковых запросов, пока не изменился счётчик
+    изменений каталога. Пока задача в очереди или в работе, фоновый поток
+    раз в треть EXPORT_JOB_LEASE обновляет в ней heartbeat_at.
+    """
+
+    def __init__(self, store=None, workers=EXPORT_JOB_WORKERS, directory=EXPORT_DIR):
+        self.store = store or LocalJobStore()
+        self.workers = workers
+        self.directory = directory
+        self._executor = None
+        self._lock = threading.Lock()
+        self._finished = deque()
+        # Задачи этого процесса в очереди или в работе; сохраняются под _save_lock,
+        # чтобы отметка heartbeat не затёрла более новый статус
+        self._active = {}
+        self._save_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat = None
+
+    def _cache_key(self, fmt, artist, genre, year, version):
+        return json.dumps([fmt, artist, genre, year, version], ensure_ascii=False)
+
+    def submit(self, fmt, artist=None, genre=None, year=None):
+        """Создаёт задачу экспорта или возвращает уже существующую для тех же данных."""
+        if fmt not in WRITERS:
+            raise ValueError(f"Неподдерживаемый формат экспорта: {fmt}")
+        version = get_catalog_version()
+        cache_key = self._cache_key(fmt, artist, genre, year, version)
+
+        with self._lock:
+            job_id = self.store.get_artifact(cache_key)
+            job = self.store.load(job_id) if job_id else None
+            if job and self._abandoned(job):
+                self._fail_abandoned(job)
+            elif job and (job["status"] in ("queued", "running") or self._artifact_exists(job)):
+                return job
+
+            job = {
+                "id": uuid.uuid4().hex,
+                "format": fmt,
+                "filters": {"artist": artist, "genre": genre, "year": year},
+                "catalog_version": version,
+                "status": "queued",
+                "progress": 0,
+                "total": None,
+                "error": None,
+                "path": None,
+                "created_at": time.time(),
+                "heartbeat_at": time.time(),
+                "finished_at": None,
+            }
+            with self._save_lock:
+                self._active[job["id"]] = job
+                self.store.save(job)
+            self.store.set_artifact(cache_key, job["id"])
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export")
+                self._stopped.clear()
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="export-heartbeat", daemon=True)
+                self._heartbeat.start()
+            self._executor.submit(self._run, job, cache_key)
+        return job
+
+    def get(self, job_id):
+        job = self.store.load(job_id)
+        if job and self._abandoned(job):
+            self._fail_abandoned(job)
+        return job
+
+    def _abandoned(self, job):
+        """Чужая задача в очереди или в работе, от воркера которой давно не было отметок."""
+        heartbeat = job.get("heartbeat_at") or job["created_at"]
+        return (job["status"] in ("queued", "running") and job["id"] not in self._active
+                and time.time() - heartbeat > EXPORT_JOB_LEASE)
+
+    def _fail_abandoned(self, job):
+        job.update(status="failed", error="Воркер, выполнявший экспорт, перестал отвечать, запустите экспорт заново",
+                   finished_at=time.time())
+        self.store.save(job)
+
+    def _save(self, job):
+        with self._save_lock:
+            job["heartbeat_at"] = time.time()
+            self.store.save(job)
+
+    def _heartbeat_loop(self):
+        while not self._stopped.wait(EXPORT_JOB_LEASE / 3):
+            with self._save_lock:
+                try:
+                    for job in self._active.values():
+                        job["heartbeat_at"] = time.time()
+                        self.store.save(job)
+                except Exception as e:
+                    print(f"Ошибка при обновлении задач экспорта: {e}")
+
+    @staticmethod
+    def _artifact_exists(job):
+        return job["status"] == "done" and job["path"] and os.path.exists(job["path"])
+
+    def _run(self, job, cache_key):
+        filters = job["filters"]
+        path = os.path.join(self.directory, f"{job['id']}.{job['format']}")
+        partial = path + ".part"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            job.update(status="running", total=count_export_rows(**filters))
+            self._save(job)
+
+            def progress(count):
+                job["progress"] = count
+                self._save(job)
+
+            count = export_to_file(job["format"], partial, progress=progress, **filters)
+            os.replace(partial, path)
+            job.update(status="done", progress=count, path=path)
+            self._remember(path)
+        except Exception as e:
+            print(f"Ошибка при экспорте {job['id']}: {e}")
+            job.update(status="failed", error=str(e))
+            self.store.delete_artifact(cache_key)
+            if os.path.exists(partial):
+                os.remove(partial)
+        job["finished_at"] = time.time()
+        with self._save_lock:
+            self._active.pop(job["id"], None)
+            self.store.save(job)
+
+    def _remember(self, path):
+        """Удаляет самые старые готовые файлы сверх MAX_CACHED_ARTIFACTS."""
+        with self._lock:
+            self._finished.append(path)
+            while len(self._finished) > MAX_CACHED_ARTIFACTS:
+                old_path = self._finished.popleft()
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+            self._stopped.set()
+
+
+def public_job(job):
+    """Описание задачи для клиента (без пути к файлу на сервере)."""
+    return {key: value for key, value in job.items() if key != "path"}
+
+
+def _create_store():
+    if EXPORT_JOB_BACKEND == "redis":
+        if not SHARED_EXPORT_DIR:
+            # Файл из временного каталога одного воркера не скачать через другой
+            print("MUSIC_CATALOG_EXPORT_DIR не задан: задачи экспорта хранятся в памяти процесса. "
+                  "Для бэкенда redis укажи каталог, общий для всех воркеров")
+            return LocalJobStore()
+        client = create_redis_client()
+        if client is not None:
+            return RedisJobStore(client)
+        print("Redis не настроен, задачи экспорта хранятся в памяти процесса")
+    return LocalJobStore()
+
+
+export_jobs = ExportJobManager(_create_store())
@@ -0,0 +1,295 @@
+import csv
+import io
+import json
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from database import get_read_connection
+
+# Сколько строк читается из курсора и отдаётся клиенту за один раз
+EXPORT_CHUNK_SIZE = 1000
+
+EXPORT_COLUMNS = ("title", "artist", "year", "album", "genre")
+EXPORT_HEADERS = ("Название", "Исполнитель", "Год", "Альбом", "Жанр")
+
+# Символы, недопустимые в XML 1.0 (управляющие, кроме табуляции и переводов строк)
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _export_filters(artist=None, genre=None, year=None):
+    """Условие WHERE и параметры для фильтра экспорта."""
+    conditions = []
+    params = []
+    if artist:
+        conditions.append("ar.name = ?")
+        params.append(artist)
+    if genre:
+        conditions.append("g.name = ?")
+        params.append(genre)
+    if year is not None:
+        conditions.append("s.year = ?")
+        params.append(year)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+def count_export_rows(artist=None, genre=None, year=None):
+    """Сколько песен попадёт в экспорт с данным фильтром."""
+    where, params = _export_filters(artist, genre, year)
+    conn = get_read_connection()
+    if conn is None:
+        raise RuntimeError("Не удалось подключиться к базе данных")
+    try:
+        return conn.execute(f'''
+            SELECT count(*)
+            FROM songs s
+            LEFT JOIN artists ar ON s.artist_id = ar.id
+            LEFT JOIN genres g ON s.genre_id = g.id
+            {where}
+        ''', params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def iter_export_rows(artist=None, genre=None, year=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Потоково выдаёт строки каталога (title, artist, year, album, genre),
+    читая курсор порциями через fetchmany. Соединение возвращается в пул,
+    когда генератор исчерпан или закрыт.
+    """
+    where, params = _export_filters(artist, genre, year)
+
+    conn = get_read_connection()
+    if conn is None:
+        raise RuntimeError("Не удалось подключиться к базе данных")
+    try:
+        cursor = conn.execute(f'''
+            SELECT
+                s.title, ar.name as artist, s.year,
+                al.name as album, g.name as genre
+            FROM songs s
+            LEFT JOIN artists ar ON s.artist_id = ar.id
+            LEFT JOIN albums al ON s.album_id = al.id
+            LEFT JOIN genres g ON s.genre_id = g.id
+            {where}
+            ORDER BY ar.name, s.year
+        ''', params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+    finally:
+        conn.close()
+
+
+def stream_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """CSV с заголовком, порциями по chunk_size строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """NDJSON: по одному объекту песни в строке, порциями по chunk_size строк."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines.clear()
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _xml_text(value):
+    if value is None:
+        return "—"
+    return escape(_INVALID_XML_CHARS.sub("", str(value)))
+
+
+_DOCX_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>'''
+
+_DOCX_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>'''
+
+_DOCX_DOCUMENT_START = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>
+<w:p><w:pPr><w:outlineLvl w:val="0"/></w:pPr><w:r><w:rPr><w:b/><w:sz w:val="32"/></w:rPr><w:t>Каталог песен</w:t></w:r></w:p>
+<w:tbl><w:tblPr><w:tblW w:w="0" w:type="auto"/><w:tblBorders>
+<w:top w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+<w:left w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+<w:bottom w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+<w:right w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+<w:insideH w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+<w:insideV w:val="single" w:sz="4" w:space="0" w:color="000000"/>
+</w:tblBorders></w:tblPr>
+'''
+
+_DOCX_DOCUMENT_END = '</w:tbl><w:p/><w:sectPr/></w:body></w:document>'
+
+
+def _docx_row(values, bold=False):
+    run_props = "<w:rPr><w:b/></w:rPr>" if bold else ""
+    cells = "".join(
+        f'<w:tc><w:p><w:r>{run_props}<w:t xml:space="preserve">{_xml_text(value)}</w:t></w:r></w:p></w:tc>'
+        for value in values
+    )
+    return f"<w:tr>{cells}</w:tr>"
+
+
+def write_docx(rows, fileobj):
+    """
+    Пишет DOCX с таблицей каталога напрямую в XML, без объектной модели python-docx.
+    Документ формируется потоково внутри zip-архива. Возвращает число строк.
+    """
+    count = 0
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", _DOCX_CONTENT_TYPES)
+        package.writestr("_rels/.rels", _DOCX_RELS)
+        with package.open("word/document.xml", "w") as document:
+            document.write(_DOCX_DOCUMENT_START.encode("utf-8"))
+            document.write(_docx_row(EXPORT_HEADERS, bold=True).encode("utf-8"))
+            chunk = []
+            for row in rows:
+                chunk.append(_docx_row(row))
+                count += 1
+                if len(chunk) >= EXPORT_CHUNK_SIZE:
+                    document.write("".join(chunk).encode("utf-8"))
+                    chunk.clear()
+            document.write("".join(chunk).encode("utf-8"))
+            document.write(_DOCX_DOCUMENT_END.encode("utf-8"))
+    return count
+
+
+_XLSX_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>'''
+
+_XLSX_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+_XLSX_WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Песни" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+_XLSX_WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>'''
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, int):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            cells.append(f'<c t="inlineStr"><is><t>{_xml_text(value)}</t></is></c>')
+    return f"<row>{''.join(cells)}</row>"
+
+
+def write_xlsx(rows, fileobj):
+    """Пишет XLSX (один лист, строки inline) потоково внутри zip-архива. Возвращает число строк."""
+    count = 0
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", _XLSX_CONTENT_TYPES)
+        package.writestr("_rels/.rels", _XLSX_RELS)
+        package.writestr("xl/workbook.xml", _XLSX_WORKBOOK)
+        package.writestr("xl/_rels/workbook.xml.rels", _XLSX_WORKBOOK_RELS)
+        with package.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(EXPORT_HEADERS).encode("utf-8"))
+            chunk = []
+            for row in rows:
+                chunk.append(_xlsx_row(row))
+                count += 1
+                if len(chunk) >= EXPORT_CHUNK_SIZE:
+                    sheet.write("".join(chunk).encode("utf-8"))
+                    chunk.clear()
+            sheet.write("".join(chunk).encode("utf-8"))
+            sheet.write(b"</sheetData></worksheet>")
+    return count
+
+
+class _CountingRows:
+    """Итератор-обёртка, считающий выданные строки."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self._rows)
+        self.count += 1
+        return row
+
+
+def _write_text_stream(chunks_factory):
+    def writer(rows, fileobj):
+        counted = _CountingRows(rows)
+        for chunk in chunks_factory(counted):
+            fileobj.write(chunk.encode("utf-8"))
+        return counted.count
+    return writer
+
+
+write_csv = _write_text_stream(stream_csv)
+write_ndjson = _write_text_stream(stream_ndjson)
+
+
+WRITERS = {
+    "csv": (write_csv, "text/csv; charset=utf-8"),
+    "ndjson": (write_ndjson, "application/x-ndjson"),
+    "docx": (write_docx, "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "xlsx": (write_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def _report_progress(rows, progress):
+    for count, row in enumerate(rows, start=1):
+        yield row
+        if count % EXPORT_CHUNK_SIZE == 0:
+            progress(count)
+
+
+def export_to_file(fmt, filename, artist=None, genre=None, year=None, progress=None):
+    """
+    Экспортирует каталог в файл одного из форматов WRITERS. Возвращает число песен.
+    progress(число строк) вызывается после каждой порции строк.
+    """
+    writer, _ = WRITERS[fmt]
+    rows = iter_export_rows(artist, genre, year)
+    if progress is not None:
+        rows = _report_progress(rows, progress)
+    with open(filename, "wb") as f:
+        return writer(rows, f)
@@ -0,0 +1,235 @@
+import asyncio
+import email.utils
+import gzip
+import os
+import re
+import threading
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response
+
+import cache
+import serialization
+from database import get_catalog_state
+from db_executor import run_in_db
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него ответы сжимаются только gzip
+    brotli = None
+
+# Сколько секунд процесс доверяет запомненной версии каталога. Записи в этом
+# процессе сбрасывают её сразу, записи других воркеров видны не позже чем через это время
+VERSION_TTL = float(os.environ.get("MUSIC_CATALOG_VERSION_TTL", "1"))
+# max-age в Cache-Control: сколько клиент или CDN может не перепроверять ответ
+HTTP_MAX_AGE = int(os.environ.get("MUSIC_CATALOG_HTTP_MAX_AGE", "0"))
+# Ответы меньше этого размера (байт) не сжимаются
+COMPRESS_MIN_SIZE = int(os.environ.get("MUSIC_CATALOG_COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Тела больше этого размера сжимаются в отдельном потоке, чтобы не блокировать цикл событий
+COMPRESS_THREAD_MIN_SIZE = 256 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+_ETAG = re.compile(r'(?:W/)?"([^"]*)"')
+
+
+class CatalogVersion:
+    """
+    Версия каталога и время последнего изменения, запомненные в процессе на ttl секунд,
+    чтобы проверка If-None-Match для неизменившегося каталога не обращалась к SQLite.
+    """
+
+    def __init__(self, ttl=VERSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None
+        self._loaded_at = 0.0
+        self._generation = 0
+
+    def cached(self):
+        with self._lock:
+            if self._state is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._state
+        return None
+
+    def load(self):
+        with self._lock:
+            generation = self._generation
+        state = get_catalog_state()
+        with self._lock:
+            # Если во время чтения каталог изменился, прочитанное значение уже могло устареть
+            if state is not None and generation == self._generation:
+                self._state, self._loaded_at = state, time.monotonic()
+        return state
+
+    def expire(self):
+        with self._lock:
+            self._state = None
+            self._generation += 1
+
+
+catalog_version = CatalogVersion()
+cache.on_invalidate(catalog_version.expire)
+
+
+def _etag(version, stamp):
+    # Слабый ETag: сжатое и несжатое представления отличаются побайтно
+    return f'W/"{version}-{stamp}"' if stamp is not None else f'W/"{version}"'
+
+
+def _parse_etags(header):
+    """[(версия каталога, отметка сущности или None), ...] из If-None-Match."""
+    tags = []
+    for value in _ETAG.findall(header):
+        version, _, stamp = value.partition("-")
+        tags.append((version, stamp or None))
+    return tags
+
+
+def _since(header):
+    try:
+        return email.utils.parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def validators(version, updated_at, stamp=None):
+    """Заголовки ETag, Last-Modified и Cache-Control для ответа на данной версии каталога."""
+    return {
+        "ETag": _etag(version, stamp),
+        "Last-Modified": email.utils.formatdate(updated_at, usegmt=True),
+        "Cache-Control": f"public, max-age={HTTP_MAX_AGE}, must-revalidate",
+    }
+
+
+async def conditional(request, stamp_loader=None, *args):
+    """
+    Условный GET по версии каталога и (если задан stamp_loader) по отметке версии сущности.
+    Возвращает (headers, not_modified): заголовки валидаторов для обычного ответа
+    и готовый ответ 304, если копия клиента актуальна (иначе None).
+
+    Если версия каталога в ETag клиента совпадает с текущей, ответ 304 отдаётся
+    без запросов к SQLite. Иначе stamp_loader(*args) проверяет, не изменилась ли
+    сама сущность (альбом, исполнитель), пока менялся остальной каталог.
+    """
+    state = catalog_version.cached() or await run_in_db(catalog_version.load)
+    if state is None:
+        return {}, None
+    version, updated_at = state
+    if_none_match = request.headers.get("if-none-match")
+    stamp = None
+    if if_none_match:
+        tags = _parse_etags(if_none_match)
+        for tag_version, tag_stamp in tags:
+            if tag_version == str(version):
+                return {}, Response(status_code=304, headers=validators(version, updated_at, tag_stamp))
+        if stamp_loader is not None:
+            stamp = await run_in_db(stamp_loader, *args)
+            if stamp is not None and any(tag_stamp == stamp for _, tag_stamp in tags):
+                return {}, Response(status_code=304, headers=validators(version, updated_at, stamp))
+        not_modified = False
+    else:
+        # If-Modified-Since учитывается, только если клиент не прислал ETag
+        since = _since(request.headers.get("if-modified-since"))
+        not_modified = since is not None and updated_at <= since
+    if stamp_loader is not None and stamp is None:
+        stamp = await run_in_db(stamp_loader, *args)
+    headers = validators(version, updated_at, stamp)
+    if not_modified:
+        return {}, Response(status_code=304, headers=headers)
+    return headers, None
+
+
+class CatalogJSONResponse(JSONResponse):
+    """
+    JSON-ответ, сериализуемый serialization.dumps (orjson, если установлен).
+    Эндпоинты с большими списками возвращают его сами: так FastAPI не обходит
+    каждую строку через jsonable_encoder, а кортежи строк SQLite пишутся как массивы.
+    """
+
+    def render(self, content):
+        return serialization.dumps(content)
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 1.0
+        if quality > 0:  # q=0 — кодировка запрещена
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(header):
+    """br (если установлен brotli), иначе gzip — из того, что принимает клиент."""
+    accepted = _accepted_encodings(header or "")
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Сжимает большие JSON- и текстовые ответы (brotli или gzip по Accept-Encoding).
+    Потоковые ответы и файлы (экспорт) пропускаются как есть.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            content_type = headers.get("content-type", "")
+            if content_type.startswith(COMPRESSIBLE_TYPES):
+                headers.add_vary_header("Accept-Encoding")
+            body = message.get("body", b"")
+            if (
+                encoding is not None
+                and message["type"] == "http.response.body"
+                and not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                if len(body) >= COMPRESS_THREAD_MIN_SIZE:
+                    body = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                message = {**message, "body": body}
+            initial, start = start, None
+            await send(initial)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
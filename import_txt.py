@@ -0,0 +1,44 @@
+"""
+Загрузка каталога из legacy TXT-файлов (поля через обратный апостроф).
+
+    python import_txt.py --dry-run
+    python import_txt.py --checkpoint import.checkpoint.json --workers 4
+
+Файлы читаются кусками (MUSIC_CATALOG_IMPORT_CHUNK_BYTES), разбираются в пуле
+процессов, и каждый кусок фиксируется своей транзакцией. Ошибочные строки
+перечисляются с номерами и не прерывают загрузку. С --checkpoint прерванный
+импорт при повторном запуске продолжается с последнего зафиксированного куска.
+"""
+import argparse
+import json
+
+from database import DATABASE_FILE, create_database
+from importer import TXT_IMPORT_WORKERS
+from music_catalog import populate_database_from_txt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artists", default="Artists.txt")
+    parser.add_argument("--genres", default="Genres.txt")
+    parser.add_argument("--albums", default="albums.txt")
+    parser.add_argument("--songs", default="Songs.txt")
+    parser.add_argument("--checkpoint", help="файл контрольной точки для возобновления импорта")
+    parser.add_argument("--dry-run", action="store_true", help="только проверить файлы, ничего не записывая")
+    parser.add_argument(
+        "--workers", type=int, default=TXT_IMPORT_WORKERS,
+        help="процессов для разбора файлов (1 — без пула процессов)"
+    )
+    args = parser.parse_args()
+
+    if not args.dry_run:
+        create_database(DATABASE_FILE)
+    report = populate_database_from_txt(
+        args.artists, args.genres, args.songs, args.albums,
+        dry_run=args.dry_run, checkpoint=args.checkpoint, workers=args.workers
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
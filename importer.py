@@ -0,0 +1,524 @@
+import csv
+import json
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from database import get_db_connection, bump_catalog_version, is_busy_error, retry_busy
+from cache import invalidate_all
+
+# Сколько строк записывается одной транзакцией
+IMPORT_BATCH_SIZE = 5000
+# Сколько ошибок подробно возвращается в отчёте (считаются все)
+MAX_REPORTED_ERRORS = 1000
+
+class ImportReport:
+    """Итоги импорта: сколько строк записано, сколько отклонено и почему."""
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        # Проверка без записи: imported — сколько строк было бы записано
+        self.dry_run = False
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self):
+        result = {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+        if self.dry_run:
+            result["dry_run"] = True
+        return result
+
+
+def parse_csv(stream):
+    """
+    Читает CSV с заголовком artist,title,genre,album,year.
+    Выдаёт (номер строки, словарь полей, текст ошибки или None).
+    """
+    reader = csv.DictReader(stream)
+    missing = {"artist", "title"} - set(reader.fieldnames or ())
+    if missing:
+        yield 1, None, f"В заголовке CSV нет колонок: {', '.join(sorted(missing))}"
+        return
+    for row in reader:
+        yield reader.line_num, row, None
+
+
+def parse_jsonl(stream):
+    """
+    Читает JSON Lines: по одному объекту песни в строке.
+    Выдаёт (номер строки, словарь полей, текст ошибки или None).
+    """
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"Некорректный JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, "Ожидается JSON-объект"
+            continue
+        yield line_no, row, None
+
+
+PARSERS = {"csv": parse_csv, "jsonl": parse_jsonl}
+
+
+def _parse_year(value):
+    """Год как в add_song: пустое значение — 0, нечисловое — ошибка строки."""
+    if value is None or value == "":
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Некорректный год: {value!r}") from None
+
+
+def _load_ids(cursor):
+    """Словари имя → id для исполнителей, жанров и альбомов."""
+    cursor.execute("SELECT name, id FROM artists")
+    artists = {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.execute("SELECT name, id FROM genres")
+    genres = {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.execute("SELECT name, artist_id, id FROM albums")
+    albums = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+    return artists, genres, albums
+
+
+def import_songs(rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Массово добавляет песни из итератора (номер строки, поля, ошибка разбора).
+    Имена исполнителей, жанров и альбомов разрешаются в id через словари в памяти,
+    песни пишутся executemany пачками по batch_size. Каждая пачка — одна транзакция
+    вместе с новыми именами: прерванная SQLITE_BUSY, она повторяется целиком.
+    Ошибочные строки попадают в отчёт и не прерывают импорт.
+    """
+    report = ImportReport()
+    conn = get_db_connection()
+    if conn is None:
+        report.error(0, "Не удалось подключиться к базе данных")
+        return report.as_dict()
+
+    cursor = conn.cursor()
+    ids = list(_load_ids(cursor))
+    # Проверенные строки пачки: (номер строки, название, исполнитель, жанр, альбом, год)
+    batch = []
+
+    def resolve(names, key, insert_sql, select_sql, params):
+        if key not in names:
+            row = cursor.execute(insert_sql, params).fetchone()
+            if row is None:
+                # Имя успел добавить поток записи после _load_ids: ON CONFLICT DO NOTHING ничего не вернул
+                row = cursor.execute(select_sql, params).fetchone()
+            names[key] = row[0]
+        return names[key]
+
+    def write_batch():
+        """Записывает пачку; возвращает (сколько песен записано, ошибки строк)."""
+        artists, genres, albums = ids
+        songs, errors = [], []
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for line, title, artist_name, genre_name, album_name, year in batch:
+                try:
+                    artist_id = resolve(
+                        artists, artist_name,
+                        "INSERT INTO artists (name) VALUES (?) ON CONFLICT (name) DO NOTHING RETURNING id",
+                        "SELECT id FROM artists WHERE name = ?", (artist_name,)
+                    )
+                    genre_id = resolve(
+                        genres, genre_name,
+                        "INSERT INTO genres (name) VALUES (?) ON CONFLICT (name) DO NOTHING RETURNING id",
+                        "SELECT id FROM genres WHERE name = ?", (genre_name,)
+                    ) if genre_name else None
+                    album_id = resolve(
+                        albums, (album_name, artist_id),
+                        "INSERT INTO albums (name, artist_id) VALUES (?, ?) "
+                        "ON CONFLICT (name, artist_id) DO NOTHING RETURNING id",
+                        "SELECT id FROM albums WHERE name = ? AND artist_id = ?", (album_name, artist_id)
+                    ) if album_name else None
+                except sqlite3.OperationalError as e:
+                    if is_busy_error(e):
+                        raise
+                    errors.append((line, f"Ошибка записи в БД: {e}"))
+                    continue
+                except sqlite3.Error as e:
+                    errors.append((line, f"Ошибка записи в БД: {e}"))
+                    continue
+                songs.append((title, artist_id, genre_id, album_id, year))
+            cursor.executemany(
+                "INSERT INTO songs (title, artist_id, genre_id, album_id, year) VALUES (?, ?, ?, ?, ?)",
+                songs
+            )
+            written = cursor.rowcount if songs else 0
+            bump_catalog_version(cursor)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            # Откат отменил и новых исполнителей/жанры/альбомы из словарей
+            ids[:] = _load_ids(cursor)
+            raise
+        return written, errors
+
+    def flush():
+        if not batch:
+            return
+        try:
+            written, errors = retry_busy(write_batch)
+            report.imported += written
+            for line, message in errors:
+                report.error(line, message)
+        except sqlite3.Error as e:
+            for line, *_ in batch:
+                report.error(line, f"Ошибка записи в БД: {e}")
+        batch.clear()
+
+    try:
+        for line, row, parse_error in rows:
+            if parse_error:
+                report.error(line, parse_error)
+                continue
+            try:
+                artist_name = str(row.get("artist") or "").strip()
+                title = str(row.get("title") or "").strip()
+                if not artist_name or not title:
+                    raise ValueError("Не указан исполнитель или название песни")
+                year = _parse_year(row.get("year"))
+            except ValueError as e:
+                report.error(line, str(e))
+                continue
+            genre_name = str(row.get("genre") or "").strip()
+            album_name = str(row.get("album") or "").strip()
+            batch.append((line, title, artist_name, genre_name, album_name, year))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    finally:
+        conn.close()
+        if report.imported:
+            invalidate_all()
+    return report.as_dict()
+
+
+def import_songs_file(stream, fmt, batch_size=IMPORT_BATCH_SIZE):
+    """Импорт песен из текстового потока в формате "csv" или "jsonl"."""
+    parser = PARSERS.get(fmt)
+    if parser is None:
+        raise ValueError(f"Неизвестный формат импорта: {fmt}")
+    return import_songs(parser(stream), batch_size)
+
+
+# Формат legacy TXT-файлов: поля через обратный апостроф, первая колонка — id
+TXT_TABLES = (
+    ("artists", ("id", "name", "biography")),
+    ("genres", ("id", "name", "description")),
+    ("albums", ("id", "name", "artist_id", "description")),
+    ("songs", ("id", "title", "artist_id", "genre_id", "album_id", "year")),
+)
+# Что допустимо в каждой колонке: "id" — целое число, "ref" — целое или пусто (NULL),
+# "year" — целое или пусто (0), "name" — непустой текст, "text" — любой текст
+TXT_COLUMN_KINDS = {
+    "artists": ("id", "name", "text"),
+    "genres": ("id", "name", "text"),
+    "albums": ("id", "name", "id", "text"),
+    "songs": ("id", "name", "id", "ref", "ref", "year"),
+}
+# Колонка со свободным текстом: лишние обратные апострофы в строке считаются её частью
+TXT_TEXT_COLUMN = {"artists": 2, "genres": 2, "albums": 3, "songs": 1}
+
+# Сколько байт TXT-файла разбирается одним заданием и фиксируется одной транзакцией
+TXT_CHUNK_BYTES = int(os.environ.get("MUSIC_CATALOG_IMPORT_CHUNK_BYTES", str(4 * 1024 * 1024)))
+# Процессов для разбора TXT-файлов; 1 — разбор в текущем процессе
+TXT_IMPORT_WORKERS = int(os.environ.get("MUSIC_CATALOG_IMPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Сколько кусков может быть прочитано и разобрано впрок, пока пишутся предыдущие
+TXT_PARSE_AHEAD = int(os.environ.get("MUSIC_CATALOG_IMPORT_PARSE_AHEAD", "8"))
+
+
+def _txt_value(kind, value):
+    if kind == "text":
+        return value
+    if kind == "name":
+        if not value.strip():
+            raise ValueError("пустое значение")
+        return value
+    if value == "" and kind in ("ref", "year"):
+        return None if kind == "ref" else 0
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"ожидается целое число, получено {value!r}") from None
+
+
+def parse_txt_chunk(table, data, first_line, source):
+    """
+    Разбирает кусок TXT-файла table (bytes из целых строк), начинающийся со строки first_line.
+    Возвращает (строки для INSERT, их номера в файле, ошибки [(место "файл:строка", текст), ...]).
+    Выполняется в процессах пула, поэтому ничего не знает о базе данных.
+    """
+    columns = dict(TXT_TABLES)[table]
+    kinds = TXT_COLUMN_KINDS[table]
+    text_column = TXT_TEXT_COLUMN[table]
+    if first_line == 1 and data.startswith(b"\xef\xbb\xbf"):
+        data = data[3:]  # BOM в начале файла
+    rows = []
+    lines = []
+    errors = []
+    for line_no, raw in enumerate(data.split(b"\n"), start=first_line):
+        try:
+            line = raw.decode("utf-8").rstrip("\r")
+        except UnicodeDecodeError as e:
+            errors.append((f"{source}:{line_no}", f"Некорректная кодировка UTF-8: {e.reason}"))
+            continue
+        if not line.strip():
+            continue
+        values = line.split("`")
+        extra = len(values) - len(columns)
+        if extra < 0:
+            errors.append((f"{source}:{line_no}", f"Ожидалось полей: {len(columns)}, получено: {len(values)}"))
+            continue
+        if extra:
+            values[text_column:text_column + extra + 1] = ["`".join(values[text_column:text_column + extra + 1])]
+        try:
+            row = []
+            for column, kind, value in zip(columns, kinds, values):
+                try:
+                    row.append(_txt_value(kind, value))
+                except ValueError as e:
+                    raise ValueError(f"Колонка {column}: {e}") from None
+        except ValueError as e:
+            errors.append((f"{source}:{line_no}", str(e)))
+            continue
+        rows.append(row)
+        lines.append(line_no)
+    return rows, lines, errors
+
+
+def _read_chunks(f, chunk_bytes, first_line):
+    """Куски файла из целых строк: (смещение после куска, номер его первой строки, bytes)."""
+    line_no = first_line
+    while True:
+        data = f.read(chunk_bytes)
+        if not data:
+            return
+        if not data.endswith(b"\n"):
+            data += f.readline()
+        yield f.tell(), line_no, data
+        line_no += data.count(b"\n")
+
+
+def _parsed_chunks(f, table, source, first_line, chunk_bytes, pool):
+    """
+    Разобранные куски по порядку:
+    (смещение после куска, номер следующей строки, строки, их номера, ошибки).
+    С пулом процессов впрок разбирается не больше TXT_PARSE_AHEAD кусков,
+    так что память не растёт с размером файла.
+    """
+    if pool is None:
+        for end, line_no, data in _read_chunks(f, chunk_bytes, first_line):
+            yield (end, line_no + data.count(b"\n"), *parse_txt_chunk(table, data, line_no, source))
+        return
+    pending = deque()
+    for end, line_no, data in _read_chunks(f, chunk_bytes, first_line):
+        future = pool.submit(parse_txt_chunk, table, data, line_no, source)
+        pending.append((end, line_no + data.count(b"\n"), future))
+        if len(pending) >= TXT_PARSE_AHEAD:
+            end, next_line, future = pending.popleft()
+            yield (end, next_line, *future.result())
+    while pending:
+        end, next_line, future = pending.popleft()
+        yield (end, next_line, *future.result())
+
+
+def txt_parse_pool(workers=TXT_IMPORT_WORKERS):
+    """Пул процессов для parse_txt_chunk или None, если разбирать в текущем процессе."""
+    return ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+
+class ImportCheckpoint:
+    """
+    Контрольные точки импорта TXT в JSON-файле path: для каждой таблицы —
+    смещение и номер строки после последней зафиксированной пачки и отметка о завершении.
+    Точка привязана к размеру и времени изменения файла: изменённый файл загружается сначала.
+    path=None — точки только в памяти (импорт без возобновления).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except ValueError as e:
+                print(f"Файл контрольной точки {path} повреждён, импорт начнётся сначала: {e}")
+
+    @staticmethod
+    def _signature(source):
+        stat = os.stat(source)
+        return [os.path.abspath(source), stat.st_size, int(stat.st_mtime)]
+
+    def position(self, table, source):
+        """Сохранённая позиция {"offset", "line", "done"} для файла таблицы или None."""
+        entry = self.state.get(table)
+        if entry is None or entry.get("file") != self._signature(source):
+            return None
+        return entry
+
+    def save(self, table, source, offset, line, done=False):
+        self.state[table] = {"file": self._signature(source), "offset": offset, "line": line, "done": done}
+        if not self.path:
+            return
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(temporary, self.path)
+
+    def finish(self, table, source):
+        """Отмечает таблицу загруженной полностью."""
+        entry = self.state.get(table) or {"offset": 0, "line": 1}
+        self.save(table, source, entry["offset"], entry["line"], done=True)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _write_chunk(cursor, sql, rows):
+    """
+    Записывает кусок одной транзакцией INSERT OR IGNORE.
+    Возвращает индексы строк rows, которые не записаны (id или уникальное имя уже есть).
+    """
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("SAVEPOINT txt_chunk")
+        cursor.executemany(sql, rows)
+        ignored = []
+        if cursor.rowcount < len(rows):
+            # Какие строки пропущены, видно только при построчной вставке; без повторов
+            # (обычный случай) кусок пишется одним executemany
+            cursor.execute("ROLLBACK TO txt_chunk")
+            for index, row in enumerate(rows):
+                if cursor.execute(sql, row).rowcount == 0:
+                    ignored.append(index)
+        cursor.execute("RELEASE txt_chunk")
+        bump_catalog_version(cursor)
+        cursor.connection.commit()
+    except BaseException:
+        cursor.connection.rollback()
+        raise
+    return ignored
+
+
+def import_txt_file(cursor, table, columns, path, report, pool=None, checkpoint=None,
+                    dry_run=False, chunk_bytes=TXT_CHUNK_BYTES):
+    """
+    Потоково загружает один TXT-файл в table пачками INSERT OR IGNORE.
+    Файл читается кусками по chunk_bytes, куски разбираются в пуле процессов pool
+    (или здесь же, если пула нет), и каждый кусок фиксируется своей транзакцией,
+    после чего позиция сохраняется в checkpoint. Так память не зависит от размера файла,
+    а прерванный импорт продолжается с последнего зафиксированного куска.
+    dry_run=True только разбирает и проверяет строки, ничего не записывая.
+    Строки, которые INSERT OR IGNORE не записал (повтор id или уникального имени,
+    в том числе кусок, записанный ещё до возобновления), не входят в report.imported
+    и попадают в отчёт как ошибки.
+    Возвращает False, если таблица уже загружена по контрольной точке.
+    """
+    checkpoint = checkpoint or ImportCheckpoint()
+    position = None if dry_run else checkpoint.position(table, path)
+    if position and position["done"]:
+        print(f"Таблица {table} уже загружена из {path} (контрольная точка), пропуск")
+        return False
+    offset, line_no = (position["offset"], position["line"]) if position else (0, 1)
+    if offset:
+        print(f"Таблица {table}: продолжение импорта {path} со строки {line_no}")
+
+    sql = (
+        f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})"
+    )
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for end, next_line, rows, lines, errors in _parsed_chunks(f, table, path, line_no, chunk_bytes, pool):
+            for place, message in errors:
+                report.error(place, message)
+            ignored = []
+            if not dry_run and rows:
+                # Кусок, прерванный блокировкой другого воркера, записывается заново целиком
+                ignored = retry_busy(_write_chunk, cursor, sql, rows)
+            for index in ignored:
+                report.error(f"{path}:{lines[index]}", "Запись с таким id или именем уже есть, строка пропущена")
+            report.imported += len(rows) - len(ignored)
+            if not dry_run:
+                checkpoint.save(table, path, end, next_line)
+    return True
+
+
+def _source_lines(path, ids):
+    """Номера строк TXT-файла, в которых впервые встречаются записи с данными id."""
+    found = {}
+    with open(path, "rb") as f:
+        for line_no, raw in enumerate(f, start=1):
+            if line_no == 1 and raw.startswith(b"\xef\xbb\xbf"):
+                raw = raw[3:]
+            try:
+                row_id = int(raw.split(b"`", 1)[0])
+            except ValueError:
+                continue
+            if row_id in ids and row_id not in found:
+                found[row_id] = line_no
+                if len(found) == len(ids):
+                    break
+    return found
+
+
+def drop_dangling_rows(cursor, table, report, source=None):
+    """
+    Исправляет строки table со ссылками на несуществующие записи (PRAGMA foreign_key_check):
+    ссылка на жанр обнуляется (как ON DELETE SET NULL), остальные строки удаляются
+    (как ON DELETE CASCADE) и вычитаются из report.imported. Каждая такая строка
+    отмечается в отчёте как "файл:строка" исходного файла source (id записи — её rowid).
+    Выполняется своей транзакцией; строки попадают в отчёт после её фиксации.
+    """
+    cursor.execute("BEGIN IMMEDIATE")
+    problems = {}
+    try:
+        # У строки может быть несколько битых ссылок: жанр обнуляется, только если других нет
+        parents = {}
+        for _, rowid, parent, _ in cursor.execute(f"PRAGMA foreign_key_check({table})").fetchall():
+            parents.setdefault(rowid, set()).add(parent)
+        for rowid, missing in parents.items():
+            others = sorted(missing - {"genres"})
+            if others:
+                cursor.execute(f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+                problems[rowid] = (True, f"Ссылка на отсутствующую запись в {', '.join(others)}, строка пропущена")
+            else:
+                cursor.execute(f"UPDATE {table} SET genre_id = NULL WHERE rowid = ?", (rowid,))
+                problems[rowid] = (False, "Жанр не найден, ссылка обнулена")
+        bump_catalog_version(cursor)
+        cursor.connection.commit()
+    except BaseException:
+        cursor.connection.rollback()
+        raise
+    if not problems:
+        return
+    lines = {}
+    if source is not None:
+        try:
+            lines = _source_lines(source, set(problems))
+        except OSError as e:
+            print(f"Не удалось найти строки {source} для отчёта: {e}")
+    for rowid, (dropped, message) in sorted(problems.items()):
+        if dropped:
+            report.imported -= 1
+        if rowid in lines:
+            place = f"{source}:{lines[rowid]}"
+        else:
+            place = f"{source or table}: id {rowid}"
+        report.error(place, message)
@@ -1,26 +1,115 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import PlainTextResponse, FileResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Query
+from fastapi.responses import PlainTextResponse, FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+import asyncio
+import io
 import os
+import tempfile
+import time
+import admission
+import cache
+import change_feed
+import http_cache
+import metrics
+import storage
+from suggest import KINDS as SUGGEST_KINDS, MAX_SUGGEST_LIMIT, SUGGEST_LIMIT, IndexNotReadyError, suggestion_index
+from database import close_pool, backup_database, list_backups, get_catalog_version
+from exporter import WRITERS as EXPORT_WRITERS, export_to_file, iter_export_rows, stream_csv, stream_ndjson
+from export_jobs import export_jobs, public_job
+from importer import PARSERS, import_songs_file
+from db_executor import db_executor, run_in_db, ExecutorBusyError
+from writer import write_coordinator, run_write
+from pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError,
+    build_page, decode_cursor, encode_cursor, row_id
+)
 from music_catalog import (
     add_song,
     update_song,
     delete_song,
     delete_artist,
     delete_album,
-    search_tracks,
+    search_tracks_page,
     get_album_details,
+    get_album_revision,
+    get_album_revision_by_id,
     get_artist_albums,
+    get_artist_revision,
+    get_artist_revision_by_id,
+    ARTIST_ALBUM_COLUMNS,
+    count_artist_albums,
+    get_song,
+    get_album_by_id,
+    get_artist_by_id,
+    get_songs_by_ids,
+    get_albums_by_ids,
+    get_artists_by_ids,
+    update_song_by_id,
+    delete_song_by_id,
+    delete_songs_by_ids,
+    delete_album_by_id,
+    delete_artist_by_id,
+    MAX_BATCH_IDS,
+    get_top_artists,
+    get_genre_distribution,
+    get_year_histogram,
+    get_album_track_counts,
+    get_catalog_summary,
     clear_database,
-    export_songs_to_docx,
-    delete_file
+    restore_catalog,
+    delete_file,
+    init_catalog,
+    get_changes,
+    get_last_change_seq,
+    DEFAULT_CHANGES_LIMIT,
+    MAX_CHANGES_LIMIT
 )
 
+# Время подготовки воркера при старте (метрика app_startup_seconds)
+startup_time = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схема, пулы соединений и (по настройке) кэш готовятся при старте воркера, а не при импорте модулей
+    started = time.perf_counter()
+    await run_in_db(init_catalog)
+    # Индекс подсказок строится в фоне; до готовности /suggest отвечает 503
+    suggestion_index.rebuild_soon(delay=0)
+    # Изменения из других воркеров: Redis pub/sub или опрос версии каталога
+    cache.invalidation_bus.start(get_catalog_version)
+    # Реплика для чтения и периодические снимки, если включены в настройках
+    storage.start()
+    startup_time["seconds"] = time.perf_counter() - started
+    print(f"Воркер готов к работе за {startup_time['seconds']:.3f} с")
+    yield
+    # Дожидаемся задач к БД, экспорта и очереди записи и закрываем соединения пула при остановке воркера
+    storage.stop()
+    cache.invalidation_bus.stop()
+    export_jobs.shutdown()
+    db_executor.shutdown()
+    write_coordinator.shutdown()
+    close_pool()
+
+# После обновления реплики закэшированные ответы могут не совпадать с ней
+storage.on_replica_refresh(cache.invalidate_all)
+# Массовые изменения перестраивают индекс подсказок целиком, а изменения
+# из других воркеров применяются к нему по журналу изменений
+cache.on_invalidate_all(suggestion_index.rebuild_soon)
+cache.on_remote_change(suggestion_index.sync_soon)
+
 app = FastAPI(
     title="Музыкальный каталог API",
     description="API для управления музыкальной коллекцией",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # JSON-ответы сериализуются orjson, если он установлен
+    default_response_class=http_cache.CatalogJSONResponse
 )
+# Лимиты частоты, пределы одновременных запросов и сброс нагрузки (429/503 с Retry-After).
+# Добавляется раньше CORS, чтобы отказы тоже получали CORS-заголовки
+app.add_middleware(admission.AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # или ["http://localhost:3000"] для конкретного фронтенда
@@ -28,6 +117,69 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Сжатие больших JSON-ответов (brotli, если установлен, иначе gzip)
+app.add_middleware(http_cache.CompressionMiddleware)
+
+def _executor_stat(name):
+    return lambda: db_executor.stats()[name]
+
+def _cache_stat(name):
+    return lambda: cache.catalog_cache.stats()[name]
+
+for _name, _help, _kind, _function in (
+    ("db_executor_queue_depth", "Задач в очереди пула потоков БД", "gauge", _executor_stat("queue_depth")),
+    ("db_executor_running", "Задач, выполняющихся в пуле потоков БД", "gauge", _executor_stat("running")),
+    ("db_executor_rejected_total", "Задач, отклонённых из-за переполнения очереди", "counter",
+     _executor_stat("rejected")),
+    ("db_executor_wait_seconds_max", "Максимальное ожидание задачи в очереди", "gauge", _executor_stat("wait_time_max")),
+    ("cache_hits_total", "Попаданий в кэш ответов", "counter", _cache_stat("hits")),
+    ("cache_misses_total", "Промахов кэша ответов", "counter", _cache_stat("misses")),
+    ("app_startup_seconds", "Время подготовки воркера при старте", "gauge", lambda: startup_time.get("seconds")),
+):
+    metrics.register(metrics.Gauge(_name, _help, _function, _kind))
+
+@app.middleware("http")
+async def measure_request(request: Request, call_next):
+    """Время обработки запроса по шаблону маршрута (а не по конкретному пути)."""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.http_request_duration.observe(
+            time.perf_counter() - started,
+            request.method,
+            route.path if route is not None else "unmatched",
+            status
+        )
+
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(request: Request, exc: ExecutorBusyError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Сервер перегружен, повторите запрос позже"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(IndexNotReadyError)
+async def suggest_not_ready_handler(request: Request, exc: IndexNotReadyError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursorError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+def _cursor_id(cursor):
+    """id последней строки предыдущей страницы из курсора (или None)."""
+    if cursor is None:
+        return None
+    last_id = decode_cursor(cursor, "id")["id"]
+    if not isinstance(last_id, int):
+        raise InvalidCursorError("Некорректный курсор")
+    return last_id
 
 @app.get("/", response_class=PlainTextResponse)  # Явно указываем тип ответа
 async def root():
@@ -43,18 +195,133 @@ async def favicon():
 async def create_song(artist: str, title: str, genre: str = None, album: str = None, year: int = None):
     """Добавление новой песни в каталог"""
     try:
-        add_song(artist, title, genre, album, year)
-        return {"message": "Песня успешно добавлена"}
+        # Запись ставится в очередь потока записи и фиксируется общей пачкой
+        added = await run_write(add_song, artist, title, genre, album, year)
+    except ExecutorBusyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при добавлении песни: {str(e)}")
+    if not added:
+        # Ошибка SQLite откатила операцию: песня не записана
+        raise HTTPException(status_code=500, detail="Не удалось добавить песню. Проверь логи сервера для деталей.")
+    return {"message": "Песня успешно добавлена"}
+
+# Максимальный размер файла массового импорта в памяти (дальше — на диск)
+BULK_IMPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+def _bulk_import(upload, fmt):
+    with io.TextIOWrapper(upload, encoding="utf-8", newline="") as stream:
+        return import_songs_file(stream, fmt)
+
+@app.post("/songs/bulk")
+async def bulk_create_songs(request: Request, format: str = None):
+    """
+    Массовый импорт песен. Тело запроса — CSV (artist,title,genre,album,year)
+    или JSON Lines; формат задаётся параметром format или Content-Type.
+    Ошибочные строки перечисляются в отчёте и не прерывают импорт.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if "csv" in content_type else "jsonl"
+    if format not in PARSERS:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемый формат: {format}")
+
+    upload = tempfile.SpooledTemporaryFile(max_size=BULK_IMPORT_SPOOL_SIZE)
+    async for chunk in request.stream():
+        upload.write(chunk)
+    upload.seek(0)
+    return await run_in_db(_bulk_import, upload, format)
 
 @app.get("/search")
-async def search(query: str):
-    """Поиск песен по запросу"""
-    results = search_tracks(query)
-    if not results:
-        return {"message": "Ничего не найдено", "results": []}
-    return {"results": results}
+async def search(
+    request: Request,
+    query: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: str = None,
+    total: bool = False,
+    columnar: bool = False
+):
+    """
+    Поиск песен по запросу (постранично: limit/offset или cursor из предыдущего ответа).
+    columnar=true — результаты массивами значений, имена колонок один раз в поле columns.
+    """
+    headers, not_modified = await http_cache.conditional(request)
+    if not_modified:
+        return not_modified
+    page = await run_in_db(search_tracks_page, query, limit, offset, cursor, total, columnar)
+    if page is None:
+        raise HTTPException(status_code=500, detail="Ошибка подключения к базе данных")
+    if not page["results"]:
+        page = {"message": "Ничего не найдено", **page}
+    # Ответ сериализуется сразу, минуя jsonable_encoder
+    return http_cache.CatalogJSONResponse(page, headers=headers)
+
+@app.get("/suggest")
+async def suggest(
+    q: str,
+    limit: int = Query(SUGGEST_LIMIT, ge=1, le=MAX_SUGGEST_LIMIT),
+    types: str = None
+):
+    """
+    Подсказки для строки поиска: исполнители, альбомы и песни, название которых
+    (или одно из первых слов названия) начинается с q. types — виды через запятую
+    (artists,albums,songs). Ответ строится по индексу в памяти, без запросов к базе.
+    """
+    kinds = SUGGEST_KINDS
+    if types:
+        kinds = tuple(dict.fromkeys(kind.strip() for kind in types.split(",") if kind.strip()))
+        unknown = [kind for kind in kinds if kind not in SUGGEST_KINDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные виды подсказок: {', '.join(unknown)}")
+    return suggestion_index.suggest(q, limit, kinds)
+
+@app.get("/changes")
+async def changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_CHANGES_LIMIT, ge=1, le=MAX_CHANGES_LIMIT)
+):
+    """
+    Изменения каталога после номера since (last_seq предыдущего ответа):
+    текущие строки изменённых песен, альбомов и исполнителей и id удалённых.
+    reset=true — загрузите каталог заново и продолжайте с last_seq.
+    """
+    delta = await run_in_db(get_changes, since, limit)
+    return http_cache.CatalogJSONResponse(delta, headers={"Cache-Control": "no-store"})
+
+@app.get("/changes/stream")
+async def changes_stream(request: Request, since: int = Query(None, ge=0)):
+    """
+    Поток изменений каталога (server-sent events): событие changes в формате ответа /changes
+    после каждой записи. Без since поток начинается с текущего момента; при переподключении
+    браузер сам передаёт Last-Event-ID, и пропущенные изменения приходят первым событием.
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    if since is None:
+        since = await run_in_db(get_last_change_seq)
+
+    async def events():
+        position = since
+        while not await request.is_disconnected():
+            generation = change_feed.change_notifier.generation
+            delta = await run_in_db(get_changes, position, MAX_CHANGES_LIMIT)
+            if delta["last_seq"] != position or delta.get("reset"):
+                position = delta["last_seq"]
+                yield change_feed.sse_event(delta)
+            if delta["has_more"]:
+                continue
+            if await change_feed.change_notifier.wait(generation, change_feed.STREAM_HEARTBEAT):
+                await asyncio.sleep(change_feed.STREAM_COALESCE_DELAY)
+            else:
+                yield change_feed.SSE_PING
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    )
 
 @app.put("/songs/{song_title}")
 async def update_song_route(
@@ -66,31 +333,64 @@ async def update_song_route(
     new_year: int = None
 ):
     """Обновление информации о песне"""
-    success = update_song(song_title, new_title, new_artist, new_genre, new_album, new_year)
+    success = await run_write(update_song, song_title, new_title, new_artist, new_genre, new_album, new_year)
     if not success:
         raise HTTPException(status_code=404, detail="Песня не найдена или не удалось обновить")
     return {"message": "Песня успешно обновлена"}
 
 @app.get("/albums/{album_name}")
-async def get_album(album_name: str):
-    """Получение информации об альбоме"""
-    album_details = get_album_details(album_name)
+async def get_album(
+    request: Request,
+    album_name: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: str = None,
+    total: bool = False,
+    columnar: bool = False
+):
+    """Получение информации об альбоме (песни альбома — постранично, columnar=true — массивами)"""
+    headers, not_modified = await http_cache.conditional(request, get_album_revision, album_name)
+    if not_modified:
+        return not_modified
+    album_details = await run_in_db(
+        get_album_details, album_name, limit + 1, offset, _cursor_id(cursor), total, columnar
+    )
     if not album_details:
         raise HTTPException(status_code=404, detail="Альбом не найден")
-    return album_details
+    album_details["songs"], album_details["next_cursor"] = build_page(
+        album_details["songs"], limit, lambda song: encode_cursor(id=row_id(song))
+    )
+    return http_cache.CatalogJSONResponse(album_details, headers=headers)
 
 @app.get("/artists/{artist_name}/albums")
-async def get_albums_by_artist(artist_name: str):
-    """Получение альбомов исполнителя"""
-    albums = get_artist_albums(artist_name)
-    if not albums:
+async def get_albums_by_artist(
+    request: Request,
+    artist_name: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: str = None,
+    total: bool = False,
+    columnar: bool = False
+):
+    """Получение альбомов исполнителя (постранично, columnar=true — массивами значений)"""
+    headers, not_modified = await http_cache.conditional(request, get_artist_revision, artist_name)
+    if not_modified:
+        return not_modified
+    albums = await run_in_db(get_artist_albums, artist_name, limit + 1, offset, _cursor_id(cursor), columnar)
+    if not albums and cursor is None and offset == 0:
         raise HTTPException(status_code=404, detail="Исполнитель не найден или нет альбомов")
-    return {"albums": albums}
+    albums, next_cursor = build_page(albums, limit, lambda album: encode_cursor(id=row_id(album)))
+    page = {"albums": albums, "next_cursor": next_cursor}
+    if columnar:
+        page["columns"] = ARTIST_ALBUM_COLUMNS
+    if total:
+        page["total"] = await run_in_db(count_artist_albums, artist_name)
+    return http_cache.CatalogJSONResponse(page, headers=headers)
 
 @app.delete("/songs/{song_title}")
 async def delete_song_route(song_title: str):
     """Удаление песни из каталога"""
-    result = delete_song(song_title)
+    result = await run_write(delete_song, song_title)
     if not result:
         raise HTTPException(status_code=404, detail="Песня не найдена")
     return {"message": "Песня успешно удалена"}
@@ -98,7 +398,7 @@ async def delete_song_route(song_title: str):
 @app.delete("/artists/{artist_name}")
 async def delete_artist_route(artist_name: str):
     """Удаление исполнителя и всех связанных данных"""
-    result = delete_artist(artist_name)
+    result = await run_write(delete_artist, artist_name)
     if not result:
         raise HTTPException(status_code=404, detail="Исполнитель не найден")
     return {"message": "Исполнитель успешно удален"}
@@ -106,49 +406,334 @@ async def delete_artist_route(artist_name: str):
 @app.delete("/albums/{album_name}")
 async def delete_album_route(album_name: str):
     """Удаление альбома"""
-    result = delete_album(album_name)
+    result = await run_write(delete_album, album_name)
     if not result:
         raise HTTPException(status_code=404, detail="Альбом не найден")
     return {"message": "Альбом успешно удален"}
 
-@app.delete("/clear")
-async def clear_db():
-    """Полная очистка базы данных"""
-    success = clear_database()
+# Ресурсы по id: однозначны при совпадающих названиях и не требуют поиска по тексту
+
+class IdBatch(BaseModel):
+    ids: list[int] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+def _missing_ids(requested, found):
+    found = set(found)
+    return [item_id for item_id in dict.fromkeys(requested) if item_id not in found]
+
+@app.get("/songs/by-id/{song_id}")
+async def get_song_route(song_id: int):
+    """Песня по id"""
+    song = await run_in_db(get_song, song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Песня не найдена")
+    return song
+
+@app.put("/songs/by-id/{song_id}")
+async def update_song_by_id_route(
+    song_id: int,
+    new_title: str = None,
+    new_artist: str = None,
+    new_genre: str = None,
+    new_album: str = None,
+    new_year: int = None
+):
+    """Обновление песни по id"""
+    success = await run_write(update_song_by_id, song_id, new_title, new_artist, new_genre, new_album, new_year)
     if not success:
-        raise HTTPException(status_code=500, detail="Не удалось очистить базу данных. Проверь логи сервера для деталей.")
-    return {"message": "База данных успешно очищена"}
+        raise HTTPException(status_code=404, detail="Песня не найдена или не удалось обновить")
+    return {"message": "Песня успешно обновлена"}
 
-@app.get("/export/songs/docx", summary="Экспортировать каталог песен в DOCX")
-async def export_songs_to_docx_route(background_tasks: BackgroundTasks):
+@app.delete("/songs/by-id/{song_id}")
+async def delete_song_by_id_route(song_id: int):
+    """Удаление песни по id"""
+    if not await run_write(delete_song_by_id, song_id):
+        raise HTTPException(status_code=404, detail="Песня не найдена")
+    return {"message": "Песня успешно удалена"}
+
+@app.post("/songs/batch")
+async def get_songs_batch(batch: IdBatch):
+    """Несколько песен по списку id одним запросом"""
+    songs = await run_in_db(get_songs_by_ids, batch.ids)
+    return {"songs": songs, "missing": _missing_ids(batch.ids, (song["id"] for song in songs))}
+
+@app.post("/songs/batch/delete")
+async def delete_songs_batch(batch: IdBatch):
+    """Удаление нескольких песен по списку id одной транзакцией"""
+    deleted = await run_write(delete_songs_by_ids, batch.ids)
+    if deleted is None:
+        raise HTTPException(status_code=500, detail="Не удалось удалить песни")
+    return {"deleted": deleted, "missing": _missing_ids(batch.ids, deleted)}
+
+@app.get("/albums/by-id/{album_id}")
+async def get_album_by_id_route(
+    request: Request,
+    album_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: str = None,
+    total: bool = False,
+    columnar: bool = False
+):
+    """Альбом по id (песни альбома — постранично, columnar=true — массивами значений)"""
+    headers, not_modified = await http_cache.conditional(request, get_album_revision_by_id, album_id)
+    if not_modified:
+        return not_modified
+    album_details = await run_in_db(
+        get_album_by_id, album_id, limit + 1, offset, _cursor_id(cursor), total, columnar
+    )
+    if not album_details:
+        raise HTTPException(status_code=404, detail="Альбом не найден")
+    album_details["songs"], album_details["next_cursor"] = build_page(
+        album_details["songs"], limit, lambda song: encode_cursor(id=row_id(song))
+    )
+    return http_cache.CatalogJSONResponse(album_details, headers=headers)
+
+@app.delete("/albums/by-id/{album_id}")
+async def delete_album_by_id_route(album_id: int):
+    """Удаление альбома по id"""
+    if not await run_write(delete_album_by_id, album_id):
+        raise HTTPException(status_code=404, detail="Альбом не найден")
+    return {"message": "Альбом успешно удален"}
+
+@app.post("/albums/batch")
+async def get_albums_batch(batch: IdBatch):
+    """Несколько альбомов по списку id одним запросом"""
+    albums = await run_in_db(get_albums_by_ids, batch.ids)
+    return {"albums": albums, "missing": _missing_ids(batch.ids, (album["id"] for album in albums))}
+
+@app.get("/artists/by-id/{artist_id}")
+async def get_artist_by_id_route(
+    request: Request,
+    artist_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: str = None
+):
+    """Исполнитель по id и его альбомы (постранично)"""
+    headers, not_modified = await http_cache.conditional(request, get_artist_revision_by_id, artist_id)
+    if not_modified:
+        return not_modified
+    artist = await run_in_db(get_artist_by_id, artist_id, limit + 1, offset, _cursor_id(cursor))
+    if not artist:
+        raise HTTPException(status_code=404, detail="Исполнитель не найден")
+    artist["albums"], artist["next_cursor"] = build_page(
+        artist["albums"], limit, lambda album: encode_cursor(id=album["id"])
+    )
+    return http_cache.CatalogJSONResponse(artist, headers=headers)
+
+@app.delete("/artists/by-id/{artist_id}")
+async def delete_artist_by_id_route(artist_id: int):
+    """Удаление исполнителя по id и всех связанных данных"""
+    if not await run_write(delete_artist_by_id, artist_id):
+        raise HTTPException(status_code=404, detail="Исполнитель не найден")
+    return {"message": "Исполнитель успешно удален"}
+
+@app.post("/artists/batch")
+async def get_artists_batch(batch: IdBatch):
+    """Несколько исполнителей по списку id одним запросом"""
+    artists = await run_in_db(get_artists_by_ids, batch.ids)
+    return {"artists": artists, "missing": _missing_ids(batch.ids, (artist["id"] for artist in artists))}
+
+# Статистика каталога (из сводных таблиц, без агрегации по songs)
+
+@app.get("/stats/summary")
+async def stats_summary():
+    """Общее число песен, исполнителей, альбомов и жанров"""
+    return await run_in_db(get_catalog_summary)
+
+@app.get("/stats/artists/top")
+async def stats_top_artists(
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0)
+):
+    """Исполнители с наибольшим числом песен"""
+    return {"artists": await run_in_db(get_top_artists, limit, offset)}
+
+@app.get("/stats/genres")
+async def stats_genres():
+    """Распределение песен по жанрам"""
+    return {"genres": await run_in_db(get_genre_distribution)}
+
+@app.get("/stats/years")
+async def stats_years():
+    """Число песен по годам"""
+    return {"years": await run_in_db(get_year_histogram)}
+
+@app.get("/stats/albums")
+async def stats_albums(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    artist_id: int = None
+):
+    """Альбомы с числом песен (по убыванию)"""
+    return {"albums": await run_in_db(get_album_track_counts, limit, offset, artist_id)}
+
+@app.delete("/clear")
+async def clear_db(backup: bool = False, vacuum: bool = False):
     """
-    Экспортирует весь каталог песен в документ Word (.docx)
-    и предоставляет его для скачивания.
+    Полная очистка базы данных.
+    backup=true сначала сохраняет снимок, из которого очистку можно отменить
+    через POST /backups/{name}/restore; vacuum=true освобождает место на диске.
     """
-    temp_filename = "songs_catalog.docx" # Временное имя файла на сервере
+    result = await run_write(clear_database, backup, vacuum)
+    if not result:
+        raise HTTPException(status_code=500, detail="Не удалось очистить базу данных. Проверь логи сервера для деталей.")
+    response = {"message": "База данных успешно очищена"}
+    if isinstance(result, str):
+        response["backup"] = result
+    return response
+
+@app.get("/backups")
+async def get_backups():
+    """Список снимков базы"""
+    return {"backups": await run_in_db(list_backups)}
+
+@app.post("/backups", status_code=201)
+async def create_backup():
+    """Сохранить снимок базы"""
+    return {"backup": await run_in_db(backup_database)}
 
+@app.post("/backups/{name}/restore")
+async def restore_backup(name: str):
+    """Восстановить каталог из снимка"""
+    if not await run_write(restore_catalog, name):
+        raise HTTPException(status_code=404, detail="Снимок не найден или не удалось восстановить")
+    return {"message": f"Каталог восстановлен из снимка {name}"}
+
+def _new_export_path(suffix):
+    """Уникальный временный файл для экспорта, чтобы параллельные выгрузки не мешали друг другу."""
+    fd, path = tempfile.mkstemp(prefix="songs_export_", suffix=suffix)
+    os.close(fd)
+    return path
+
+async def _export_file_response(request, fmt, background_tasks, artist, genre, year):
+    # Неизменившийся каталог не нужно выгружать заново
+    headers, not_modified = await http_cache.conditional(request)
+    if not_modified:
+        return not_modified
+    temp_filename = _new_export_path(f".{fmt}")  # Временный файл на сервере
     try:
-        # Вызываем вашу функцию для генерации DOCX
-        success = export_songs_to_docx(filename=temp_filename)
+        count = await run_in_db(export_to_file, fmt, temp_filename, artist, genre, year)
+        if not count:
+            raise HTTPException(status_code=404, detail="Нет песен для экспорта")
 
-        if not success:
-            # Если ваша функция export_songs_to_docx возвращает False
-            if not os.path.exists(temp_filename) or os.path.getsize(temp_filename) == 0:
-                 raise HTTPException(status_code=404, detail="Нет песен для экспорта или ошибка при создании документа")
-            else:
-                 raise HTTPException(status_code=500, detail="Ошибка при экспорте песен в DOCX")
-        
         # Добавляем задачу на удаление файла после того, как он будет отправлен клиенту
         background_tasks.add_task(delete_file, temp_filename)
 
         # Возвращаем файл в качестве ответа
         return FileResponse(
             path=temp_filename,
-            filename="Каталог_песен.docx", # Имя файла, которое увидит пользователь при скачивании
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            filename=f"Каталог_песен.{fmt}", # Имя файла, которое увидит пользователь при скачивании
+            media_type=EXPORT_WRITERS[fmt][1],
+            headers=headers
         )
+    except (HTTPException, ExecutorBusyError):
+        if os.path.exists(temp_filename):
+            delete_file(temp_filename)
+        raise
     except Exception as e:
         # В случае любой непредвиденной ошибки
         if os.path.exists(temp_filename):
             delete_file(temp_filename) # Попытаться удалить, если файл был создан
         raise HTTPException(status_code=500, detail=f"Непредвиденная ошибка сервера: {str(e)}")
+
+@app.get("/export/songs/docx", summary="Экспортировать каталог песен в DOCX")
+async def export_songs_to_docx_route(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    artist: str = None,
+    genre: str = None,
+    year: int = None
+):
+    """
+    Экспортирует каталог песен (можно отфильтровать по исполнителю, жанру, году)
+    в документ Word (.docx) и предоставляет его для скачивания.
+    """
+    return await _export_file_response(request, "docx", background_tasks, artist, genre, year)
+
+@app.get("/export/songs/xlsx", summary="Экспортировать каталог песен в XLSX")
+async def export_songs_to_xlsx_route(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    artist: str = None,
+    genre: str = None,
+    year: int = None
+):
+    """Экспортирует каталог песен в таблицу Excel (.xlsx)"""
+    return await _export_file_response(request, "xlsx", background_tasks, artist, genre, year)
+
+@app.get("/export/songs/csv", summary="Потоковый экспорт каталога в CSV")
+async def export_songs_to_csv_route(artist: str = None, genre: str = None, year: int = None):
+    """Отдаёт каталог в CSV по мере чтения из базы, не собирая его в памяти"""
+    return StreamingResponse(
+        stream_csv(iter_export_rows(artist, genre, year)),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="songs.csv"'}
+    )
+
+@app.get("/export/songs/ndjson", summary="Потоковый экспорт каталога в NDJSON")
+async def export_songs_to_ndjson_route(artist: str = None, genre: str = None, year: int = None):
+    """Отдаёт каталог построчно в формате NDJSON"""
+    return StreamingResponse(
+        stream_ndjson(iter_export_rows(artist, genre, year)),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/export/jobs", status_code=202, summary="Запустить фоновый экспорт каталога")
+async def create_export_job(format: str = "docx", artist: str = None, genre: str = None, year: int = None):
+    """
+    Ставит экспорт в очередь и сразу возвращает задачу.
+    Если каталог не менялся, повторный запрос получает уже готовый файл.
+    """
+    try:
+        job = await run_in_db(export_jobs.submit, format, artist, genre, year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return public_job(job)
+
+@app.get("/export/jobs/{job_id}", summary="Статус фонового экспорта")
+async def get_export_job(job_id: str):
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача экспорта не найдена")
+    return public_job(job)
+
+@app.get("/export/jobs/{job_id}/download", summary="Скачать результат фонового экспорта")
+async def download_export_job(job_id: str):
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача экспорта не найдена")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Экспорт ещё не готов: {job['status']}")
+    if not os.path.exists(job["path"]):
+        raise HTTPException(status_code=410, detail="Файл экспорта больше не хранится, запустите экспорт заново")
+    return FileResponse(
+        path=job["path"],
+        filename=f"Каталог_песен.{job['format']}",
+        media_type=EXPORT_WRITERS[job["format"]][1]
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/internal/storage", include_in_schema=False)
+async def storage_status():
+    """Состояние реплики для чтения и периодических снимков"""
+    return storage.status()
+
+@app.get("/internal/suggest", include_in_schema=False)
+async def suggest_stats():
+    """Состояние индекса подсказок: размеры, время последней сборки"""
+    return suggestion_index.stats()
+
+@app.get("/internal/admission", include_in_schema=False)
+async def admission_status():
+    """Лимиты частоты, пределы одновременных запросов по классам эндпоинтов и их текущая занятость"""
+    return admission.status()
+
+@app.get("/internal/db-executor", include_in_schema=False)
+async def db_executor_stats():
+    """Метрики пула потоков БД: глубина очереди и время ожидания"""
+    return db_executor.stats()
@@ -0,0 +1,183 @@
+import bisect
+import hashlib
+import logging
+import os
+import re
+import threading
+
+# Запросы к SQLite дольше этого порога (мс) пишутся в журнал медленных запросов
+# вместе с планом EXPLAIN QUERY PLAN; 0 отключает журнал
+SLOW_QUERY_MS = float(os.environ.get("MUSIC_CATALOG_SLOW_QUERY_MS", "100"))
+
+slow_query_log = logging.getLogger("music_catalog.slow_queries")
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Монотонный счётчик с метками."""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus (накопительные корзины, сумма и количество)."""
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bucket_labels = self.labels + ("le",)
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(
+                        f"{self.name}_bucket{_format_labels(bucket_labels, label_values + (le,))} {cumulative}"
+                    )
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """
+    Значение, которое вычисляется функцией в момент сбора метрик.
+    kind="counter" — для счётчиков, которые ведёт другой модуль (кэш, пул потоков).
+    """
+
+    def __init__(self, name, help_text, function, kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.function = function
+        self.kind = kind
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {value}"]
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route", "status")
+))
+sqlite_query_duration = register(Histogram(
+    "sqlite_query_duration_seconds", "Время выполнения запроса SQLite (execute)", ("statement",)
+))
+sqlite_fetch_seconds = register(Counter(
+    "sqlite_fetch_seconds_total", "Время чтения строк результата (fetch*)", ("statement",)
+))
+sqlite_rows = register(Counter(
+    "sqlite_rows_returned_total", "Строк возвращено запросами SQLite", ("statement",)
+))
+sqlite_pool_wait = register(Histogram(
+    "sqlite_pool_wait_seconds", "Ожидание свободного соединения в пуле"
+))
+sqlite_busy_retries = register(Counter(
+    "sqlite_busy_retries_total", "Повторов запросов после SQLITE_BUSY"
+))
+slow_queries = register(Counter(
+    "sqlite_slow_queries_total", "Запросов дольше порога медленного журнала", ("statement",)
+))
+
+_WHITESPACE = re.compile(r"\s+")
+# Списки параметров переменной длины (IN (?, ?, ...)) не должны плодить метки
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_statement_names = {}
+
+
+def statement_name(sql):
+    """
+    Короткая нормализованная форма SQL для меток метрик. Длинный запрос
+    обрезается, а чтобы запросы с общим началом (SELECT <колонки> FROM ...)
+    не сливались в одну метку, к обрезанному тексту добавляется хэш всего запроса.
+    """
+    name = _statement_names.get(sql)
+    if name is None:
+        name = _PLACEHOLDER_LIST.sub("?, ...", _WHITESPACE.sub(" ", sql).strip())
+        if len(name) > 120:
+            digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+            name = f"{name[:107]}... #{digest}"
+        if len(_statement_names) < 10000:
+            _statement_names[sql] = name
+    return name
+
+
+def log_slow_query(connection, sql, params, duration):
+    """Пишет медленный запрос в журнал вместе с планом выполнения."""
+    name = statement_name(sql)
+    slow_queries.inc(1, name)
+    plan = ""
+    if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        try:
+            rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            plan = "; ".join(str(row[-1]) for row in rows)
+        except Exception as e:
+            plan = f"не удалось получить план: {e}"
+    slow_query_log.warning("Медленный запрос %.1f мс: %s | план: %s", duration * 1000, name, plan)
@@ -1,467 +1,968 @@
 import sqlite3
 import os
-from database import get_db_connection, create_database
-from docx import Document
-from docx.shared import Pt
-
-DATABASE_FILE = "music_catalog.db"
+import re
+from contextlib import nullcontext
+from database import (
+    DATABASE_FILE, POOL_WARM_UP, get_db_connection, get_read_connection, create_database, bump_catalog_version,
+    truncate_catalog, backup_database, restore_database, get_pool, get_read_pool, prune_change_log,
+    retry_busy
+)
+from cache import cached, invalidate, invalidate_all
+from resolver import name_resolver
+from suggest import suggestion_index
+from writer import bind_operation, write_operation
+from exporter import export_to_file
+from importer import (
+    ImportCheckpoint, ImportReport, TXT_IMPORT_WORKERS, TXT_TABLES, drop_dangling_rows, import_txt_file,
+    txt_parse_pool
+)
+from pagination import DEFAULT_PAGE_SIZE, clamp_limit, encode_cursor, decode_cursor, build_page, InvalidCursorError
+
+# Прогревать ли кэш ответов при старте воркера (первая страница поиска и сводка каталога)
+WARM_CACHE = os.environ.get("MUSIC_CATALOG_WARM_CACHE", "") not in ("", "0")
+
+def populate_database_from_txt(artists_file, genres_file, songs_file, albums_file,
+                               dry_run=False, checkpoint=None, workers=TXT_IMPORT_WORKERS):
+    """
+    Заполняет БД данными из текстовых файлов.
+    Файлы читаются кусками, которые разбираются в пуле из workers процессов;
+    каждый кусок пишется executemany и фиксируется своей транзакцией.
+    Строки с неверным числом полей или значениями попадают в отчёт с номером строки
+    и не прерывают загрузку. checkpoint — путь к файлу контрольной точки:
+    прерванный импорт с тем же файлом продолжается с последнего зафиксированного куска.
+    dry_run=True только проверяет файлы, ничего не записывая. Возвращает отчёт импорта.
+    """
+    report = ImportReport()
+    files = {"artists": artists_file, "genres": genres_file, "albums": albums_file, "songs": songs_file}
+    if dry_run:
+        report.dry_run = True
+        with txt_parse_pool(workers) or nullcontext() as pool:
+            try:
+                for table, columns in TXT_TABLES:
+                    import_txt_file(None, table, columns, files[table], report, pool, dry_run=True)
+                print("Проверка TXT-файлов завершена.")
+            except OSError as e:
+                print(f"Ошибка при проверке TXT-файлов: {e}")
+                report.error(None, str(e))
+        return report.as_dict()
 
-def populate_database_from_txt(artists_file, genres_file, songs_file, albums_file):
-    """Заполняет БД данными из текстовых файлов"""
     conn = get_db_connection()
     if conn:
         cursor = conn.cursor()
+        progress = ImportCheckpoint(checkpoint)
+        # Внешние ключи проверяются после загрузки каждой таблицы, а не построчно:
+        # иначе одна битая ссылка прерывала бы всю пачку executemany
+        foreign_keys = cursor.execute("PRAGMA foreign_keys").fetchone()[0]
+        cursor.execute("PRAGMA foreign_keys = OFF")
         try:
-            # Заполнение таблицы artists
-            with open(artists_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    artist_id, artist_name, biography = line.strip().split('`')
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO artists (id, name, biography) VALUES (?, ?, ?)",
-                        (artist_id, artist_name, biography)
-                    )
-
-            # Заполнение таблицы genres
-            with open(genres_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    genre_id, genre_name, description = line.strip().split('`')
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO genres (id, name, description) VALUES (?, ?, ?)",
-                        (genre_id, genre_name, description)
-                    )
-
-            # Заполнение таблицы albums
-            with open(albums_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    album_id, album_name, artist_id, description = line.strip().split('`')
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO albums (id, name, artist_id, description) VALUES (?, ?, ?, ?)",
-                        (album_id, album_name, artist_id, description)
-                    )
-
-            # Заполнение таблицы songs
-            with open(songs_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    song_id, title, artist_id, genre_id, album_id, year = line.strip().split('`')
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO songs (id, title, artist_id, genre_id, album_id, year) VALUES (?, ?, ?, ?, ?, ?)",
-                        (song_id, title, artist_id, genre_id, album_id, year)
-                    )
-
-            conn.commit()
+            with txt_parse_pool(workers) or nullcontext() as pool:
+                for table, columns in TXT_TABLES:
+                    if not import_txt_file(cursor, table, columns, files[table], report, pool, progress):
+                        continue
+                    retry_busy(drop_dangling_rows, cursor, table, report, files[table])
+                    progress.finish(table, files[table])
+            progress.remove()
             print("База данных успешно заполнена из TXT-файлов.")
-        except sqlite3.Error as e:
+        except (sqlite3.Error, OSError) as e:
             print(f"Ошибка при заполнении базы данных: {e}")
             conn.rollback()
+            report.error(None, str(e))
         finally:
+            cursor.execute(f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}")
             conn.close()
+            invalidate_all()
     else:
         print("Не удалось подключиться к базе данных.")
+        report.error(None, "Не удалось подключиться к базе данных")
+    if report.failed:
+        print(f"Пропущено строк с ошибками: {report.failed}")
+    return report.as_dict()
 
-def add_song(artist_name, title, genre_name, album_name, year):
+@write_operation("Ошибка при добавлении песни")
+def add_song(tx, artist_name, title, genre_name, album_name, year):
     """
     Добавляет новую песню в БД.
     Обрабатывает необязательные поля (жанр, альбом, год)
     в соответствии с требованиями NOT NULL в схеме БД.
+    Вызывается как add_song(artist_name, ...): запись идёт через write_coordinator.
     """
-    conn = get_db_connection() # Убедитесь, что get_db_connection() определена и доступна
-    if conn:
-        cursor = conn.cursor()
+    cursor = tx.cursor
+    # Имена разрешаются в id через кэш; промах — один upsert с RETURNING
+    names = name_resolver.begin(cursor)
+    artist_id = names.artist(artist_name)
+    # Если genre_name или album_name пустые/None, genre_id и album_id будут NULL
+    genre_id = names.genre(genre_name)
+    # Важно: альбом привязан к артисту, поэтому используем artist_id
+    album_id = names.album(album_name, artist_id)
+
+    # Обработка года: если year None или не число, устанавливаем 0 для NOT NULL поля в БД.
+    # Если year пришло с фронтенда как None (например, пустое поле),
+    # или если оно оказалось пустой строкой, превращаем его в 0.
+    actual_year = year if year is not None else 0
+    # Дополнительная проверка, если year пришло не в числовом формате (например, с фронтенда)
+    if not isinstance(actual_year, int):
         try:
-            # Проверяем/добавляем артиста
-            cursor.execute("SELECT id FROM artists WHERE name = ?", (artist_name,))
-            artist = cursor.fetchone()
-            if artist is None:
-                cursor.execute("INSERT INTO artists (name) VALUES (?)", (artist_name,))
-                artist_id = cursor.lastrowid
-            else:
-                artist_id = artist['id']
-
-            # Проверяем/добавляем жанр
-            # Если genre_name пустой или None, genre_id будет NULL
-            genre_id = None 
-            if genre_name: # Только если genre_name не пустой/None
-                cursor.execute("SELECT id FROM genres WHERE name = ?", (genre_name,))
-                genre = cursor.fetchone()
-                if genre is None:
-                    cursor.execute("INSERT INTO genres (name) VALUES (?)", (genre_name,))
-                    genre_id = cursor.lastrowid
-                else:
-                    genre_id = genre['id']
-
-            # Проверяем/добавляем альбом
-            # Если album_name пустой или None, album_id будет NULL
-            album_id = None 
-            if album_name: # Только если album_name не пустой/None
-                # Важно: альбом привязан к артисту, поэтому используем artist_id
-                cursor.execute("SELECT id FROM albums WHERE name = ? AND artist_id = ?",
-                               (album_name, artist_id))
-                album = cursor.fetchone()
-                if album is None:
-                    # Если альбома нет, создаем его. 'description' остается NULL по умолчанию.
-                    cursor.execute("INSERT INTO albums (name, artist_id) VALUES (?, ?)",
-                                   (album_name, artist_id))
-                    album_id = cursor.lastrowid
-                else:
-                    album_id = album['id']
-
-            # Обработка года: если year None или не число, устанавливаем 0 для NOT NULL поля в БД.
-            # Если year пришло с фронтенда как None (например, пустое поле),
-            # или если оно оказалось пустой строкой, превращаем его в 0.
-            actual_year = year if year is not None else 0
-            # Дополнительная проверка, если year пришло не в числовом формате (например, с фронтенда)
-            if not isinstance(actual_year, int):
-                try:
-                    actual_year = int(actual_year)
-                except (ValueError, TypeError):
-                    actual_year = 0 # Fallback to 0 if conversion fails
-
-
-            # Добавляем песню
-            cursor.execute(
-                "INSERT INTO songs (title, artist_id, genre_id, album_id, year) VALUES (?, ?, ?, ?, ?)",
-                (title, artist_id, genre_id, album_id, actual_year) # ИСПОЛЬЗУЕМ actual_year
-            )
-            conn.commit()
-            print(f"Песня '{title}' успешно добавлена.")
-            return True # Возвращаем True при успехе
-        except sqlite3.Error as e:
-            print(f"Ошибка при добавлении песни: {e}")
-            conn.rollback()
-            return False # Возвращаем False при ошибке
-        finally:
-            conn.close()
-    else:
-        print("Не удалось подключиться к базе данных.")
-        return False # Возвращаем False, если нет соединения
-def update_song(song_title, new_title=None, new_artist_name=None,
-               new_genre_name=None, new_album_name=None, new_year=None):
-    """Обновляет информацию о песне"""
-    conn = get_db_connection()
-    if not conn:
-        print("Не удалось подключиться к базе данных.")
+            actual_year = int(actual_year)
+        except (ValueError, TypeError):
+            actual_year = 0 # Fallback to 0 if conversion fails
+
+
+    # Добавляем песню
+    cursor.execute(
+        "INSERT INTO songs (title, artist_id, genre_id, album_id, year) VALUES (?, ?, ?, ?, ?)",
+        (title, artist_id, genre_id, album_id, actual_year) # ИСПОЛЬЗУЕМ actual_year
+    )
+    song_id = cursor.lastrowid
+    bump_catalog_version(cursor)
+    tx.after_commit(names.publish)
+    tx.after_commit(suggestion_index.add_song, song_id, title, artist_id, artist_name, album_id, album_name)
+    tx.after_commit(invalidate, albums=[album_name], artists=[artist_name])
+    tx.after_commit(print, f"Песня '{title}' успешно добавлена.")
+    return True
+
+@write_operation("Ошибка при обновлении песни")
+def _update_song(tx, where, description, value, new_title=None, new_artist_name=None,
+                 new_genre_name=None, new_album_name=None, new_year=None):
+    """
+    Обновляет песню, найденную по условию where (по названию или по id).
+    description — шаблон описания песни для сообщений, например "с id {}".
+    """
+    cursor = tx.cursor
+    cursor.execute(f'''
+        SELECT s.id, s.title, s.artist_id, ar.name as artist_name, s.album_id, a.name as album_name
+        FROM songs s
+        LEFT JOIN artists ar ON s.artist_id = ar.id
+        LEFT JOIN albums a ON s.album_id = a.id
+        WHERE {where}
+    ''', (value,))
+    song = cursor.fetchone()
+    if not song:
+        print(f"Песня {description.format(value)} не найдена.")
         return False
 
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, artist_id FROM songs WHERE title = ?", (song_title,))
-        song = cursor.fetchone()
-        if not song:
-            print(f"Песня с названием '{song_title}' не найдена.")
-            return False
+    # Все изменения собираются в один UPDATE
+    assignments = {}
+    names = name_resolver.begin(cursor)
+    current_artist_id = song['artist_id']
+    album_id, album_name = song['album_id'], song['album_name']
+
+    if new_title:
+        assignments["title"] = new_title
+
+    if new_artist_name:
+        current_artist_id = names.artist(new_artist_name)
+        assignments["artist_id"] = current_artist_id
+
+    if new_genre_name is not None:
+        # Пустая строка убирает жанр (genre_id = NULL)
+        assignments["genre_id"] = names.genre(new_genre_name)
+
+    if new_album_name is not None:
+        # Пустая строка убирает альбом (album_id = NULL)
+        album_id = assignments["album_id"] = names.album(new_album_name, current_artist_id)
+        album_name = new_album_name or None
+
+    if new_year:
+        assignments["year"] = new_year
+
+    if assignments:
+        cursor.execute(
+            f"UPDATE songs SET {', '.join(f'{column} = ?' for column in assignments)} WHERE id = ?",
+            (*assignments.values(), song['id'])
+        )
+
+    bump_catalog_version(cursor)
+    tx.after_commit(names.publish)
+    tx.after_commit(
+        suggestion_index.add_song, song['id'], new_title or song['title'], current_artist_id,
+        new_artist_name or song['artist_name'], album_id, album_name
+    )
+    tx.after_commit(
+        invalidate,
+        albums=[song['album_name'], new_album_name],
+        artists=[song['artist_name'], new_artist_name]
+    )
+    tx.after_commit(print, f"Песня '{song['title']}' успешно обновлена.")
+    return True
+
+# Обновляют информацию о песне по названию или по id:
+# update_song(song_title, new_title=None, new_artist_name=None, new_genre_name=None, new_album_name=None, new_year=None).
+# Как и остальные операции записи, вызываются блокирующе или через run_write()
+update_song = bind_operation(_update_song, "s.title = ?", "с названием '{}'")
+update_song_by_id = bind_operation(_update_song, "s.id = ?", "с id {}")
+
+@write_operation("Ошибка при удалении песни")
+def _delete_song(tx, where, value):
+    cursor = tx.cursor
+    cursor.execute(f'''
+        SELECT s.id, ar.name as artist_name, a.name as album_name
+        FROM songs s
+        LEFT JOIN artists ar ON s.artist_id = ar.id
+        LEFT JOIN albums a ON s.album_id = a.id
+        WHERE {where}
+    ''', (value,))
+    song = cursor.fetchone()
+    if not song:
+        return False
 
-        song_id = song['id']
-        current_artist_id = song['artist_id']
+    cursor.execute("DELETE FROM songs WHERE id = ?", (song['id'],))
+    bump_catalog_version(cursor)
+    tx.after_commit(suggestion_index.remove, "songs", [song['id']])
+    tx.after_commit(invalidate, albums=[song['album_name']], artists=[song['artist_name']])
+    return True
+
+delete_song = bind_operation(_delete_song, "s.title = ?")
+delete_song_by_id = bind_operation(_delete_song, "s.id = ?")
+
+
+@write_operation("Ошибка при удалении исполнителя")
+def _delete_artist(tx, where, description, value):
+    """Удаляет исполнителя, найденного по условию where, и все связанные данные"""
+    cursor = tx.cursor
+    cursor.execute(f"SELECT id, name FROM artists WHERE {where}", (value,))
+    artist = cursor.fetchone()
+    if not artist:
+        print(f"Исполнитель {description.format(value)} не найден.")
+        return  False
+
+    artist_id = artist['id']
+    # Названия альбомов исполнителя нужны для инвалидации кэша, id — для индекса подсказок
+    cursor.execute("SELECT id, name FROM albums WHERE artist_id = ?", (artist_id,))
+    albums = cursor.fetchall()
+    album_names = [row['name'] for row in albums]
+    cursor.execute("SELECT id FROM songs WHERE artist_id = ?", (artist_id,))
+    song_ids = [row['id'] for row in cursor.fetchall()]
+    # Альбомы и песни исполнителя удаляются каскадно (ON DELETE CASCADE)
+    cursor.execute("DELETE FROM artists WHERE id = ?", (artist_id,))
+    bump_catalog_version(cursor, names_changed=True)
+    tx.after_commit(suggestion_index.remove, "songs", song_ids)
+    tx.after_commit(suggestion_index.remove, "albums", [row['id'] for row in albums])
+    tx.after_commit(suggestion_index.remove, "artists", [artist_id])
+    tx.after_commit(invalidate, albums=album_names, artists=[artist['name']])
+    tx.after_commit(print, f"Исполнитель '{artist['name']}' и все его песни и альбомы успешно удалены.")
+    return True
+
+# Удаляют исполнителя (по имени или по id) и все связанные данные
+delete_artist = bind_operation(_delete_artist, "name = ?", "с именем '{}'")
+delete_artist_by_id = bind_operation(_delete_artist, "id = ?", "с id {}")
+
+@write_operation("Ошибка при удалении альбома")
+def _delete_album(tx, where, description, value):
+    cursor = tx.cursor
+    cursor.execute(f'''
+        SELECT a.id, a.name, ar.name as artist_name
+        FROM albums a
+        LEFT JOIN artists ar ON a.artist_id = ar.id
+        WHERE {where}
+    ''', (value,))
+    album = cursor.fetchone()
+    if not album:
+        print(f"Альбом {description.format(value)} не найден.")
+        return False
 
-        if new_title:
-            cursor.execute("UPDATE songs SET title = ? WHERE id = ?", (new_title, song_id))
+    album_id = album['id']
+    cursor.execute("SELECT id FROM songs WHERE album_id = ?", (album_id,))
+    song_ids = [row['id'] for row in cursor.fetchall()]
+    # Песни альбома удаляются каскадно (ON DELETE CASCADE)
+    cursor.execute("DELETE FROM albums WHERE id = ?", (album_id,))
+    bump_catalog_version(cursor, names_changed=True)
+    tx.after_commit(suggestion_index.remove, "songs", song_ids)
+    tx.after_commit(suggestion_index.remove, "albums", [album_id])
+    tx.after_commit(invalidate, albums=[album['name']], artists=[album['artist_name']])
+    tx.after_commit(print, f"Альбом '{album['name']}' успешно удален вместе с его песнями.")
+    return True
 
-        if new_artist_name:
-            cursor.execute("SELECT id FROM artists WHERE name = ?", (new_artist_name,))
-            artist = cursor.fetchone()
-            if not artist:
-                cursor.execute("INSERT INTO artists (name) VALUES (?)", (new_artist_name,))
-                new_artist_id = cursor.lastrowid
-            else:
-                new_artist_id = artist['id']
-            cursor.execute("UPDATE songs SET artist_id = ? WHERE id = ?", (new_artist_id, song_id))
-            current_artist_id = new_artist_id
+# Удаляют альбом (по названию или по id) вместе с его песнями
+delete_album = bind_operation(_delete_album, "a.name = ?", "с названием '{}'")
+delete_album_by_id = bind_operation(_delete_album, "a.id = ?", "с id {}")
 
-        if new_genre_name is not None:
-            if new_genre_name == "":
-                cursor.execute("UPDATE songs SET genre_id = NULL WHERE id = ?", (song_id,))
-            else:
-                cursor.execute("SELECT id FROM genres WHERE name = ?", (new_genre_name,))
-                genre = cursor.fetchone()
-                if not genre:
-                    cursor.execute("INSERT INTO genres (name) VALUES (?)", (new_genre_name,))
-                    new_genre_id = cursor.lastrowid
-                else:
-                    new_genre_id = genre['id']
-                cursor.execute("UPDATE songs SET genre_id = ? WHERE id = ?", (new_genre_id, song_id))
-
-        if new_album_name is not None:
-            if new_album_name == "":
-                cursor.execute("UPDATE songs SET album_id = NULL WHERE id = ?", (song_id,))
-            else:
-                cursor.execute(
-                    "SELECT id FROM albums WHERE name = ? AND artist_id = ?",
-                    (new_album_name, current_artist_id)
-                )
-                album = cursor.fetchone()
-                if not album:
-                    cursor.execute(
-                        "INSERT INTO albums (name, artist_id) VALUES (?, ?)",
-                        (new_album_name, current_artist_id)
-                    )
-                    new_album_id = cursor.lastrowid
-                else:
-                    new_album_id = album['id']
-                cursor.execute("UPDATE songs SET album_id = ? WHERE id = ?", (new_album_id, song_id))
-
-        if new_year:
-            cursor.execute("UPDATE songs SET year = ? WHERE id = ?", (new_year, song_id))
-
-        conn.commit()
-        print(f"Песня '{song_title}' успешно обновлена.")
-        return True
-    except sqlite3.Error as e:
-        print(f"Ошибка при обновлении песни: {e}")
-        conn.rollback()
-        return False
+# Наибольшее число id в одном пакетном запросе
+MAX_BATCH_IDS = 1000
+
+_SONG_COLUMNS = '''
+    s.id, s.title, s.year,
+    ar.id as artist_id, ar.name as artist_name,
+    a.id as album_id, a.name as album_name,
+    g.id as genre_id, g.name as genre_name
+'''
+
+
+def _columns(cursor):
+    return [column[0] for column in cursor.description]
+
+
+def _shape(columns, rows, columnar):
+    """
+    Строки результата для ответа. Курсор читает их кортежами (row_factory=None),
+    без sqlite3.Row; columnar=True оставляет кортежи как есть — имена колонок
+    тогда передаются один раз в поле "columns", иначе строки становятся словарями.
+    """
+    if columnar:
+        return rows
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _placeholders(ids):
+    return ", ".join("?" * len(ids))
+
+
+def get_song(song_id):
+    """Песня по id вместе с исполнителем, альбомом и жанром (или None)."""
+    songs = get_songs_by_ids([song_id])
+    return songs[0] if songs else None
+
+
+def get_songs_by_ids(song_ids):
+    """
+    Песни по списку id одним запросом (IN). Порядок — как в song_ids,
+    несуществующие id пропускаются.
+    """
+    ids = list(dict.fromkeys(song_ids))
+    if not ids:
+        return []
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {_SONG_COLUMNS}
+            FROM songs s
+            LEFT JOIN artists ar ON s.artist_id = ar.id
+            LEFT JOIN albums a ON s.album_id = a.id
+            LEFT JOIN genres g ON s.genre_id = g.id
+            WHERE s.id IN ({_placeholders(ids)})
+        ''', ids)
+        found = {row['id']: dict(row) for row in cursor.fetchall()}
+        return [found[song_id] for song_id in ids if song_id in found]
     finally:
         conn.close()
 
-def delete_song(song_title):
-    conn = get_db_connection()
-    if conn:
+
+def get_albums_by_ids(album_ids):
+    """Альбомы по списку id одним запросом (с исполнителем и числом песен)."""
+    ids = list(dict.fromkeys(album_ids))
+    if not ids:
+        return []
+    conn = get_read_connection()
+    try:
         cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT id FROM songs WHERE title = ?", (song_title,))
-            song = cursor.fetchone()
-            if not song:
-                return False
-
-            cursor.execute("DELETE FROM songs WHERE id = ?", (song['id'],))
-            conn.commit()
-            return True
-        except sqlite3.Error as e:
-            conn.rollback()
-            print(f"Ошибка при удалении песни: {e}")
-            return False
-        finally:
-            conn.close()
-    else:
-        return False
+        cursor.execute(f'''
+            SELECT
+                a.id, a.name, a.description,
+                ar.id as artist_id, ar.name as artist_name,
+                coalesce((SELECT songs FROM album_stats st WHERE st.album_id = a.id), 0) as songs_count
+            FROM albums a
+            LEFT JOIN artists ar ON a.artist_id = ar.id
+            WHERE a.id IN ({_placeholders(ids)})
+        ''', ids)
+        found = {row['id']: dict(row) for row in cursor.fetchall()}
+        return [found[album_id] for album_id in ids if album_id in found]
+    finally:
+        conn.close()
 
 
-def delete_artist(artist_name):
-    """Удаляет исполнителя и все связанные данные"""
-    conn = get_db_connection()
-    if conn:
+def get_artists_by_ids(artist_ids):
+    """Исполнители по списку id одним запросом (с числом альбомов)."""
+    ids = list(dict.fromkeys(artist_ids))
+    if not ids:
+        return []
+    conn = get_read_connection()
+    try:
         cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT id FROM artists WHERE name = ?", (artist_name,))
-            artist = cursor.fetchone()
-            if not artist:
-                print(f"Исполнитель с именем '{artist_name}' не найден.")
-                return  False
-
-            artist_id = artist['id']
-            cursor.execute("DELETE FROM songs WHERE artist_id = ?", (artist_id,))
-            cursor.execute("DELETE FROM albums WHERE artist_id = ?", (artist_id,))
-            cursor.execute("DELETE FROM artists WHERE id = ?", (artist_id,))
-            conn.commit()
-            print(f"Исполнитель '{artist_name}' и все его песни и альбомы успешно удалены.")
-            return True
-        except sqlite3.Error as e:
-            conn.rollback()
-            print(f"Ошибка при удалении исполнителя: {e}")
-            return False
-        finally:
-            conn.close()
-    else:
-        print("Не удалось подключиться к базе данных.")
-        return False
+        cursor.execute(f'''
+            SELECT
+                ar.id, ar.name, ar.biography,
+                (SELECT count(*) FROM albums a WHERE a.artist_id = ar.id) as albums_count
+            FROM artists ar
+            WHERE ar.id IN ({_placeholders(ids)})
+        ''', ids)
+        found = {row['id']: dict(row) for row in cursor.fetchall()}
+        return [found[artist_id] for artist_id in ids if artist_id in found]
+    finally:
+        conn.close()
+
+
+@write_operation("Ошибка при удалении песен", default=None)
+def delete_songs_by_ids(tx, song_ids):
+    """
+    Удаляет песни по списку id одной транзакцией.
+    Возвращает список id, которые действительно были удалены (None при ошибке).
+    """
+    ids = list(dict.fromkeys(song_ids))
+    if not ids:
+        return []
+    cursor = tx.cursor
+    cursor.execute(f'''
+        SELECT s.id, ar.name as artist_name, a.name as album_name
+        FROM songs s
+        LEFT JOIN artists ar ON s.artist_id = ar.id
+        LEFT JOIN albums a ON s.album_id = a.id
+        WHERE s.id IN ({_placeholders(ids)})
+    ''', ids)
+    songs = cursor.fetchall()
+    if not songs:
+        return []
+    deleted = [song['id'] for song in songs]
+    cursor.execute(f"DELETE FROM songs WHERE id IN ({_placeholders(deleted)})", deleted)
+    bump_catalog_version(cursor)
+    tx.after_commit(suggestion_index.remove, "songs", deleted)
+    tx.after_commit(
+        invalidate,
+        albums={song['album_name'] for song in songs},
+        artists={song['artist_name'] for song in songs}
+    )
+    return deleted
+
+# Веса BM25 для колонок songs_fts: название, альбом, исполнитель, жанр
+SEARCH_WEIGHTS = (10.0, 4.0, 6.0, 1.0)
+
+
+def _fts_match_query(query, relaxed=False):
+    """
+    Строит выражение MATCH для FTS5 из пользовательского запроса.
+    Каждое слово ищется по префиксу. В «мягком» режиме слова объединяются через OR,
+    а у длинных слов отбрасывается последняя буква, чтобы прощать опечатку
+    или другое окончание слова.
+    """
+    words = re.findall(r"\w+", query.casefold().replace("ё", "е"))
+    if not words:
+        return None
+    if relaxed:
+        words = [word[:-1] if len(word) > 3 else word for word in words]
+    terms = [f'"{word}"*' for word in words]
+    return (" OR " if relaxed else " AND ").join(terms)
+
+
+_SEARCH_COLUMNS = '''
+    s.id, s.title as name, 
+    a.id as album_id, a.name as album_name,
+    ar.id as artist_id, ar.name as artist_name
+'''
+_SEARCH_FIELDS = ("id", "name", "album_id", "album_name", "artist_id", "artist_name")
+
+
+def _search_rows(cursor, mode, match_query, limit=-1, offset=0, after=None):
+    """
+    Выбирает строки результата поиска.
+    mode: "all" — весь каталог по id, "strict"/"relaxed" — FTS5 с ранжированием BM25.
+    after — позиция последней строки предыдущей страницы (keyset-пагинация).
+    """
+    if mode == "all":
+        where = "WHERE s.id > ?" if after else ""
+        params = (after["id"],) if after else ()
+        cursor.execute(f'''
+            SELECT {_SEARCH_COLUMNS}
+            FROM songs s
+            LEFT JOIN albums a ON s.album_id = a.id
+            LEFT JOIN artists ar ON s.artist_id = ar.id
+            {where}
+            ORDER BY s.id
+            LIMIT ? OFFSET ?
+        ''', params + (limit, offset))
+        return cursor.fetchall()
+
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    where = "WHERE (rank, id) > (?, ?)" if after else ""
+    params = (match_query,) + ((after["rank"], after["id"]) if after else ())
+    cursor.execute(f'''
+        SELECT * FROM (
+            SELECT {_SEARCH_COLUMNS}, bm25(songs_fts, {weights}) as rank
+            FROM songs_fts
+            JOIN songs s ON s.id = songs_fts.rowid
+            LEFT JOIN albums a ON s.album_id = a.id
+            LEFT JOIN artists ar ON s.artist_id = ar.id
+            WHERE songs_fts MATCH ?
+        )
+        {where}
+        ORDER BY rank, id
+        LIMIT ? OFFSET ?
+    ''', params + (limit, offset))
+    return cursor.fetchall()
+
+
+def _search_mode(cursor, query):
+    """Определяет режим поиска и выражение MATCH для запроса (None, если искать нечего)."""
+    match_query = _fts_match_query(query)
+    if match_query is None:
+        return ("all", None) if not query.strip() else (None, None)
+    cursor.execute("SELECT 1 FROM songs_fts WHERE songs_fts MATCH ? LIMIT 1", (match_query,))
+    if cursor.fetchone():
+        return "strict", match_query
+    # Ничего не нашлось точно — используем мягкий запрос
+    return "relaxed", _fts_match_query(query, relaxed=True)
 
-def delete_album(album_name):
-    """Удаляет альбом из БД"""
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT id FROM albums WHERE name = ?", (album_name,))
-            album = cursor.fetchone()
-            if not album:
-                print(f"Альбом с названием '{album_name}' не найден.")
-                return False
-
-            album_id = album['id']
-            cursor.execute("DELETE FROM songs WHERE album_id = ?", (album_id,))
-            cursor.execute("DELETE FROM albums WHERE id = ?", (album_id,))
-            conn.commit()
-            print(f"Альбом '{album_name}' успешно удален. Ссылки на него в песнях обнулены.")
-            return True
-        except sqlite3.Error as e:
-            conn.rollback()
-            print(f"Ошибка при удалении альбома: {e}")
-            return False
-        finally:
-            conn.close()
-    else:
-        print("Не удалось подключиться к базе данных.")
-        return False
 
 def search_tracks(query):
-    """Поиск треков по названию, альбому или исполнителю"""
-    conn = get_db_connection()
+    """Поиск треков по названию, альбому, исполнителю или жанру (FTS5, ранжирование BM25)"""
+    conn = get_read_connection()
     if conn is None:
         print("Ошибка подключения к БД")
         return None
     try:
         cursor = conn.cursor()
-        search_term = f'%{query}%'
-        cursor.execute('''
-            SELECT 
-                s.id, s.title as name, 
-                a.id as album_id, a.name as album_name,
-                ar.id as artist_id, ar.name as artist_name
-            FROM songs s
-            LEFT JOIN albums a ON s.album_id = a.id
-            LEFT JOIN artists ar ON s.artist_id = ar.id
-            WHERE s.title LIKE ? OR a.name LIKE ? OR ar.name LIKE ?
-        ''', (search_term, search_term, search_term))
+        cursor.row_factory = None
+        mode, match_query = _search_mode(cursor, query)
+        if mode is None:
+            # В запросе нет ни одного слова — искать нечего
+            return []
+        rows = _search_rows(cursor, mode, match_query)
+        # zip по _SEARCH_FIELDS отбрасывает последнюю колонку rank
+        return _shape(_SEARCH_FIELDS, rows, columnar=False)
+    finally:
+        conn.close()
 
-        return [dict(row) for row in cursor.fetchall()]
+
+@cached("search")
+def search_tracks_page(query, limit=None, offset=0, cursor=None, with_total=False, columnar=False):
+    """
+    Постраничный поиск треков.
+    Возвращает {"results": [...], "next_cursor": str | None} и, по запросу, "total".
+    Курсор — непрозрачная строка из предыдущего ответа (keyset по рангу и id).
+    columnar=True: results — массивы значений в порядке колонок из поля "columns".
+    """
+    limit = clamp_limit(limit)
+    conn = get_read_connection()
+    if conn is None:
+        print("Ошибка подключения к БД")
+        return None
+    try:
+        db_cursor = conn.cursor()
+        db_cursor.row_factory = None
+        mode, match_query = _search_mode(db_cursor, query)
+        page = {"results": [], "next_cursor": None}
+        if mode is None:
+            if with_total:
+                page["total"] = 0
+            return page
+
+        after = None
+        if cursor:
+            after = decode_cursor(cursor, "mode", "id")
+            if after["mode"] != mode or (mode != "all" and "rank" not in after):
+                raise InvalidCursorError("Курсор не подходит к этому запросу")
+
+        rows = _search_rows(db_cursor, mode, match_query, limit + 1, offset, after)
+        if mode == "all":
+            make_cursor = lambda row: encode_cursor(mode=mode, id=row[0])
+        else:
+            # rank — последняя колонка, после _SEARCH_FIELDS
+            make_cursor = lambda row: encode_cursor(mode=mode, id=row[0], rank=row[-1])
+        rows, page["next_cursor"] = build_page(rows, limit, make_cursor)
+        if columnar and mode != "all":
+            rows = [row[:-1] for row in rows]
+        page["results"] = _shape(_SEARCH_FIELDS, rows, columnar)
+        if columnar:
+            page["columns"] = _SEARCH_FIELDS
+
+        if with_total:
+            if mode == "all":
+                db_cursor.execute("SELECT count(*) FROM songs")
+            else:
+                db_cursor.execute("SELECT count(*) FROM songs_fts WHERE songs_fts MATCH ?", (match_query,))
+            page["total"] = db_cursor.fetchone()[0]
+        return page
     finally:
         conn.close()
 
-def get_album_details(album_name):
-    """Получает детальную информацию об альбоме"""
-    conn = get_db_connection()
+def _album_details(where, value, limit, offset, after_id, with_total, columnar):
+    conn = get_read_connection()
     try:
         cursor = conn.cursor()
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT 
                 a.id, a.name, a.description,
                 ar.id as artist_id, ar.name as artist_name
             FROM albums a
             JOIN artists ar ON a.artist_id = ar.id
-            WHERE a.name = ?
-        ''', (album_name,))
+            WHERE {where}
+        ''', (value,))
 
         album = cursor.fetchone()
         if not album:
             return None
+        album = dict(album)
 
+        # Песни читаются кортежами: на длинном альбоме это заметно дешевле sqlite3.Row
+        cursor.row_factory = None
         cursor.execute('''
             SELECT id, title, year 
             FROM songs 
-            WHERE album_id = ?
-        ''', (album['id'],))
-
-        songs = [dict(row) for row in cursor.fetchall()]
-        return {
-            'album': dict(album),
-            'songs': songs
+            WHERE album_id = ? AND id > ?
+            ORDER BY id
+            LIMIT ? OFFSET ?
+        ''', (album['id'], after_id or 0, -1 if limit is None else limit, offset))
+
+        columns = _columns(cursor)
+        details = {
+            'album': album,
+            'songs': _shape(columns, cursor.fetchall(), columnar)
         }
+        if columnar:
+            details['columns'] = columns
+        if with_total:
+            cursor.execute("SELECT count(*) FROM songs WHERE album_id = ?", (album['id'],))
+            details['total'] = cursor.fetchone()[0]
+        return details
     finally:
         conn.close()
 
-def get_artist_albums(artist_name):
-    """Получает все альбомы исполнителя"""
-    conn = get_db_connection()
+@cached("album", scoped=True)
+def get_album_details(album_name, limit=None, offset=0, after_id=None, with_total=False, columnar=False):
+    """
+    Получает детальную информацию об альбоме.
+    limit/offset/after_id ограничивают список песен (after_id — id последней песни
+    предыдущей страницы); with_total добавляет общее число песен в альбоме;
+    columnar=True отдаёт песни массивами значений с именами колонок в "columns".
+    """
+    return _album_details("a.name = ?", album_name, limit, offset, after_id, with_total, columnar)
+
+def get_album_by_id(album_id, limit=None, offset=0, after_id=None, with_total=False, columnar=False):
+    """То же, что get_album_details, но альбом выбирается по id (без неоднозначности имён)."""
+    return _album_details("a.id = ?", album_id, limit, offset, after_id, with_total, columnar)
+
+def _revision_stamp(sql, value):
+    conn = get_read_connection()
+    try:
+        names_version, revisions = conn.execute(f'''
+            SELECT
+                (SELECT names_version FROM catalog_state WHERE id = 1),
+                group_concat(id || '.' || revision, '_')
+            FROM ({sql})
+        ''', (value,)).fetchone()
+        # names_version меняется при удалениях и очистке, после которых id могут использоваться снова
+        return None if revisions is None else f"{names_version}.{revisions}"
+    finally:
+        conn.close()
+
+def get_album_revision(album_name):
+    """
+    Отметка версии альбома (всех альбомов с этим названием) для ETag:
+    меняется при изменении альбома, его песен или имени исполнителя. None — альбома нет.
+    """
+    return _revision_stamp("SELECT id, revision FROM albums WHERE name = ? ORDER BY id", album_name)
+
+def get_artist_revision(artist_name):
+    """Отметка версии списка альбомов исполнителя для ETag (None — исполнителя нет)."""
+    return _revision_stamp("SELECT id, revision FROM artists WHERE name = ?", artist_name)
+
+def get_album_revision_by_id(album_id):
+    """То же, что get_album_revision, для альбома с данным id."""
+    return _revision_stamp("SELECT id, revision FROM albums WHERE id = ?", album_id)
+
+def get_artist_revision_by_id(artist_id):
+    """То же, что get_artist_revision, для исполнителя с данным id."""
+    return _revision_stamp("SELECT id, revision FROM artists WHERE id = ?", artist_id)
+
+# Колонки строк get_artist_albums(..., columnar=True)
+ARTIST_ALBUM_COLUMNS = ("id", "name", "description")
+
+@cached("artist", scoped=True)
+def get_artist_albums(artist_name, limit=None, offset=0, after_id=None, columnar=False):
+    """
+    Получает альбомы исполнителя.
+    limit/offset/after_id — постраничная выборка (after_id — id последнего альбома
+    предыдущей страницы). columnar=True — альбомы массивами значений
+    в порядке ARTIST_ALBUM_COLUMNS, а не словарями.
+    """
+    conn = get_read_connection()
     try:
         cursor = conn.cursor()
+        cursor.row_factory = None
         cursor.execute('''
             SELECT a.id, a.name, a.description
             FROM albums a
             JOIN artists ar ON a.artist_id = ar.id
+            WHERE ar.name = ? AND a.id > ?
+            ORDER BY a.id
+            LIMIT ? OFFSET ?
+        ''', (artist_name, after_id or 0, -1 if limit is None else limit, offset))
+
+        return _shape(ARTIST_ALBUM_COLUMNS, cursor.fetchall(), columnar)
+    finally:
+        conn.close()
+
+def get_artist_by_id(artist_id, limit=None, offset=0, after_id=None):
+    """Исполнитель по id и страница его альбомов (или None, если исполнителя нет)."""
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, biography FROM artists WHERE id = ?", (artist_id,))
+        artist = cursor.fetchone()
+        if not artist:
+            return None
+        cursor.execute('''
+            SELECT id, name, description
+            FROM albums
+            WHERE artist_id = ? AND id > ?
+            ORDER BY id
+            LIMIT ? OFFSET ?
+        ''', (artist_id, after_id or 0, -1 if limit is None else limit, offset))
+        return {'artist': dict(artist), 'albums': [dict(row) for row in cursor.fetchall()]}
+    finally:
+        conn.close()
+
+@cached("artist", scoped=True)
+def count_artist_albums(artist_name):
+    """Количество альбомов исполнителя"""
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT count(*)
+            FROM albums a
+            JOIN artists ar ON a.artist_id = ar.id
             WHERE ar.name = ?
         ''', (artist_name,))
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
 
+# Статистика каталога читается из сводных таблиц (*_stats), которые ведут триггеры
+
+def get_top_artists(limit=10, offset=0):
+    """Исполнители с наибольшим числом песен."""
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT ar.id, ar.name, st.songs,
+                   (SELECT count(*) FROM albums a WHERE a.artist_id = ar.id) as albums
+            FROM artist_stats st
+            JOIN artists ar ON ar.id = st.artist_id
+            ORDER BY st.songs DESC, ar.id
+            LIMIT ? OFFSET ?
+        ''', (limit, offset))
         return [dict(row) for row in cursor.fetchall()]
     finally:
         conn.close()
 
-def export_songs_to_docx(filename="songs_export.docx"):
-    conn = get_db_connection()
-    if not conn:
-        print("Не удалось подключиться к базе данных.")
-        return False
+def get_genre_distribution():
+    """Число песен в каждом жанре (по убыванию)."""
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT g.id, g.name, st.songs
+            FROM genre_stats st
+            JOIN genres g ON g.id = st.genre_id
+            ORDER BY st.songs DESC, g.id
+        ''')
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def get_year_histogram():
+    """Число песен по годам (по возрастанию года; 0 — год не указан)."""
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT year, songs FROM year_stats ORDER BY year")
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
 
+def get_album_track_counts(limit=50, offset=0, artist_id=None):
+    """Альбомы с числом песен (по убыванию), при необходимости — одного исполнителя."""
+    conn = get_read_connection()
     try:
-        
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT a.id, a.name, ar.id as artist_id, ar.name as artist_name, st.songs
+            FROM album_stats st
+            JOIN albums a ON a.id = st.album_id
+            LEFT JOIN artists ar ON ar.id = a.artist_id
+            WHERE ? IS NULL OR a.artist_id = ?
+            ORDER BY st.songs DESC, a.id
+            LIMIT ? OFFSET ?
+        ''', (artist_id, artist_id, limit, offset))
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
 
+def get_catalog_summary():
+    """Общее число песен, исполнителей, альбомов и жанров."""
+    conn = get_read_connection()
+    try:
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT 
-                s.title, s.year,
-                ar.name as artist,
-                al.name as album,
-                g.name as genre
-            FROM songs s
-            LEFT JOIN artists ar ON s.artist_id = ar.id
-            LEFT JOIN albums al ON s.album_id = al.id
-            LEFT JOIN genres g ON s.genre_id = g.id
-            ORDER BY ar.name, s.year
+            SELECT
+                (SELECT coalesce(sum(songs), 0) FROM year_stats) as songs,
+                (SELECT count(*) FROM artist_stats) as artists_with_songs,
+                (SELECT count(*) FROM artists) as artists,
+                (SELECT count(*) FROM albums) as albums,
+                (SELECT count(*) FROM genres) as genres
         ''')
+        return dict(cursor.fetchone())
+    finally:
+        conn.close()
 
-        songs = cursor.fetchall()
-        if not songs:
-            print("Нет песен для экспорта.")
-            return False
+# Записей журнала изменений в одном ответе /changes по умолчанию и наибольшее
+DEFAULT_CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = MAX_BATCH_IDS
 
-        # Создаем документ
-        doc = Document()
-        doc.add_heading('Каталог песен', level=1)
-
-        # Настройка стиля таблицы
-        table = doc.add_table(rows=1, cols=5)
-        table.style = 'Table Grid'
-        hdr_cells = table.rows[0].cells
-        hdr_cells[0].text = 'Название'
-        hdr_cells[1].text = 'Исполнитель'
-        hdr_cells[2].text = 'Год'
-        hdr_cells[3].text = 'Альбом'
-        hdr_cells[4].text = 'Жанр'
-
-        # Заполняем таблицу данными
-        for song in songs:
-            row_cells = table.add_row().cells
-            row_cells[0].text = song['title']
-            row_cells[1].text = song['artist']
-            row_cells[2].text = str(song['year'])
-            row_cells[3].text = song['album'] or "—"
-            row_cells[4].text = song['genre'] or "—"
-
-        # Сохраняем файл
-        doc.save(filename)
-        print(f"Документ сохранен как {filename}")
-        return True
+_CHANGE_LOADERS = {
+    "songs": get_songs_by_ids,
+    "albums": get_albums_by_ids,
+    "artists": get_artists_by_ids,
+}
 
-    except Exception as e:
-        print(f"Ошибка: {e}")
-        return False
+def get_last_change_seq():
+    """Номер последней записи журнала изменений (0 — журнал пуст)."""
+    conn = get_read_connection()
+    try:
+        return conn.execute("SELECT coalesce(max(seq), 0) FROM changes").fetchone()[0]
     finally:
         conn.close()
 
-def clear_database():
+def get_changes(since, limit=DEFAULT_CHANGES_LIMIT):
+    """
+    Изменения каталога после записи журнала since, не больше limit записей журнала.
+    Несколько изменений одной сущности сворачиваются в последнее: upserts содержит
+    текущие строки песен, альбомов и исполнителей, deletes — id удалённых.
+    cleared=True — каталог был очищен, и до применения изменений клиент очищает свою копию.
+    reset=True — журнал не покрывает изменения после since (клиент слишком отстал
+    или каталог восстановлен из снимка): каталог нужно загрузить заново, а затем
+    продолжать с last_seq. has_more=True — за last_seq есть ещё изменения.
+    """
+    limit = max(1, min(limit, MAX_CHANGES_LIMIT))
+    conn = get_read_connection()
     try:
-        conn = get_db_connection()
-        if conn is None:
-            print("Не удалось получить соединение с базой данных")
-            return False
-
         cursor = conn.cursor()
+        cursor.row_factory = None
+        first, last = cursor.execute("SELECT min(seq), max(seq) FROM changes").fetchone()
+        cursor.execute('''
+            SELECT seq, entity, entity_id, op FROM changes
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        ''', (since, limit + 1))
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
 
-        # Отключаем foreign keys
-        cursor.execute("PRAGMA foreign_keys = OFF;")
+    delta = {"since": since, "last_seq": since, "has_more": len(rows) > limit}
+    rows = rows[:limit]
+    pruned = first is not None and since < first - 1 and rows[0][3] != "clear"
+    if pruned or since > (last or 0) or any(op == "reset" for _, _, _, op in rows):
+        # Журнал не описывает путь от состояния клиента к текущему каталогу
+        return {**delta, "reset": True, "last_seq": last or 0, "has_more": False}
+
+    latest = {}
+    for seq, entity, entity_id, op in rows:
+        if op == "clear":
+            delta["cleared"] = True
+            latest.clear()
+            continue
+        latest.pop((entity, entity_id), None)
+        latest[(entity, entity_id)] = op
+    if rows:
+        delta["last_seq"] = rows[-1][0]
+
+    upserts, deletes = {}, {}
+    for (entity, entity_id), op in latest.items():
+        (upserts if op == "upsert" else deletes).setdefault(entity, []).append(entity_id)
+    # Строки читаются после журнала: удалённой с тех пор сущности не будет в выборке,
+    # её удаление придёт следующей порцией изменений
+    delta["upserts"] = {entity: _CHANGE_LOADERS[entity](ids) for entity, ids in upserts.items()}
+    delta["deletes"] = deletes
+    return delta
+
+@write_operation("Ошибка при сокращении журнала изменений", default=0)
+def trim_change_log(tx):
+    """Удаляет старые записи журнала изменений (оставляет CHANGE_LOG_KEEP последних)."""
+    return prune_change_log(tx.cursor)
+
+def export_songs_to_docx(filename="songs_export.docx", artist=None, genre=None, year=None):
+    """
+    Экспортирует каталог (с необязательным фильтром по исполнителю, жанру, году)
+    в DOCX. Таблица пишется потоково, без загрузки всего каталога в память.
+    """
+    try:
+        count = export_to_file("docx", filename, artist, genre, year)
+        if not count:
+            print("Нет песен для экспорта.")
+            return False
+        print(f"Документ сохранен как {filename}")
+        return True
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return False
 
-        # Чистим таблицы
-        cursor.execute("DELETE FROM songs;")
-        cursor.execute("DELETE FROM albums;")
-        cursor.execute("DELETE FROM artists;")
-        cursor.execute("DELETE FROM genres;")
+@write_operation("Ошибка при очистке базы данных", exclusive=True)
+def clear_database(tx, backup=False, vacuum=False):
+    """
+    Очищает каталог одной транзакцией (усечение таблиц без построчного удаления).
+    backup=True сначала сохраняет снимок базы, из которого очистку можно отменить
+    (restore_catalog); vacuum=True после очистки возвращает место на диске.
+    Выполняется потоком записи вне пачек: очистке нужен выключенный PRAGMA foreign_keys,
+    а его нельзя менять внутри общей транзакции. Вызывается как clear_database(backup, vacuum).
+    Возвращает имя снимка (если он создавался) или True; False при ошибке.
+    """
+    cursor = tx.cursor
+    try:
+        snapshot = backup_database() if backup else None
+
+        # Соединение записи живёт долго — запоминаем прежнее значение
+        foreign_keys = cursor.execute("PRAGMA foreign_keys").fetchone()[0]
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        def truncate():
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                truncate_catalog(cursor)
+                bump_catalog_version(cursor, names_changed=True)
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.connection.rollback()
+                raise
 
-        conn.commit()
+        try:
+            # Очистка, прерванная блокировкой другого воркера, повторяется целиком
+            retry_busy(truncate)
+        finally:
+            cursor.execute(f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}")
+        tx.after_commit(invalidate_all)
 
-        # Включаем обратно
-        cursor.execute("PRAGMA foreign_keys = ON;")
-        print("База данных успешно очищена")
-        return True
+        if vacuum:
+            cursor.execute("VACUUM")
+        print("База данных успешно очищена" + (f" (снимок {snapshot})" if snapshot else ""))
+        return snapshot or True
 
-    except Exception as e:
+    except (sqlite3.Error, OSError) as e:
         print(f"Ошибка при очистке базы данных: {e}")
         return False
 
-    finally:
-        if conn:
-            conn.close()
+@write_operation("Ошибка при восстановлении из снимка", exclusive=True)
+def restore_catalog(tx, name):
+    """
+    Восстанавливает каталог из снимка (например, сделанного clear_database(backup=True)).
+    Идёт через поток записи, чтобы не пересекаться с записями этого процесса.
+    """
+    try:
+        if not restore_database(name):
+            print(f"Снимок '{name}' не найден")
+            return False
+    except sqlite3.Error as e:
+        print(f"Ошибка при восстановлении из снимка: {e}")
+        return False
+    tx.after_commit(invalidate_all)
+    tx.after_commit(print, f"Каталог восстановлен из снимка {name}")
+    return True
+
 def delete_file(path: str):
     os.remove(path)
-# Инициализация БД
-create_database(DATABASE_FILE)
+
+def init_catalog(warm_cache=WARM_CACHE):
+    """
+    Подготовка процесса к работе с каталогом: проверка и миграция схемы,
+    открытие соединений пулов и (warm_cache=True) прогрев кэша ответов
+    первой страницей поиска и сводкой каталога.
+    Вызывается при старте приложения (lifespan в main.py), а не при импорте модуля.
+    """
+    create_database(DATABASE_FILE)
+    get_pool().warm_up(POOL_WARM_UP)
+    get_read_pool().warm_up(POOL_WARM_UP)
+    if warm_cache:
+        search_tracks_page("", DEFAULT_PAGE_SIZE)
+        get_catalog_summary()
 
 
 # Заполняем базу данных из TXT-файлов
@@ -481,4 +982,3 @@ create_database(DATABASE_FILE)
 # # delete_artist("123")
 # update_song("321", "b", "q", "j", )
 # delete_album("Альбом2")
-search_tracks("")
@@ -0,0 +1,50 @@
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursorError(ValueError):
+    """Курсор пагинации повреждён или не подходит к запросу."""
+
+
+def clamp_limit(limit):
+    """Приводит размер страницы к допустимому диапазону."""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def encode_cursor(**position):
+    """Упаковывает позицию последней строки страницы в непрозрачную строку."""
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, *required):
+    """Распаковывает курсор, созданный encode_cursor(), и проверяет наличие полей."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursorError("Некорректный курсор") from e
+    if not isinstance(position, dict) or any(key not in position for key in required):
+        raise InvalidCursorError("Некорректный курсор")
+    return position
+
+
+def row_id(row):
+    """id строки результата: словарь или кортеж колоночного ответа (id — первая колонка)."""
+    return row["id"] if isinstance(row, dict) else row[0]
+
+
+def build_page(rows, limit, make_cursor):
+    """
+    Отрезает лишнюю строку, запрошенную через LIMIT limit + 1,
+    и возвращает (строки страницы, курсор следующей страницы или None).
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, make_cursor(rows[-1])
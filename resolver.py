@@ -0,0 +1,114 @@
+import os
+import threading
+
+from database import get_names_version
+
+# Сколько имён каждой таблицы держать в памяти; при переполнении словарь очищается
+RESOLVER_MAX_ENTRIES = int(os.environ.get("MUSIC_CATALOG_RESOLVER_MAX_ENTRIES", "200000"))
+
+
+class NameResolver:
+    """
+    Кэш соответствий имя → id для исполнителей, жанров и альбомов.
+    Промах разрешается одним запросом INSERT ... ON CONFLICT DO NOTHING RETURNING id.
+    Кэш сбрасывается, когда меняется names_version в catalog_state
+    (удаление или переименование в этом или другом процессе).
+    """
+
+    def __init__(self, max_entries=RESOLVER_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._names_version = None
+        self._ids = {"artists": {}, "genres": {}, "albums": {}}
+
+    def begin(self, cursor):
+        """Начинает разрешение имён для одной записи; см. Resolution."""
+        version = get_names_version(cursor)
+        with self._lock:
+            if version != self._names_version:
+                for ids in self._ids.values():
+                    ids.clear()
+                self._names_version = version
+        return Resolution(self, cursor, version)
+
+    def lookup(self, table, key):
+        with self._lock:
+            return self._ids[table].get(key)
+
+    def publish(self, version, resolved):
+        """Запоминает id, полученные в успешно зафиксированной транзакции."""
+        with self._lock:
+            if version != self._names_version:
+                return
+            for (table, key), value in resolved.items():
+                ids = self._ids[table]
+                if len(ids) >= self.max_entries:
+                    ids.clear()
+                ids[key] = value
+
+    def clear(self):
+        with self._lock:
+            for ids in self._ids.values():
+                ids.clear()
+            self._names_version = None
+
+
+class Resolution:
+    """
+    Разрешение имён в рамках одной транзакции.
+    Новые id попадают в общий кэш только после publish(), то есть после commit:
+    при откате транзакции в кэше не останется id несуществующих строк.
+    """
+
+    def __init__(self, resolver, cursor, names_version):
+        self._resolver = resolver
+        self._cursor = cursor
+        self._names_version = names_version
+        self._resolved = {}
+
+    def _resolve(self, table, key, insert_sql, select_sql):
+        value = self._resolved.get((table, key))
+        if value is None:
+            value = self._resolver.lookup(table, key)
+        if value is None:
+            row = self._cursor.execute(insert_sql, key).fetchone()
+            if row is None:
+                # Строка уже была: ON CONFLICT DO NOTHING ничего не возвращает
+                row = self._cursor.execute(select_sql, key).fetchone()
+            value = row[0]
+        self._resolved[(table, key)] = value
+        return value
+
+    def artist(self, name):
+        return self._resolve(
+            "artists", (name,),
+            "INSERT INTO artists (name) VALUES (?) ON CONFLICT (name) DO NOTHING RETURNING id",
+            "SELECT id FROM artists WHERE name = ?"
+        )
+
+    def genre(self, name):
+        """id жанра; пустое имя означает «без жанра» (None)."""
+        if not name:
+            return None
+        return self._resolve(
+            "genres", (name,),
+            "INSERT INTO genres (name) VALUES (?) ON CONFLICT (name) DO NOTHING RETURNING id",
+            "SELECT id FROM genres WHERE name = ?"
+        )
+
+    def album(self, name, artist_id):
+        """id альбома исполнителя; пустое имя означает «без альбома» (None)."""
+        if not name:
+            return None
+        return self._resolve(
+            "albums", (name, artist_id),
+            "INSERT INTO albums (name, artist_id) VALUES (?, ?) "
+            "ON CONFLICT (name, artist_id) DO NOTHING RETURNING id",
+            "SELECT id FROM albums WHERE name = ? AND artist_id = ?"
+        )
+
+    def publish(self):
+        self._resolver.publish(self._names_version, self._resolved)
+
+
+name_resolver = NameResolver()
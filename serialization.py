@@ -0,0 +1,22 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него используется стандартный json
+    orjson = None
+
+
+def dumps(value):
+    """
+    JSON в виде bytes (UTF-8, без лишних пробелов). orjson, если установлен,
+    сериализует списки словарей и кортежей в несколько раз быстрее стандартного json.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
@@ -0,0 +1,46 @@
+"""
+Запуск API в production: несколько процессов-воркеров uvicorn на одной базе SQLite.
+
+    python serve.py --workers 4 --port 8000
+
+Схема базы мигрируется один раз до запуска воркеров. Воркеры пишут в базу
+в режиме WAL, ожидают чужие блокировки (MUSIC_CATALOG_BUSY_TIMEOUT_MS) и повторяют
+запросы после SQLITE_BUSY. Об изменениях каталога они узнают через Redis pub/sub,
+а без Redis — опрашивая версию каталога (MUSIC_CATALOG_INVALIDATION_POLL).
+"""
+import argparse
+import os
+
+import uvicorn
+
+from database import DATABASE_FILE, create_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.environ.get("MUSIC_CATALOG_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MUSIC_CATALOG_PORT", "8000")))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ.get("MUSIC_CATALOG_WORKERS", str(os.cpu_count() or 1))),
+        help="число процессов (по умолчанию — число ядер)"
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Миграции выполняются здесь, а не наперегонки в каждом воркере
+    create_database(DATABASE_FILE)
+    if args.workers > 1:
+        # Без Redis локальные кэши воркеров синхронизируются опросом версии каталога
+        os.environ.setdefault("MUSIC_CATALOG_INVALIDATION_POLL", "0.5")
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+
+from database import BACKUP_DIR, backup_database, copy_database, switch_read_database
+from music_catalog import trim_change_log
+
+# Периодические снимки базы (секунды, 0 — выключено) и сколько последних хранить
+SNAPSHOT_INTERVAL = float(os.environ.get("MUSIC_CATALOG_SNAPSHOT_INTERVAL", "0"))
+SNAPSHOT_KEEP = int(os.environ.get("MUSIC_CATALOG_SNAPSHOT_KEEP", "24"))
+SNAPSHOT_PREFIX = "auto-"
+# Файл реплики для чтения (пусто — читать из основной базы) и период её обновления
+READ_REPLICA = os.environ.get("MUSIC_CATALOG_READ_REPLICA", "")
+READ_REPLICA_REFRESH = float(os.environ.get("MUSIC_CATALOG_READ_REPLICA_REFRESH", "30"))
+# Сколько последних версий файла реплики хранить: предыдущую ещё могут читать другие воркеры
+REPLICA_KEEP = 2
+# Как часто сокращать журнал изменений до MUSIC_CATALOG_CHANGE_LOG_KEEP записей (секунды, 0 — никогда)
+CHANGE_LOG_PRUNE_INTERVAL = float(os.environ.get("MUSIC_CATALOG_CHANGE_LOG_PRUNE_INTERVAL", "300"))
+
+
+class PeriodicTask:
+    """Фоновый поток, вызывающий func каждые interval секунд до stop()."""
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.last_run = None
+        self.last_error = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        try:
+            self.func()
+            self.last_run = time.time()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Ошибка фоновой задачи {self.name}: {e}")
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+
+def take_snapshot():
+    """
+    Снимок базы в BACKUP_DIR; старые автоматические снимки сверх SNAPSHOT_KEEP удаляются.
+    Имя снимка определяется интервалом, в который он попал, поэтому при нескольких
+    воркерах снимок за интервал делает только первый из них.
+    """
+    slot = time.time() // SNAPSHOT_INTERVAL * SNAPSHOT_INTERVAL if SNAPSHOT_INTERVAL > 0 else time.time()
+    name = f"{SNAPSHOT_PREFIX}{time.strftime('%Y%m%d-%H%M%S', time.localtime(slot))}-{int(slot * 1000) % 1000:03d}.db"
+    if os.path.exists(os.path.join(BACKUP_DIR, name)):
+        return name
+    backup_database(name)
+    snapshots = sorted(
+        file for file in os.listdir(BACKUP_DIR)
+        if file.startswith(SNAPSHOT_PREFIX) and file.endswith(".db")
+    )
+    for old in snapshots[:-SNAPSHOT_KEEP] if SNAPSHOT_KEEP > 0 else []:
+        try:
+            os.remove(os.path.join(BACKUP_DIR, old))
+        except FileNotFoundError:
+            pass  # уже удалён другим воркером
+    return name
+
+
+_refresh_listeners = []
+# Файл версии реплики, из которого сейчас читает процесс
+replica_file = {}
+
+
+def on_replica_refresh(callback):
+    """Регистрирует функцию, вызываемую после каждого обновления реплики (например, сброс кэша)."""
+    _refresh_listeners.append(callback)
+    return callback
+
+
+def _replica_versions(path):
+    """
+    Версии файла реплики по возрастанию: [(номер, путь), ...]. Для path="replica.db"
+    это файлы replica.<номер>.db рядом с ним, номер — время создания в миллисекундах.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    root, ext = os.path.splitext(os.path.basename(path))
+    versions = []
+    for name in os.listdir(directory):
+        if name.startswith(root + ".") and name.endswith(ext):
+            number = name[len(root) + 1:len(name) - len(ext)]
+            if number.isdigit():
+                versions.append((int(number), os.path.join(directory, name)))
+    return sorted(versions)
+
+
+def _remove_old_replicas(path, current):
+    """Удаляет версии реплики старше последних REPLICA_KEEP, кроме текущей."""
+    for _, old in _replica_versions(path)[:-REPLICA_KEEP]:
+        if old == current:
+            continue
+        try:
+            os.remove(old)
+        except OSError:
+            pass  # файл ещё открыт другим воркером (Windows) — удалим при следующем обновлении
+
+
+def refresh_replica(path=None):
+    """
+    Обновляет реплику: копия основной базы пишется в новый файл версии
+    (replica.<номер>.db), чтения переключаются на него, а соединения со старой
+    версией закрываются. Открытый файл ни разу не перезаписывается, поэтому
+    обновление работает и на Windows, где открытый файл нельзя заменить.
+    """
+    path = path or READ_REPLICA
+    versions = _replica_versions(path)
+    if versions and time.time() - versions[-1][0] / 1000 < READ_REPLICA_REFRESH / 2:
+        # Реплику недавно обновил другой воркер — достаточно переключиться на неё
+        current = versions[-1][1]
+    else:
+        root, ext = os.path.splitext(path)
+        current = f"{root}.{int(time.time() * 1000)}{ext}"
+        temporary = f"{current}.{os.getpid()}.tmp"
+        copy_database(temporary, journal_mode="DELETE")
+        # Новое имя ещё никем не открыто: другие воркеры не увидят недописанную копию
+        os.replace(temporary, current)
+    switch_read_database(current)
+    replica_file["path"] = current
+    _remove_old_replicas(path, current)
+    for callback in _refresh_listeners:
+        callback()
+
+
+snapshots = PeriodicTask("db-snapshots", SNAPSHOT_INTERVAL, take_snapshot)
+replica = PeriodicTask("db-replica", READ_REPLICA_REFRESH, refresh_replica)
+change_log = PeriodicTask("change-log-prune", CHANGE_LOG_PRUNE_INTERVAL, trim_change_log)
+
+
+def start():
+    """Запускает фоновые задачи хранилища, включённые в настройках."""
+    if READ_REPLICA:
+        # Первая копия делается сразу, чтобы чтения не начинались со старого файла
+        replica.run_once()
+        replica.start()
+    if SNAPSHOT_INTERVAL > 0:
+        snapshots.start()
+    if CHANGE_LOG_PRUNE_INTERVAL > 0:
+        change_log.start()
+
+
+def stop():
+    replica.stop()
+    snapshots.stop()
+    change_log.stop()
+
+
+def status():
+    """Состояние фоновых задач хранилища для /internal/storage."""
+    return {
+        "read_replica": READ_REPLICA or None,
+        "read_replica_file": replica_file.get("path"),
+        "replica_refreshed_at": replica.last_run,
+        "replica_error": replica.last_error,
+        "snapshot_interval": SNAPSHOT_INTERVAL,
+        "snapshot_taken_at": snapshots.last_run,
+        "snapshot_error": snapshots.last_error,
+        "change_log_pruned_at": change_log.last_run,
+        "change_log_error": change_log.last_error,
+    }
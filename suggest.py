@@ -0,0 +1,347 @@
+import bisect
+import os
+import threading
+import time
+
+from database import get_read_connection
+
+# Подсказок каждого вида по умолчанию и наибольшее число подсказок в ответе
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+# Сколько слов названия (кроме первого) индексировать: «queen» находит «The Queen»
+SUGGEST_MAX_WORDS = int(os.environ.get("MUSIC_CATALOG_SUGGEST_MAX_WORDS", "4"))
+# Пауза перед полной перестройкой индекса, чтобы серия изменений перестраивала его один раз
+SUGGEST_REBUILD_DELAY = float(os.environ.get("MUSIC_CATALOG_SUGGEST_REBUILD_DELAY", "1"))
+# Изменения других воркеров применяются по журналу изменений; если их больше
+# (массовый импорт), индекс дешевле перестроить целиком
+SUGGEST_SYNC_MAX_CHANGES = int(os.environ.get("MUSIC_CATALOG_SUGGEST_SYNC_MAX_CHANGES", "10000"))
+# Сколько id подставлять в один запрос IN (...) при загрузке изменённых названий
+_SYNC_BATCH = 500
+
+KINDS = ("artists", "albums", "songs")
+
+
+class IndexNotReadyError(Exception):
+    """Индекс подсказок ещё строится после старта процесса."""
+
+
+def normalize(text):
+    """Ключ для поиска по префиксу: регистр свёрнут, «ё» — это «е», пробелы схлопнуты."""
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+def _word_keys(key):
+    """Хвосты названия, начинающиеся со 2-го, 3-го, ... слова."""
+    keys = []
+    position = key.find(" ")
+    while position != -1 and len(keys) < SUGGEST_MAX_WORDS:
+        keys.append(key[position + 1:])
+        position = key.find(" ", position + 1)
+    return keys
+
+
+class _Names:
+    """
+    Названия одного вида (исполнители, альбомы или песни).
+    starts — отсортированные пары (ключ названия, id), words — такие же пары
+    для хвостов названия с начала каждого следующего слова. Поиск — bisect по префиксу.
+    """
+
+    def __init__(self, items=None):
+        self.items = {}
+        self.starts = []
+        self.words = []
+        if items:
+            for item_id, name, artist in items:
+                key = normalize(name)
+                self.items[item_id] = (name, artist, key)
+                self.starts.append((key, item_id))
+                self.words.extend((word, item_id) for word in _word_keys(key))
+            self.starts.sort()
+            self.words.sort()
+
+    @staticmethod
+    def _delete(keys, entry):
+        index = bisect.bisect_left(keys, entry)
+        if index < len(keys) and keys[index] == entry:
+            del keys[index]
+
+    def add(self, item_id, name, artist=None):
+        if self.items.get(item_id, (None, None))[:2] == (name, artist):
+            return
+        self.remove(item_id)
+        key = normalize(name)
+        self.items[item_id] = (name, artist, key)
+        bisect.insort(self.starts, (key, item_id))
+        for word in _word_keys(key):
+            bisect.insort(self.words, (word, item_id))
+
+    def remove(self, item_id):
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return
+        key = item[2]
+        self._delete(self.starts, (key, item_id))
+        for word in _word_keys(key):
+            self._delete(self.words, (word, item_id))
+
+    def search(self, prefix, limit):
+        """id подходящих названий: сначала совпадения с начала названия, потом с начала слова."""
+        found = []
+        for keys in (self.starts, self.words):
+            index = bisect.bisect_left(keys, (prefix,))
+            while index < len(keys) and len(found) < limit:
+                key, item_id = keys[index]
+                if not key.startswith(prefix):
+                    break
+                if item_id not in found:
+                    found.append(item_id)
+                index += 1
+        return found
+
+
+class SuggestionIndex:
+    """
+    Префиксный индекс названий исполнителей, альбомов и песен в памяти процесса.
+    Строится целиком при старте и после массовых изменений (очистка, импорт,
+    восстановление). Записи этого процесса обновляют его сразу после фиксации,
+    а изменения других воркеров применяются по журналу изменений (sync):
+    индекс помнит номер последней учтённой записи журнала и после своих записей тоже
+    продвигает его через sync. Поиск не обращается к SQLite.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = None
+        self._rebuilding = False
+        self._dirty = False
+        self._syncing = False
+        self._sync_again = False
+        # Номер записи журнала изменений, до которой индекс актуален
+        self._seq = 0
+        self.built_at = None
+        self.build_seconds = None
+
+    @property
+    def ready(self):
+        return self._names is not None
+
+    def _load(self):
+        conn = get_read_connection()
+        if conn is None:
+            raise RuntimeError("Нет подключения к базе данных")
+        try:
+            # Названия и номер журнала читаются из одного снимка базы
+            conn.execute("BEGIN")
+            seq = conn.execute("SELECT coalesce(max(seq), 0) FROM changes").fetchone()[0]
+            return seq, {
+                "artists": _Names(conn.execute("SELECT id, name, NULL FROM artists").fetchall()),
+                "albums": _Names(conn.execute('''
+                    SELECT a.id, a.name, ar.name
+                    FROM albums a JOIN artists ar ON a.artist_id = ar.id
+                ''').fetchall()),
+                "songs": _Names(conn.execute('''
+                    SELECT s.id, s.title, ar.name
+                    FROM songs s JOIN artists ar ON s.artist_id = ar.id
+                ''').fetchall()),
+            }
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def rebuild(self):
+        """Строит индекс заново по текущему содержимому базы и подменяет им старый."""
+        started = time.perf_counter()
+        seq, names = self._load()
+        with self._lock:
+            self._names = names
+            self._seq = seq
+        self.built_at = time.time()
+        self.build_seconds = time.perf_counter() - started
+
+    def rebuild_soon(self, delay=SUGGEST_REBUILD_DELAY):
+        """Перестраивает индекс в фоновом потоке; повторные вызовы во время сборки объединяются."""
+        with self._lock:
+            if self._rebuilding:
+                self._dirty = True
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_loop, args=(delay,), name="suggest-index", daemon=True).start()
+
+    def _rebuild_loop(self, delay):
+        while True:
+            if delay:
+                time.sleep(delay)
+            try:
+                self.rebuild()
+                # Изменения, зафиксированные после снимка, из которого строился индекс
+                if not self.sync():
+                    with self._lock:
+                        self._dirty = True
+            except Exception as e:
+                print(f"Ошибка при построении индекса подсказок: {e}")
+            with self._lock:
+                if not self._dirty:
+                    self._rebuilding = False
+                    return
+                self._dirty = False
+
+    def _update(self, apply):
+        # Если индекс сейчас перестраивается из снимка без этого изменения,
+        # его применит sync() по журналу сразу после сборки
+        with self._lock:
+            if self._names is None:
+                return
+            apply(self._names)
+        # Изменение видно в подсказках сразу, а номер журнала продвигает sync():
+        # иначе следующая синхронизация перечитывала бы все записи этого процесса
+        # и после SUGGEST_SYNC_MAX_CHANGES таких записей перестраивала бы индекс целиком
+        self.sync_soon()
+
+    def sync_soon(self):
+        """Применяет изменения из журнала в фоновом потоке; повторные вызовы объединяются."""
+        with self._lock:
+            if self._syncing:
+                self._sync_again = True
+                return
+            self._syncing = True
+        threading.Thread(target=self._sync_loop, name="suggest-sync", daemon=True).start()
+
+    def _sync_loop(self):
+        while True:
+            try:
+                if not self.sync():
+                    self.rebuild_soon(delay=0)
+            except Exception as e:
+                print(f"Ошибка при обновлении индекса подсказок: {e}")
+            with self._lock:
+                if not self._sync_again:
+                    self._syncing = False
+                    return
+                self._sync_again = False
+
+    @staticmethod
+    def _fetch(conn, sql, ids):
+        rows = []
+        ids = list(ids)
+        for start in range(0, len(ids), _SYNC_BATCH):
+            part = ids[start:start + _SYNC_BATCH]
+            rows += conn.execute(sql.format(", ".join("?" for _ in part)), part).fetchall()
+        return rows
+
+    def sync(self):
+        """
+        Применяет к индексу изменения каталога из журнала после последней учтённой записи
+        (так приходят изменения других воркеров). Возвращает False, если журнал не описывает
+        изменения по отдельности (очистка, восстановление, журнал сокращён) или их больше
+        SUGGEST_SYNC_MAX_CHANGES, — тогда индекс нужно перестроить целиком.
+        """
+        with self._lock:
+            if self._names is None:
+                return True
+            seq = self._seq
+        conn = get_read_connection()
+        if conn is None:
+            raise RuntimeError("Нет подключения к базе данных")
+        try:
+            conn.execute("BEGIN")
+            first, last = conn.execute("SELECT min(seq), max(seq) FROM changes").fetchone()
+            if last is None or last <= seq:
+                return True
+            if first > seq + 1:
+                return False
+            rows = conn.execute(
+                "SELECT entity, entity_id, op FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (seq, SUGGEST_SYNC_MAX_CHANGES + 1)
+            ).fetchall()
+            if len(rows) > SUGGEST_SYNC_MAX_CHANGES or any(op in ("clear", "reset") for _, _, op in rows):
+                return False
+            # Несколько изменений одной сущности сворачиваются в последнее
+            latest = {(entity, entity_id): op for entity, entity_id, op in rows}
+            upserts = {kind: [] for kind in KINDS}
+            deletes = {kind: [] for kind in KINDS}
+            for (entity, entity_id), op in latest.items():
+                if entity in KINDS:
+                    (upserts if op == "upsert" else deletes)[entity].append(entity_id)
+            artists = self._fetch(conn, "SELECT id, name FROM artists WHERE id IN ({})", upserts["artists"])
+            albums = self._fetch(conn, '''
+                SELECT a.id, a.name, ar.name
+                FROM albums a JOIN artists ar ON a.artist_id = ar.id
+                WHERE a.id IN ({})
+            ''', upserts["albums"])
+            songs = self._fetch(conn, '''
+                SELECT s.id, s.title, s.artist_id, ar.name, s.album_id, a.name
+                FROM songs s
+                JOIN artists ar ON s.artist_id = ar.id
+                LEFT JOIN albums a ON s.album_id = a.id
+                WHERE s.id IN ({})
+            ''', upserts["songs"])
+        finally:
+            conn.rollback()
+            conn.close()
+
+        with self._lock:
+            if self._names is None or self._seq != seq:
+                # Индекс тем временем перестроен из более нового снимка
+                return True
+            names = self._names
+            for kind in KINDS:
+                for item_id in deletes[kind]:
+                    names[kind].remove(item_id)
+            for artist_id, name in artists:
+                names["artists"].add(artist_id, name)
+            for album_id, name, artist_name in albums:
+                names["albums"].add(album_id, name, artist_name)
+            for song_id, title, artist_id, artist_name, album_id, album_name in songs:
+                names["artists"].add(artist_id, artist_name)
+                if album_id is not None:
+                    names["albums"].add(album_id, album_name, artist_name)
+                names["songs"].add(song_id, title, artist_name)
+            self._seq = last
+        return True
+
+    def add_song(self, song_id, title, artist_id, artist_name, album_id=None, album_name=None):
+        """Добавляет (или обновляет) песню вместе с её исполнителем и альбомом."""
+        def apply(names):
+            names["artists"].add(artist_id, artist_name)
+            if album_id is not None:
+                names["albums"].add(album_id, album_name, artist_name)
+            names["songs"].add(song_id, title, artist_name)
+        self._update(apply)
+
+    def remove(self, kind, ids):
+        def apply(names):
+            for item_id in ids:
+                names[kind].remove(item_id)
+        self._update(apply)
+
+    def suggest(self, query, limit=SUGGEST_LIMIT, kinds=KINDS):
+        """
+        Подсказки по началу названия или любого из первых слов названия:
+        {"artists": [...], "albums": [...], "songs": [...]}, не больше limit каждого вида.
+        """
+        prefix = normalize(query)
+        with self._lock:
+            names = self._names
+            if names is None:
+                raise IndexNotReadyError("Индекс подсказок ещё строится")
+            result = {}
+            for kind in kinds:
+                result[kind] = []
+                for item_id in names[kind].search(prefix, limit) if prefix else ():
+                    name, artist, _ = names[kind].items[item_id]
+                    suggestion = {"id": item_id, "name": name}
+                    if artist is not None:
+                        suggestion["artist"] = artist
+                    result[kind].append(suggestion)
+        return result
+
+    def stats(self):
+        with self._lock:
+            names = self._names
+            sizes = {kind: len(names[kind].items) for kind in KINDS} if names is not None else None
+        return {"ready": sizes is not None, "sizes": sizes, "built_at": self.built_at,
+                "build_seconds": self.build_seconds, "rebuilding": self._rebuilding, "seq": self._seq}
+
+
+suggestion_index = SuggestionIndex()
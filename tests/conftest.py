@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Приложение читает настройки при импорте модулей, поэтому тестовая база
+# и локальный кэш (без Redis) задаются до импорта database/music_catalog
+_directory = tempfile.mkdtemp(prefix="music_catalog_tests_")
+os.environ["MUSIC_CATALOG_DB"] = os.path.join(_directory, "catalog.db")
+os.environ["MUSIC_CATALOG_REDIS_URL"] = ""
+os.environ["MUSIC_CATALOG_RATE_LIMIT"] = "0"
+os.environ["MUSIC_CATALOG_BACKUP_DIR"] = os.path.join(_directory, "backups")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache  # noqa: E402
+import database  # noqa: E402
+import music_catalog  # noqa: E402
+from writer import write_coordinator  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_database():
+    """Схема тестовой базы создаётся один раз; в конце сессии закрываются поток записи и пулы."""
+    database.create_database(database.DATABASE_FILE)
+    yield database.DATABASE_FILE
+    write_coordinator.shutdown()
+    database.close_pool()
+
+
+@pytest.fixture
+def catalog():
+    """Пустой каталог и чистый локальный кэш ответов."""
+    assert music_catalog.clear_database()
+    cache.configure_cache()
+    return music_catalog
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import admission
+from admission import AdmissionMiddleware, RateLimiter, classify
+from db_executor import DBExecutor
+
+
+async def ok(request):
+    return PlainTextResponse("ok")
+
+
+@pytest.fixture
+def client():
+    app = Starlette(routes=[Route("/{path:path}", ok, methods=["GET", "POST", "DELETE"])])
+    with TestClient(AdmissionMiddleware(app)) as client:
+        yield client
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = DBExecutor(workers=1, max_queue=4)
+    monkeypatch.setattr(admission, "db_executor", executor)
+    monkeypatch.setattr(admission, "SHED_QUEUE_WAIT_MS", 20)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("method, path, query, expected", [
+    ("GET", "/search", b"query=queen", "search"),
+    ("GET", "/search", b"query=+", "browse"),
+    ("GET", "/export/jobs/abc", b"", "read"),
+    ("POST", "/export/jobs", b"", "export"),
+    ("POST", "/songs/bulk", b"", "bulk"),
+    ("DELETE", "/clear", b"", "admin"),
+    ("GET", "/changes/stream", b"", "stream"),
+    ("POST", "/songs", b"", "write"),
+    ("GET", "/metrics", b"", None),
+])
+def test_classify(method, path, query, expected):
+    assert classify(method, path, query) == expected
+
+
+def test_rate_limit_returns_429_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(admission, "rate_limiter", RateLimiter(rate=1, burst=2, global_rate=0, use_redis=False))
+
+    assert client.get("/songs/1").status_code == 200
+    assert client.get("/songs/1").status_code == 200
+    response = client.get("/songs/1")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_default_limits_allow_a_burst_of_exports(client, monkeypatch):
+    monkeypatch.setattr(admission, "rate_limiter", RateLimiter(rate=50, burst=200, global_rate=0, use_redis=False))
+
+    assert all(client.post("/export/jobs").status_code == 200 for _ in range(20))
+
+
+def test_overload_sheds_expensive_requests_until_cancelled_call_leaves_queue(client, executor, monkeypatch):
+    monkeypatch.setattr(admission, "rate_limiter", RateLimiter(rate=0, global_rate=0, use_redis=False))
+    started, release = threading.Event(), threading.Event()
+    executor.submit(lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)
+
+    async def queue_and_cancel():
+        call = asyncio.ensure_future(executor.run(int))
+        await asyncio.sleep(0.05)
+        assert admission.overloaded()
+        response = client.get("/search", params={"query": "queen"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        # Дешёвые запросы не сбрасываются
+        assert client.get("/songs/1").status_code == 200
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    try:
+        asyncio.run(queue_and_cancel())
+        assert not admission.overloaded()
+        assert client.get("/search", params={"query": "queen"}).status_code == 200
+    finally:
+        release.set()
+
+
+def test_concurrency_limit_returns_503(client, monkeypatch):
+    monkeypatch.setattr(admission, "rate_limiter", RateLimiter(rate=0, global_rate=0, use_redis=False))
+    monkeypatch.setattr(admission.ENDPOINT_CLASSES["admin"], "concurrency", 1)
+    assert admission.concurrency_limits.acquire("admin")
+    try:
+        response = client.delete("/clear")
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+    finally:
+        admission.concurrency_limits.release("admin")
+    assert client.delete("/clear").status_code == 200
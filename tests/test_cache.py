@@ -0,0 +1,110 @@
+import cache
+from cache import CatalogCache, cached
+
+
+class _BrokenRedis:
+    """Клиент Redis, у которого каждая команда падает, как при потере связи."""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("Redis недоступен")
+        return fail
+
+
+def _counting(namespace, scoped=False):
+    calls = []
+
+    @cached(namespace, scoped=scoped)
+    def load(name, page=1):
+        calls.append((name, page))
+        return {"name": name, "page": page, "call": len(calls)}
+
+    return load, calls
+
+
+def test_cached_result_is_reused_until_scope_is_invalidated():
+    cache.configure_cache()
+    load, calls = _counting("album", scoped=True)
+
+    assert load("A") == load("A")
+    assert load("A", page=2)["page"] == 2
+    assert len(calls) == 2
+
+    cache.catalog_cache.invalidate(search=False, albums=["A"])
+    assert load("A")["call"] == 3
+    assert load("A")["call"] == 3
+
+
+def test_invalidating_one_scope_keeps_other_scopes():
+    cache.configure_cache()
+    load, calls = _counting("artist", scoped=True)
+    load("A")
+    load("B")
+
+    cache.catalog_cache.invalidate(search=False, artists=["A"])
+    load("A")
+    load("B")
+    assert calls == [("A", 1), ("B", 1), ("A", 1)]
+
+
+def test_invalidate_all_drops_every_namespace():
+    cache.configure_cache()
+    search, search_calls = _counting("search")
+    album, album_calls = _counting("album", scoped=True)
+    search("q")
+    album("A")
+
+    cache.catalog_cache.invalidate_all()
+    search("q")
+    album("A")
+    assert len(search_calls) == 2
+    assert len(album_calls) == 2
+
+
+def test_none_is_not_cached():
+    cache.configure_cache()
+    calls = []
+
+    @cached("album", scoped=True)
+    def missing(name):
+        calls.append(name)
+
+    assert missing("A") is None
+    assert missing("A") is None
+    assert calls == ["A", "A"]
+
+
+def test_unavailable_redis_falls_back_to_local_cache():
+    store = CatalogCache(client=_BrokenRedis())
+    key = store.make_key("album.details", "album:A", ("A",), {})
+    store.set(key, {"songs": [1, 2]})
+
+    assert store.get(key) == {"songs": [1, 2]}
+    store.invalidate(search=False, albums=["A"])
+    assert store.get(store.make_key("album.details", "album:A", ("A",), {})) is None
+
+
+def test_local_cache_evicts_least_recently_used():
+    store = cache.LocalCache(max_entries=2)
+    store.set("a", b"1")
+    store.set("b", b"2")
+    store.get("a")
+    store.set("c", b"3")
+
+    assert store.get("a") == b"1"
+    assert store.get("b") is None
+    assert store.get("c") == b"3"
+
+
+def test_writes_invalidate_cached_album_and_search(catalog):
+    catalog.add_song("Queen", "Bohemian Rhapsody", "Rock", "A Night at the Opera", 1975)
+    album = catalog.get_album_details("A Night at the Opera")
+    assert [song["title"] for song in album["songs"]] == ["Bohemian Rhapsody"]
+    assert len(catalog.search_tracks_page("rhapsody")["results"]) == 1
+
+    catalog.add_song("Queen", "Love of My Life", "Rock", "A Night at the Opera", 1975)
+    album = catalog.get_album_details("A Night at the Opera")
+    assert [song["title"] for song in album["songs"]] == ["Bohemian Rhapsody", "Love of My Life"]
+
+    catalog.delete_song("Bohemian Rhapsody")
+    assert catalog.search_tracks_page("rhapsody")["results"] == []
@@ -0,0 +1,56 @@
+def test_new_song_appears_with_its_artist_and_album(catalog):
+    since = catalog.get_last_change_seq()
+    catalog.add_song("Queen", "Bohemian Rhapsody", "Rock", "A Night at the Opera", 1975)
+
+    delta = catalog.get_changes(since)
+    assert delta["last_seq"] > since
+    assert delta["has_more"] is False
+    assert [song["title"] for song in delta["upserts"]["songs"]] == ["Bohemian Rhapsody"]
+    assert [artist["name"] for artist in delta["upserts"]["artists"]] == ["Queen"]
+    assert [album["name"] for album in delta["upserts"]["albums"]] == ["A Night at the Opera"]
+    assert delta["deletes"] == {}
+
+
+def test_changes_of_one_entity_collapse_into_the_last(catalog):
+    catalog.add_song("Queen", "Bohemian Rhapsody", "Rock", None, 1975)
+    song_id = catalog.get_changes(0)["upserts"]["songs"][0]["id"]
+    since = catalog.get_last_change_seq()
+
+    catalog.update_song_by_id(song_id, new_year=1976)
+    catalog.delete_song_by_id(song_id)
+
+    delta = catalog.get_changes(since)
+    assert "songs" not in delta["upserts"]
+    assert delta["deletes"]["songs"] == [song_id]
+
+
+def test_limit_splits_changes_into_portions(catalog):
+    since = catalog.get_last_change_seq()
+    for number in range(3):
+        catalog.add_song("Queen", f"Song {number}", "Rock", None, 1981)
+
+    first = catalog.get_changes(since, limit=2)
+    assert first["has_more"] is True
+    rest = catalog.get_changes(first["last_seq"])
+    assert rest["has_more"] is False
+    songs = first["upserts"].get("songs", []) + rest["upserts"].get("songs", [])
+    assert sorted(song["title"] for song in songs) == ["Song 0", "Song 1", "Song 2"]
+
+
+def test_clear_tells_client_to_drop_its_copy(catalog):
+    catalog.add_song("Queen", "Bohemian Rhapsody", "Rock", None, 1975)
+    since = catalog.get_last_change_seq()
+    catalog.clear_database()
+    catalog.add_song("ABBA", "Waterloo", "Pop", None, 1974)
+
+    delta = catalog.get_changes(since)
+    assert delta["cleared"] is True
+    assert [song["title"] for song in delta["upserts"]["songs"]] == ["Waterloo"]
+
+
+def test_unknown_position_requires_reset(catalog):
+    last = catalog.get_last_change_seq()
+
+    delta = catalog.get_changes(last + 100)
+    assert delta["reset"] is True
+    assert delta["last_seq"] == last
@@ -0,0 +1,67 @@
+import database
+from database import get_catalog_version
+
+
+def _state():
+    conn = database.get_read_connection()
+    try:
+        return dict(conn.execute("SELECT version, names_version FROM catalog_state WHERE id = 1").fetchone())
+    finally:
+        conn.close()
+
+
+def _change_log():
+    conn = database.get_read_connection()
+    try:
+        return [tuple(row) for row in conn.execute("SELECT seq, entity, op FROM changes ORDER BY seq")]
+    finally:
+        conn.close()
+
+
+def _titles(catalog):
+    return [song["name"] for song in catalog.search_tracks("")]
+
+
+def test_clear_and_restore_bump_versions_and_reset_change_log(catalog):
+    catalog.add_song("Queen", "Mustapha", "Rock", "Jazz", 1978)
+    catalog.add_song("ABBA", "Waterloo", "Pop", None, 1974)
+    before = _state()
+    since = catalog.get_last_change_seq()
+
+    snapshot = catalog.clear_database(backup=True)
+    assert isinstance(snapshot, str)
+    assert _titles(catalog) == []
+    cleared = _state()
+    assert cleared["version"] > before["version"]
+    assert cleared["names_version"] > before["names_version"]
+    [(clear_seq, _, op)] = _change_log()
+    assert op == "clear" and clear_seq > since
+    assert catalog.get_changes(since)["cleared"] is True
+
+    assert catalog.restore_catalog(snapshot) is True
+    assert _titles(catalog) == ["Mustapha", "Waterloo"]
+    restored = _state()
+    # Версии продолжаются, а не откатываются к значениям из снимка
+    assert restored["version"] > cleared["version"]
+    assert restored["names_version"] > cleared["names_version"]
+    [(reset_seq, _, op)] = _change_log()
+    assert op == "reset" and reset_seq > clear_seq
+    assert catalog.get_changes(clear_seq)["reset"] is True
+
+
+def test_restore_of_missing_snapshot_fails(catalog):
+    version = get_catalog_version()
+
+    assert catalog.restore_catalog("нет-такого.db") is False
+    assert get_catalog_version() == version
+
+
+def test_clear_is_ordered_with_queued_writes(catalog):
+    added = [catalog.add_song.submit("Queen", f"Song {number}", "Rock", None, 1980) for number in range(20)]
+    cleared = catalog.clear_database.submit()
+    after = catalog.add_song.submit("ABBA", "Waterloo", "Pop", None, 1974)
+
+    assert all(future.result(timeout=5) for future in added)
+    assert cleared.result(timeout=5) is True
+    assert after.result(timeout=5) is True
+    assert _titles(catalog) == ["Waterloo"]
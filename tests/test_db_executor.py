@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+import pytest
+
+from db_executor import DBExecutor, ExecutorBusyError
+
+
+@pytest.fixture
+def executor():
+    executor = DBExecutor(workers=1, max_queue=2)
+    yield executor
+    executor.shutdown()
+
+
+def _occupy(executor):
+    """Занимает единственный поток пула, пока не будет установлено возвращённое событие."""
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    executor.submit(block)
+    assert started.wait(5)
+    return release
+
+
+def test_run_returns_result(executor):
+    assert asyncio.run(executor.run(sum, [1, 2, 3])) == 6
+    assert executor.stats()["completed"] == 1
+
+
+def test_full_queue_is_rejected(executor):
+    release = _occupy(executor)
+    try:
+        executor.submit(int)
+        executor.submit(int)
+        with pytest.raises(ExecutorBusyError):
+            executor.submit(int)
+        assert executor.stats()["rejected"] == 1
+    finally:
+        release.set()
+
+
+def test_cancelled_queued_call_leaves_the_queue(executor):
+    release = _occupy(executor)
+
+    async def cancel_queued():
+        call = asyncio.ensure_future(executor.run(int))
+        await asyncio.sleep(0.01)
+        assert executor.stats()["queue_depth"] == 1
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    try:
+        asyncio.run(cancel_queued())
+        assert executor.stats()["queue_depth"] == 0
+        assert executor.queue_wait() == 0.0
+    finally:
+        release.set()
+    # Отменённая задача не заняла место: очередь снова принимает max_queue задач
+    assert asyncio.run(executor.run(int)) == 0
+    assert executor.stats()["queue_depth"] == 0
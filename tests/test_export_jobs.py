@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+import pytest
+
+import export_jobs
+from database import get_catalog_version
+from export_jobs import ExportJobManager, public_job
+
+
+@pytest.fixture
+def jobs(catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_jobs, "EXPORT_JOB_LEASE", 0.3)
+    manager = ExportJobManager(directory=str(tmp_path / "exports"))
+    yield manager
+    manager.shutdown()
+
+
+def _wait(jobs, job_id, statuses=("done", "failed")):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"задача {job_id} не завершилась: {job['status']}")
+
+
+def _foreign_job(jobs, status, heartbeat_age):
+    """Задача другого воркера в общем хранилище с последней отметкой heartbeat_age секунд назад."""
+    version = get_catalog_version()
+    job = {
+        "id": "foreign", "format": "csv", "filters": {"artist": None, "genre": None, "year": None},
+        "catalog_version": version, "status": status, "progress": 0, "total": None, "error": None,
+        "path": None, "created_at": time.time() - 60, "heartbeat_at": time.time() - heartbeat_age,
+        "finished_at": None,
+    }
+    jobs.store.save(job)
+    jobs.store.set_artifact(jobs._cache_key("csv", None, None, None, version), job["id"])
+    return job
+
+
+def test_finished_export_is_reused_until_catalog_changes(jobs, catalog):
+    catalog.add_song("Queen", "Mustapha", "Rock", "Jazz", 1978)
+
+    first = _wait(jobs, jobs.submit("csv")["id"])
+    assert first["status"] == "done"
+    assert first["progress"] == first["total"] == 1
+    assert os.path.exists(first["path"])
+    assert "path" not in public_job(first)
+    assert jobs.submit("csv")["id"] == first["id"]
+
+    catalog.add_song("ABBA", "Waterloo", "Pop", None, 1974)
+    second = _wait(jobs, jobs.submit("csv")["id"])
+    assert second["id"] != first["id"]
+    assert second["total"] == 2
+
+
+def test_missing_artifact_is_exported_again(jobs):
+    first = _wait(jobs, jobs.submit("ndjson")["id"])
+    os.remove(first["path"])
+
+    assert jobs.submit("ndjson")["id"] != first["id"]
+
+
+def test_unknown_format_is_rejected(jobs):
+    with pytest.raises(ValueError):
+        jobs.submit("pdf")
+
+
+def test_abandoned_foreign_job_is_failed_and_requeued(jobs):
+    _foreign_job(jobs, "running", heartbeat_age=10)
+
+    job = jobs.get("foreign")
+    assert job["status"] == "failed"
+    assert job["finished_at"] is not None
+    assert jobs.store.load("foreign")["status"] == "failed"
+
+    _foreign_job(jobs, "queued", heartbeat_age=10)
+    new = jobs.submit("csv")
+    assert new["id"] != "foreign"
+    assert _wait(jobs, new["id"])["status"] == "done"
+
+
+def test_live_foreign_job_is_returned(jobs):
+    _foreign_job(jobs, "running", heartbeat_age=0)
+
+    assert jobs.submit("csv")["id"] == "foreign"
+    assert jobs.get("foreign")["status"] == "running"
+
+
+def test_heartbeat_keeps_long_job_alive(jobs, monkeypatch):
+    release = threading.Event()
+
+    def slow_export(fmt, path, progress=None, **filters):
+        release.wait(5)
+        open(path, "w").close()
+        return 0
+
+    monkeypatch.setattr(export_jobs, "export_to_file", slow_export)
+    job = jobs.submit("csv")
+    try:
+        # Задача работает дольше нескольких сроков аренды, но отметки продлевают её
+        time.sleep(1)
+        current = jobs.store.load(job["id"])
+        assert current["status"] == "running"
+        assert time.time() - current["heartbeat_at"] < export_jobs.EXPORT_JOB_LEASE
+        assert jobs.submit("csv")["id"] == job["id"]
+    finally:
+        release.set()
+    assert _wait(jobs, job["id"])["status"] == "done"
@@ -0,0 +1,124 @@
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import main
+from http_cache import CompressionMiddleware
+
+
+@pytest.fixture
+def client(catalog):
+    # Без lifespan: поток записи и пулы тестовой базы принадлежат сессии тестов
+    return TestClient(main.app)
+
+
+def _revalidate(client, url, etag):
+    return client.get(url, headers={"If-None-Match": etag})
+
+
+def test_matching_etag_gives_304(client, catalog):
+    catalog.add_song("Queen", "Mustapha", "Rock", "Jazz", 1978)
+
+    response = client.get("/albums/Jazz")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+
+    cached = _revalidate(client, "/albums/Jazz", etag)
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+
+def test_changed_entity_gives_200_with_new_etag(client, catalog):
+    catalog.add_song("Queen", "Mustapha", "Rock", "Jazz", 1978)
+    etag = client.get("/albums/Jazz").headers["etag"]
+
+    catalog.add_song("Queen", "Bicycle Race", "Rock", "Jazz", 1978)
+    response = _revalidate(client, "/albums/Jazz", etag)
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert [song["title"] for song in response.json()["songs"]] == ["Mustapha", "Bicycle Race"]
+
+
+def test_change_elsewhere_in_catalog_keeps_entity_fresh(client, catalog):
+    catalog.add_song("Queen", "Mustapha", "Rock", "Jazz", 1978)
+    etag = client.get("/albums/Jazz").headers["etag"]
+
+    # Версия каталога выросла, но сам альбом не менялся
+    catalog.add_song("ABBA", "Waterloo", "Pop", "Waterloo", 1974)
+
+    assert _revalidate(client, "/albums/Jazz", etag).status_code == 304
+
+
+def test_by_id_routes_are_conditional(client, catalog):
+    catalog.add_song("Queen", "Mustapha", "Rock", "Jazz", 1978)
+    album = client.get("/albums/Jazz").json()["album"]
+    album_url = f"/albums/by-id/{album['id']}"
+    artist_url = f"/artists/by-id/{album['artist_id']}"
+
+    album_etag = client.get(album_url).headers["etag"]
+    artist_etag = client.get(artist_url).headers["etag"]
+    assert _revalidate(client, album_url, album_etag).status_code == 304
+    assert _revalidate(client, artist_url, artist_etag).status_code == 304
+
+    catalog.add_song("ABBA", "Waterloo", "Pop", "Waterloo", 1974)
+    assert _revalidate(client, album_url, album_etag).status_code == 304
+
+    catalog.add_song("Queen", "Don't Stop Me Now", "Rock", "Live Killers", 1979)
+    response = _revalidate(client, artist_url, artist_etag)
+    assert response.status_code == 200
+    assert response.headers["etag"] != artist_etag
+    assert len(response.json()["albums"]) == 2
+
+
+def test_missing_by_id_entity_is_404(client):
+    assert client.get("/albums/by-id/999").status_code == 404
+    assert client.get("/artists/by-id/999").status_code == 404
+
+
+def _compression_client():
+    rows = [{"id": number, "name": f"Song {number}"} for number in range(200)]
+
+    def chunks():
+        for row in rows:
+            yield (str(row) + "\n").encode()
+
+    app = Starlette(routes=[
+        Route("/json", lambda request: JSONResponse(rows)),
+        Route("/small", lambda request: JSONResponse({"ok": True})),
+        Route("/stream", lambda request: StreamingResponse(chunks(), media_type="application/x-ndjson")),
+    ])
+    return TestClient(CompressionMiddleware(app))
+
+
+def test_large_json_is_gzipped():
+    client = _compression_client()
+
+    response = client.get("/json", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 200
+    raw = client.get("/json", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+    assert int(response.headers["content-length"]) < int(raw.headers["content-length"])
+
+
+def test_small_and_streaming_responses_are_not_compressed():
+    client = _compression_client()
+
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+    stream = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert stream.status_code == 200
+    assert "content-encoding" not in stream.headers
+    assert len(stream.content.splitlines()) == 200
+    with pytest.raises(OSError):
+        gzip.decompress(stream.content)
@@ -0,0 +1,103 @@
+import io
+import json
+import sqlite3
+
+import importer
+from importer import import_songs_file
+
+
+def _write(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def _txt_files(tmp_path, songs):
+    return (
+        _write(tmp_path / "Artists.txt", ["1`Queen`", "2`ABBA`", "3`Queen`"]),
+        _write(tmp_path / "Genres.txt", ["1`Rock`"]),
+        _write(tmp_path / "Songs.txt", songs),
+        _write(tmp_path / "albums.txt", ["1`Jazz`1`", "1`Jazz again`1`"]),
+    )
+
+
+def test_txt_duplicates_are_reported_and_not_counted(catalog, tmp_path):
+    artists, genres, songs, albums = _txt_files(tmp_path, [
+        "1`Mustapha`1`1`1`1978",
+        "1`Mustapha (дубль)`1`1`1`1978",
+        "2`Waterloo`2``1`1974",
+        "3`Broken`9```1999",
+    ])
+
+    report = catalog.populate_database_from_txt(artists, genres, songs, albums, workers=1)
+
+    places = sorted(error["line"] for error in report["errors"])
+    # Повторы id (Songs.txt:2, albums.txt:2) и имени (Artists.txt:3), песня без исполнителя (Songs.txt:4)
+    assert places == sorted([f"{artists}:3", f"{albums}:2", f"{songs}:2", f"{songs}:4"])
+    # 2 исполнителя + 1 жанр + 1 альбом + 2 песни
+    assert report["imported"] == 6
+    assert report["failed"] == 4
+    assert [song["name"] for song in catalog.search_tracks("")] == ["Mustapha", "Waterloo"]
+
+
+def test_txt_reimport_counts_nothing_new(catalog, tmp_path):
+    files = _txt_files(tmp_path, ["1`Mustapha`1`1`1`1978"])
+    assert catalog.populate_database_from_txt(*files, workers=1)["imported"] == 5
+
+    report = catalog.populate_database_from_txt(*files, workers=1)
+    assert report["imported"] == 0
+    assert report["failed"] == 7
+
+
+def test_bulk_csv_reports_bad_lines_and_imports_the_rest(catalog):
+    stream = io.StringIO(
+        "artist,title,genre,album,year\n"
+        "Queen,Mustapha,Rock,Jazz,1978\n"
+        ",Без исполнителя,Rock,,\n"
+        "Queen,Bicycle Race,Rock,Jazz,не год\n"
+        "ABBA,Waterloo,,,1974\n"
+    )
+
+    report = import_songs_file(stream, "csv")
+
+    assert report["imported"] == 2
+    assert report["failed"] == 2
+    assert [error["line"] for error in report["errors"]] == [3, 4]
+    assert [song["name"] for song in catalog.search_tracks("")] == ["Mustapha", "Waterloo"]
+
+
+def test_bulk_jsonl_across_batches(catalog):
+    lines = [json.dumps({"artist": "Queen", "title": f"Song {number}", "album": "Hits"}) for number in range(5)]
+    lines[1] = "{не json"
+    lines[3] = json.dumps(["не", "объект"])
+    stream = io.StringIO("\n".join(lines) + "\n\n")
+
+    report = import_songs_file(stream, "jsonl", batch_size=2)
+
+    assert report["imported"] == 3
+    assert report["failed"] == 2
+    assert [error["line"] for error in report["errors"]] == [2, 4]
+    album = catalog.get_album_details("Hits")
+    assert [song["title"] for song in album["songs"]] == ["Song 0", "Song 2", "Song 4"]
+
+
+def test_failed_batch_is_rolled_back_and_names_reloaded(catalog, test_database):
+    connection = sqlite3.connect(test_database)
+    # Запись песни падает уже после того, как пачка добавила исполнителя
+    connection.execute('''
+        CREATE TRIGGER reject_song BEFORE INSERT ON songs WHEN new.title = 'Mustapha'
+        BEGIN SELECT RAISE(ABORT, 'песня отклонена'); END
+    ''')
+    try:
+        rows = [
+            (1, {"artist": "Queen", "title": "Mustapha"}, None),
+            (2, {"artist": "Queen", "title": "Bicycle Race"}, None),
+        ]
+        report = importer.import_songs(iter(rows), batch_size=1)
+    finally:
+        connection.execute("DROP TRIGGER reject_song")
+        connection.close()
+
+    assert report["imported"] == 1
+    assert report["errors"] == [{"line": 1, "error": "Ошибка записи в БД: песня отклонена"}]
+    # Исполнитель из откаченной пачки не остался в словаре имён с несуществующим id
+    assert [(song["name"], song["artist_name"]) for song in catalog.search_tracks("")] == [("Bicycle Race", "Queen")]
@@ -0,0 +1,30 @@
+import time
+
+import cache
+from cache import InvalidationBus
+
+
+def test_polling_is_enabled_by_default():
+    assert InvalidationBus()._poll_interval > 0
+
+
+def test_poll_drops_local_cache_when_another_worker_changes_catalog(monkeypatch):
+    store = cache.configure_cache()
+    store.local.set("cached", b"1")
+    changed = []
+    monkeypatch.setattr(cache, "_remote_change_listeners", [lambda: changed.append(True)])
+    version = [1]
+    bus = InvalidationBus()
+    bus.start(lambda: version[0], poll_interval=0.01)
+    try:
+        time.sleep(0.05)
+        assert store.local.get("cached") == b"1"
+        version[0] = 2
+        deadline = time.monotonic() + 5
+        while not changed and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        bus.stop()
+
+    assert changed
+    assert store.local.get("cached") is None
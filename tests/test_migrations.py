@@ -0,0 +1,75 @@
+import sqlite3
+
+import database
+
+
+def _connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode = WAL")
+    return connection
+
+
+def test_versions_are_sequential():
+    versions = [version for version, _, _ in database.MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_fresh_database_gets_every_migration_once(tmp_path):
+    connection = _connect(str(tmp_path / "fresh.db"))
+    try:
+        assert database.migrate(connection) == [version for version, _, _ in database.MIGRATIONS]
+        assert database.migrate(connection) == []
+        assert database.get_schema_version(connection.cursor()) == database.MIGRATIONS[-1][0]
+        # Внешние ключи после миграций возвращаются в прежнее состояние
+        assert connection.execute("PRAGMA foreign_keys").fetchone()[0] == 0
+    finally:
+        connection.close()
+
+
+def test_upgrade_keeps_existing_catalog(tmp_path, monkeypatch):
+    path = str(tmp_path / "old.db")
+    connection = _connect(path)
+    try:
+        monkeypatch.setattr(database, "MIGRATIONS", database.MIGRATIONS[:3])
+        assert database.migrate(connection) == [1, 2, 3]
+        connection.execute("INSERT INTO artists (name) VALUES ('Queen')")
+        connection.execute("INSERT INTO albums (name, artist_id) VALUES ('Jazz', 1)")
+        connection.execute(
+            "INSERT INTO songs (title, artist_id, genre_id, album_id, year) VALUES ('Mustapha', 1, NULL, 1, 1978)"
+        )
+        connection.commit()
+
+        monkeypatch.undo()
+        assert database.migrate(connection) == [version for version, _, _ in database.MIGRATIONS[3:]]
+        assert connection.execute("SELECT title, album_id FROM songs").fetchall() == [("Mustapha", 1)]
+        assert connection.execute("SELECT count(*) FROM songs_fts WHERE songs_fts MATCH 'mustapha'").fetchone()[0] == 1
+
+        # Каскадное удаление (миграция 7) и журнал изменений (миграция 9) работают на старых данных
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute("DELETE FROM artists WHERE name = 'Queen'")
+        connection.commit()
+        assert connection.execute("SELECT count(*) FROM songs").fetchone()[0] == 0
+        assert ("songs", 1, "delete") in connection.execute("SELECT entity, entity_id, op FROM changes").fetchall()
+    finally:
+        connection.close()
+
+
+def test_failed_migration_is_rolled_back(tmp_path, monkeypatch):
+    def broken(cursor):
+        cursor.execute("CREATE TABLE half_done (id INTEGER)")
+        cursor.execute("SELECT * FROM missing_table")
+
+    connection = _connect(str(tmp_path / "broken.db"))
+    try:
+        monkeypatch.setattr(database, "MIGRATIONS", database.MIGRATIONS[:1] + [(2, "Сломанная миграция", broken)])
+        try:
+            database.migrate(connection)
+        except sqlite3.Error:
+            pass
+        else:
+            raise AssertionError("миграция должна была упасть")
+        assert database.get_schema_version(connection.cursor()) == 1
+        tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        assert "half_done" not in tables
+    finally:
+        connection.close()
@@ -0,0 +1,60 @@
+import pytest
+
+from pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, build_page, clamp_limit, decode_cursor, encode_cursor,
+)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(mode="fts", id=42, rank=-1.5)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "mode", "id") == {"mode": "fts", "id": 42, "rank": -1.5}
+
+
+@pytest.mark.parametrize("cursor", ["", "не base64", encode_cursor(mode="all"), "WzEsMl0"])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, "mode", "id")
+
+
+def test_clamp_limit():
+    assert clamp_limit(None) == DEFAULT_PAGE_SIZE
+    assert clamp_limit(0) == 1
+    assert clamp_limit(MAX_PAGE_SIZE + 1) == MAX_PAGE_SIZE
+
+
+def test_build_page_cuts_extra_row():
+    rows, cursor = build_page([1, 2, 3], 2, lambda row: f"after-{row}")
+    assert (rows, cursor) == ([1, 2], "after-2")
+    assert build_page([1, 2], 2, lambda row: f"after-{row}") == ([1, 2], None)
+
+
+def _walk(catalog, query, limit):
+    ids, cursor = [], None
+    while True:
+        page = catalog.search_tracks_page(query, limit=limit, cursor=cursor)
+        ids += [song["id"] for song in page["results"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_search_pages_cover_every_song_once(catalog):
+    for number in range(7):
+        catalog.add_song("Queen", f"Song {number}", "Rock", "Greatest Hits", 1981)
+    catalog.add_song("ABBA", "Waterloo", "Pop", None, 1974)
+
+    everything = _walk(catalog, "", 3)
+    assert len(everything) == len(set(everything)) == 8
+
+    found = _walk(catalog, "song", 3)
+    assert len(found) == len(set(found)) == 7
+
+
+def test_cursor_from_other_query_mode_is_rejected(catalog):
+    catalog.add_song("Queen", "Song 1", "Rock", None, 1981)
+    catalog.add_song("Queen", "Song 2", "Rock", None, 1981)
+    cursor = catalog.search_tracks_page("", limit=1)["next_cursor"]
+
+    with pytest.raises(InvalidCursorError):
+        catalog.search_tracks_page("song", limit=1, cursor=cursor)
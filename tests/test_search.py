@@ -0,0 +1,63 @@
+def _titles(results):
+    return [song["name"] for song in results]
+
+
+def test_title_match_ranks_above_other_columns(catalog):
+    catalog.add_song("Love Affair", "Other Song", "Pop", None, 1990)
+    catalog.add_song("Queen", "Love of My Life", "Rock", None, 1975)
+
+    assert _titles(catalog.search_tracks("love")) == ["Love of My Life", "Other Song"]
+
+
+def test_words_are_matched_by_prefix_and_all_of_them_required(catalog):
+    catalog.add_song("Queen", "Bohemian Rhapsody", "Rock", "A Night at the Opera", 1975)
+    catalog.add_song("Queen", "Bicycle Race", "Rock", "Jazz", 1978)
+
+    assert _titles(catalog.search_tracks("boh")) == ["Bohemian Rhapsody"]
+    assert _titles(catalog.search_tracks("queen jaz")) == ["Bicycle Race"]
+
+
+def test_cyrillic_is_case_folded_and_yo_matches_ye(catalog):
+    catalog.add_song("Кино", "Звезда по имени Солнце", "Рок", None, 1989)
+    catalog.add_song("Сплин", "Всё будет хорошо", "Рок", None, 2001)
+
+    assert _titles(catalog.search_tracks("ЗВЕЗДА")) == ["Звезда по имени Солнце"]
+    assert _titles(catalog.search_tracks("кино")) == ["Звезда по имени Солнце"]
+    assert _titles(catalog.search_tracks("все")) == ["Всё будет хорошо"]
+    assert _titles(catalog.search_tracks("ВСЁ")) == ["Всё будет хорошо"]
+
+
+def test_relaxed_mode_forgives_last_letter(catalog):
+    catalog.add_song("Кино", "Группа крови", "Рок", None, 1988)
+
+    # Точного совпадения нет: «крова» ищется как «кров*»
+    assert _titles(catalog.search_tracks("крова")) == ["Группа крови"]
+    # Мягкий режим объединяет слова через OR
+    assert _titles(catalog.search_tracks("группа несуществующее")) == ["Группа крови"]
+
+
+def test_query_without_words_finds_nothing(catalog):
+    catalog.add_song("Queen", "Bohemian Rhapsody", "Rock", None, 1975)
+
+    assert catalog.search_tracks("!!! ...") == []
+    assert catalog.search_tracks_page("!!!")["results"] == []
+
+
+def test_keyset_pages_follow_rank_order(catalog):
+    for number in range(5):
+        catalog.add_song("Queen", f"Love {number}", "Rock", None, 1980)
+    for number in range(5):
+        catalog.add_song("Love Affair", f"Song {number}", "Pop", None, 1990)
+    ranked = [song["id"] for song in catalog.search_tracks("love")]
+
+    pages, cursor = [], None
+    while True:
+        page = catalog.search_tracks_page("love", limit=3, cursor=cursor, with_total=True)
+        assert page["total"] == 10
+        pages.append([song["id"] for song in page["results"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    assert [song_id for page in pages for song_id in page] == ranked
@@ -0,0 +1,64 @@
+import os
+import time
+
+import pytest
+
+import database
+import storage
+
+
+@pytest.fixture
+def replica(catalog, tmp_path, monkeypatch):
+    # Каждое обновление пишет новую версию файла, а не переиспользует недавнюю
+    monkeypatch.setattr(storage, "READ_REPLICA_REFRESH", 0)
+    monkeypatch.setattr(storage, "replica_file", {})
+    yield str(tmp_path / "replica.db")
+    database.switch_read_database(None)
+
+
+def _refresh(path):
+    time.sleep(0.005)  # номер версии — время в миллисекундах
+    storage.refresh_replica(path)
+    return storage.replica_file["path"]
+
+
+def _titles(connection):
+    return [row[0] for row in connection.execute("SELECT title FROM songs ORDER BY id")]
+
+
+def test_refresh_keeps_open_version_readable_until_it_is_old(replica, catalog):
+    catalog.add_song("Queen", "Mustapha", "Rock", "Jazz", 1978)
+    first = _refresh(replica)
+    reader = database.get_read_connection()
+    try:
+        assert _titles(reader) == ["Mustapha"]
+
+        catalog.add_song("ABBA", "Waterloo", "Pop", None, 1974)
+        second = _refresh(replica)
+        assert second != first
+
+        # Открытое соединение продолжает читать свою версию, файл остаётся на месте
+        assert os.path.exists(first)
+        assert _titles(reader) == ["Mustapha"]
+        fresh = database.get_read_connection()
+        try:
+            assert _titles(fresh) == ["Mustapha", "Waterloo"]
+        finally:
+            fresh.close()
+
+        third = _refresh(replica)
+    finally:
+        reader.close()
+
+    # Хранятся только последние REPLICA_KEEP версий
+    assert not os.path.exists(first)
+    assert [path for _, path in storage._replica_versions(replica)] == [second, third]
+    assert not [name for name in os.listdir(os.path.dirname(replica)) if name.endswith(".tmp")]
+
+
+def test_recent_version_is_reused(replica, monkeypatch):
+    first = _refresh(replica)
+    monkeypatch.setattr(storage, "READ_REPLICA_REFRESH", 60)
+
+    assert _refresh(replica) == first
+    assert len(storage._replica_versions(replica)) == 1
@@ -0,0 +1,96 @@
+import sqlite3
+import time
+
+import pytest
+
+import suggest
+from suggest import IndexNotReadyError, SuggestionIndex, normalize, suggestion_index
+
+
+@pytest.fixture
+def index(catalog):
+    suggestion_index.rebuild()
+    return suggestion_index
+
+
+def _wait_synced(index, catalog):
+    deadline = time.monotonic() + 5
+    while index.stats()["seq"] != catalog.get_last_change_seq() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert index.stats()["seq"] == catalog.get_last_change_seq()
+
+
+def _names(result, kind):
+    return [item["name"] for item in result[kind]]
+
+
+def test_normalize():
+    assert normalize("  Всё  Ещё\tЁЖ ") == "все еще еж"
+
+
+def test_index_is_not_ready_before_first_build():
+    with pytest.raises(IndexNotReadyError):
+        SuggestionIndex().suggest("a")
+
+
+def test_prefix_of_name_or_later_word(index, catalog):
+    catalog.add_song("The Beatles", "Let It Be", "Rock", "Let It Be", 1970)
+
+    assert _names(index.suggest("beat"), "artists") == ["The Beatles"]
+    assert _names(index.suggest("let"), "songs") == ["Let It Be"]
+    assert [(album["name"], album["artist"]) for album in index.suggest("let")["albums"]] == [("Let It Be", "The Beatles")]
+    assert index.suggest("") == {"artists": [], "albums": [], "songs": []}
+
+
+def test_local_writes_apply_at_once_and_advance_seq(index, catalog, monkeypatch):
+    # Без продвижения номера журнала следующая синхронизация перестроила бы индекс
+    monkeypatch.setattr(suggest, "SUGGEST_SYNC_MAX_CHANGES", 3)
+    rebuilt = []
+    monkeypatch.setattr(index, "rebuild_soon", lambda delay=0: rebuilt.append(delay))
+    for number in range(5):
+        catalog.add_song("Queen", f"Song {number}", "Rock", None, 1980)
+        assert _names(index.suggest(f"song {number}"), "songs") == [f"Song {number}"]
+    _wait_synced(index, catalog)
+
+    catalog.delete_song("Song 0")
+    assert index.suggest("song 0")["songs"] == []
+    _wait_synced(index, catalog)
+    assert index.sync() is True
+    assert rebuilt == []
+
+
+def test_sync_applies_changes_of_other_workers(index, catalog, test_database):
+    catalog.add_song("Queen", "Mustapha", "Rock", None, 1978)
+    _wait_synced(index, catalog)
+
+    # Другой процесс пишет в базу мимо индекса этого процесса
+    connection = sqlite3.connect(test_database)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute("INSERT INTO artists (name) VALUES ('ABBA')")
+    connection.execute("UPDATE songs SET title = 'Mustapha (remastered)' WHERE title = 'Mustapha'")
+    connection.commit()
+    connection.close()
+
+    assert index.sync() is True
+    assert _names(index.suggest("abba"), "artists") == ["ABBA"]
+    assert _names(index.suggest("must"), "songs") == ["Mustapha (remastered)"]
+    assert index.stats()["seq"] == catalog.get_last_change_seq()
+
+
+def test_clear_requires_full_rebuild(index, catalog, test_database):
+    catalog.add_song("Queen", "Mustapha", "Rock", None, 1978)
+    _wait_synced(index, catalog)
+    index._names["songs"].add(999, "Stale", "Queen")
+    seq = index.stats()["seq"]
+
+    # Очистка другим воркером: журнал не перечисляет удалённые строки
+    connection = sqlite3.connect(test_database)
+    connection.execute("INSERT INTO changes (entity, entity_id, op) VALUES ('songs', 0, 'clear')")
+    connection.commit()
+    connection.close()
+
+    assert index.sync() is False
+    assert index.stats()["seq"] == seq
+    index.rebuild()
+    assert index.suggest("stale")["songs"] == []
+    assert _names(index.suggest("must"), "songs") == ["Mustapha"]
@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+
+import pytest
+
+from writer import WriteCoordinator
+
+
+class RecordingCoordinator(WriteCoordinator):
+    """Поток записи, запоминающий размер каждой зафиксированной пачки."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    def _execute(self, connection, batch):
+        self.batches.append(len(batch))
+        super()._execute(connection, batch)
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    path = str(tmp_path / "writer.db")
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("CREATE TABLE items (name TEXT NOT NULL UNIQUE)")
+    connection.close()
+    coordinator = RecordingCoordinator(path, batch_size=8, max_delay=0.5)
+    yield coordinator
+    coordinator.shutdown()
+
+
+def _names(coordinator):
+    connection = sqlite3.connect(coordinator.database)
+    try:
+        return [row[0] for row in connection.execute("SELECT name FROM items ORDER BY rowid")]
+    finally:
+        connection.close()
+
+
+def insert(tx, name):
+    tx.cursor.execute("INSERT INTO items (name) VALUES (?)", (name,))
+    return name
+
+
+def test_operations_are_committed_in_one_batch(coordinator):
+    futures = [coordinator.submit(insert, (f"item {number}",)) for number in range(5)]
+
+    assert [future.result(timeout=5) for future in futures] == [f"item {number}" for number in range(5)]
+    assert coordinator.batches == [5]
+    assert _names(coordinator) == [f"item {number}" for number in range(5)]
+
+
+def test_batch_size_limits_transaction(coordinator):
+    futures = [coordinator.submit(insert, (f"item {number}",)) for number in range(10)]
+    for future in futures:
+        future.result(timeout=5)
+
+    assert coordinator.batches == [8, 2]
+
+
+def test_failed_operation_is_rolled_back_alone(coordinator):
+    committed = []
+
+    def failing(tx, name):
+        insert(tx, name)
+        tx.after_commit(committed.append, name)
+        raise ValueError("ошибка в операции")
+
+    def duplicate(tx, name):
+        insert(tx, name + " (частично)")
+        tx.after_commit(committed.append, name)
+        insert(tx, name)
+
+    def succeeding(tx, name):
+        insert(tx, name)
+        tx.after_commit(committed.append, name)
+        return True
+
+    futures = [
+        coordinator.submit(succeeding, ("first",)),
+        coordinator.submit(failing, ("broken",)),
+        coordinator.submit(duplicate, ("first",), default="default"),
+        coordinator.submit(succeeding, ("last",)),
+    ]
+
+    assert futures[0].result(timeout=5) is True
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    # Ошибка SQLite не пробрасывается: результатом становится default
+    assert futures[2].result(timeout=5) == "default"
+    assert futures[3].result(timeout=5) is True
+    assert coordinator.batches == [4]
+    assert _names(coordinator) == ["first", "last"]
+    assert committed == ["first", "last"]
+
+
+def test_results_are_delivered_after_commit(coordinator):
+    seen = []
+    done = threading.Event()
+
+    def check(tx):
+        tx.after_commit(lambda: (seen.append(_names(coordinator)), done.set()))
+        return insert(tx, "visible")
+
+    coordinator.submit(check).result(timeout=5)
+    assert done.wait(5)
+    assert seen == [["visible"]]
@@ -0,0 +1,275 @@
+import asyncio
+import functools
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+from database import DATABASE_FILE, TracingCursor, open_connection
+from db_executor import ExecutorBusyError
+
+# Сколько операций записи объединять в одну транзакцию и сколько ждать
+# следующих операций после первой (мс), прежде чем фиксировать пачку
+WRITE_BATCH_SIZE = int(os.environ.get("MUSIC_CATALOG_WRITE_BATCH_SIZE", "256"))
+WRITE_BATCH_DELAY_MS = float(os.environ.get("MUSIC_CATALOG_WRITE_BATCH_DELAY_MS", "2"))
+WRITE_MAX_QUEUE = int(os.environ.get("MUSIC_CATALOG_WRITE_MAX_QUEUE", "10000"))
+# Надёжность фиксации (PRAGMA synchronous соединения записи):
+# FULL — fsync на каждую пачку, NORMAL — WAL переживает падение процесса,
+# но не отключение питания, OFF — без fsync
+WRITE_DURABILITY = os.environ.get("MUSIC_CATALOG_WRITE_DURABILITY", "NORMAL").upper()
+
+write_batch_size = metrics.register(metrics.Histogram(
+    "write_batch_size", "Операций записи в одной транзакции", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+))
+write_commit_duration = metrics.register(metrics.Histogram(
+    "write_commit_seconds", "Время выполнения и фиксации пачки операций записи"
+))
+
+
+class WriteTransaction:
+    """
+    Контекст одной операции записи внутри общей транзакции пачки.
+    after_commit() откладывает действия (инвалидация кэша и т. п.) до фиксации.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.callbacks = []
+
+    def after_commit(self, callback, *args, **kwargs):
+        self.callbacks.append(functools.partial(callback, *args, **kwargs))
+
+
+class _Operation:
+    __slots__ = ("func", "args", "kwargs", "error_message", "default", "exclusive", "future")
+
+    def __init__(self, func, args, kwargs, error_message, default, exclusive=False):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.error_message = error_message
+        self.default = default
+        self.exclusive = exclusive
+        self.future = Future()
+
+
+class WriteCoordinator:
+    """
+    Единственный поток записи в SQLite.
+    Операции из всех запросов ставятся в очередь, собираются в пачки
+    (до batch_size штук или max_delay секунд после первой) и фиксируются
+    одной транзакцией. Каждая операция выполняется в своей точке сохранения:
+    ошибка откатывает только её, остальные операции пачки фиксируются.
+    Исключительная операция (exclusive=True: очистка, восстановление) выполняется
+    отдельно от пачек и сама управляет транзакциями соединения записи.
+    """
+
+    def __init__(self, database=DATABASE_FILE, batch_size=WRITE_BATCH_SIZE,
+                 max_delay=WRITE_BATCH_DELAY_MS / 1000, durability=WRITE_DURABILITY,
+                 max_queue=WRITE_MAX_QUEUE):
+        self.database = database
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self.durability = durability
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+
+    def submit(self, func, args=(), kwargs=None, error_message="Ошибка записи", default=False, exclusive=False):
+        """Ставит операцию func(tx, *args, **kwargs) в очередь и возвращает Future с её результатом."""
+        operation = _Operation(func, args, kwargs or {}, error_message, default, exclusive)
+        with self._lock:
+            if self._thread is None:
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name="db-writer", daemon=True
+                )
+                self._thread.start()
+            try:
+                self._queue.put_nowait(operation)
+            except queue.Full:
+                raise ExecutorBusyError("Очередь записи в базу данных переполнена") from None
+        return operation.future
+
+    def _connect(self):
+        connection = open_connection(self.database, isolation_level=None)
+        durability = self.durability
+        if durability not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            print(f"Неизвестный режим надёжности записи '{durability}', используется NORMAL")
+            durability = "NORMAL"
+        connection.execute(f"PRAGMA synchronous = {durability}")
+        return connection
+
+    def _next_batch(self, operations, first):
+        """Пачка операций и исключительная операция, прервавшая её сбор (или None)."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                operation = operations.get(timeout=timeout) if timeout > 0 else operations.get_nowait()
+            except queue.Empty:
+                break
+            if operation is None:
+                # Сигнал остановки: допишем пачку и выйдем на следующей итерации
+                operations.put(None)
+                break
+            if operation.exclusive:
+                # Выполнится сразу после пачки: порядок операций сохраняется
+                return batch, operation
+            batch.append(operation)
+        return batch, None
+
+    def _run(self, operations):
+        connection = None
+        following = None
+        while True:
+            operation, following = following or operations.get(), None
+            if operation is None:
+                break
+            if operation.exclusive:
+                batch = [operation]
+            else:
+                batch, following = self._next_batch(operations, operation)
+            try:
+                if connection is None:
+                    connection = self._connect()
+                if operation.exclusive:
+                    self._execute_exclusive(connection, operation)
+                else:
+                    self._execute(connection, batch)
+            except sqlite3.Error as e:
+                print(f"Ошибка фиксации пачки записей: {e}")
+                for operation in batch:
+                    if not operation.future.done():
+                        operation.future.set_result(operation.default)
+                if connection is not None:
+                    connection.close()
+                    connection = None
+            except BaseException as e:
+                for operation in batch:
+                    if not operation.future.done():
+                        operation.future.set_exception(e)
+        if connection is not None:
+            connection.close()
+
+    def _execute(self, connection, batch):
+        started = time.perf_counter()
+        cursor = connection.cursor(TracingCursor)
+        cursor.execute("BEGIN IMMEDIATE")
+        results = []
+        try:
+            for operation in batch:
+                tx = WriteTransaction(cursor)
+                cursor.execute("SAVEPOINT write_operation")
+                error = None
+                try:
+                    result = operation.func(tx, *operation.args, **operation.kwargs)
+                    cursor.execute("RELEASE write_operation")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_operation")
+                    cursor.execute("RELEASE write_operation")
+                    if not isinstance(e, sqlite3.Error):
+                        error = e
+                    print(f"{operation.error_message}: {e}")
+                    result, tx.callbacks = operation.default, []
+                results.append((operation, result, error, tx.callbacks))
+            cursor.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.rollback()
+            raise
+        write_batch_size.observe(len(batch))
+        write_commit_duration.observe(time.perf_counter() - started)
+
+        for operation, result, error, callbacks in results:
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Ошибка после фиксации записи: {e}")
+            if error is not None:
+                operation.future.set_exception(error)
+            else:
+                operation.future.set_result(result)
+
+    def _execute_exclusive(self, connection, operation):
+        """Выполняет операцию вне пачки: func сама открывает и фиксирует транзакции."""
+        tx = WriteTransaction(connection.cursor(TracingCursor))
+        error = None
+        try:
+            result = operation.func(tx, *operation.args, **operation.kwargs)
+        except Exception as e:
+            if connection.in_transaction:
+                connection.rollback()
+            if not isinstance(e, sqlite3.Error):
+                error = e
+            print(f"{operation.error_message}: {e}")
+            result, tx.callbacks = operation.default, []
+        for callback in tx.callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Ошибка после фиксации записи: {e}")
+        if error is not None:
+            operation.future.set_exception(error)
+        else:
+            operation.future.set_result(result)
+
+    def shutdown(self):
+        """Дожидается записи всех поставленных операций; поток создаётся заново при следующем submit()."""
+        with self._lock:
+            thread, operations = self._thread, self._queue
+            self._thread = self._queue = None
+        if thread is not None:
+            operations.put(None)
+            thread.join()
+
+
+write_coordinator = WriteCoordinator()
+
+
+def write_operation(error_message, default=False, exclusive=False):
+    """
+    Превращает функцию func(tx, *args) в операцию записи через write_coordinator.
+    Вызов func(*args) блокируется до фиксации пачки и возвращает результат,
+    func.submit(*args) возвращает Future. При ошибке SQLite печатается
+    error_message, а результатом становится default. exclusive=True — операция
+    выполняется вне пачек и сама открывает транзакции на tx.cursor.
+    """
+    def decorator(func):
+        def submit(*args, **kwargs):
+            return write_coordinator.submit(func, args, kwargs, error_message, default, exclusive)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return submit(*args, **kwargs).result()
+
+        wrapper.submit = submit
+        return wrapper
+    return decorator
+
+
+def bind_operation(operation, *bound):
+    """
+    Операция записи с заранее подставленными первыми аргументами (например, условием WHERE).
+    Как и сама операция, вызывается блокирующе или через .submit() / run_write().
+    """
+    def submit(*args, **kwargs):
+        return operation.submit(*bound, *args, **kwargs)
+
+    @functools.wraps(operation)
+    def wrapper(*args, **kwargs):
+        return submit(*args, **kwargs).result()
+
+    wrapper.submit = submit
+    return wrapper
+
+
+async def run_write(operation, *args, **kwargs):
+    """Ставит операцию записи в очередь и ожидает её фиксации, не занимая поток."""
+    return await asyncio.wrap_future(operation.submit(*args, **kwargs))